@@ -1,313 +1,495 @@
-import requests
-from skimage.metrics import structural_similarity as compare_ssim
+import hashlib
+import multiprocessing
 import os
-import subprocess
-import img2pdf
-import re
-import cv2
-import random
-from datetime import timedelta
-import shutil
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, Response, request, jsonify, send_file
 from flask_socketio import SocketIO, emit
-from youtube_transcript_api import YouTubeTranscriptApi
-import json
 from dotenv import load_dotenv
 from flask_cors import CORS
+from scheduler import JobScheduler, QueueFull
+from metrics import JobTrace, MetricsRegistry
+from job_store import JobStore, new_owner
+from outbox import Outbox
+from engine import Engine, ProcessingError, MAX_SHARDS, OUTPUT_FORMATS, SAMPLING_MODES, generate_random_string
+from roi import parse_roi
+from artifacts import load_manifest, manifest_files, thumbnail_name
+from werkzeug.security import safe_join
 
 load_dotenv()
 
-app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*")
+# URLs handed out to clients start with /static whatever the folder is called
+app = Flask(__name__, static_folder=os.getenv("STATIC_FOLDER", "static"), static_url_path="/static")
+# with several server processes, events for a client connected to another
+# process are relayed through this queue (e.g. redis://redis:6379/0)
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE") or None
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=SOCKETIO_MESSAGE_QUEUE)
 COMPLETION_CONFIRMATION_ENDPOINT = os.getenv("COMPLETION_CONFIRMATION_ENDPOINT", "http://127.0.0.1:3000/api/completion")
 X_COMPLETION_HEADER = os.getenv("X_COMPLETION_HEADER", "default_completion_header")
 X_COMPILE_REQUEST_HEADER = os.getenv("X_COMPILE_REQUEST_HEADER", "default_compile_request_header")
-
-CORS(app, resources={r"*": {"origins": [os.getenv("CORS_ALLOW_ORIGIN", "http://127.0.0.1:3000")]}})
-
-def generate_random_string(length=8):
-    """
-    Generate a random string of fixed length.
-    
-    Args:
-        length (int): Length of the random string
-    
-    Returns:
-        str: Random string
-    """
-    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
-    return ''.join(random.choice(letters) for i in range(length))
-
-def extract_youtube_id(url):
-    """
-    Extract the YouTube video ID from a URL.
-    """
-    patterns = [
-        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
-        r'(?:embed\/|v\/|shorts\/)([0-9A-Za-z_-]{11})',
-        r'(?:youtu\.be\/)([0-9A-Za-z_-]{11})'
-    ]
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
-    return None
-
-def get_subtitles(video_id):
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 2))
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", 16))
+DISK_BUDGET_GB = float(os.getenv("DISK_BUDGET_GB", 20))
+CHECKPOINT_SECONDS = float(os.getenv("CHECKPOINT_SECONDS", 10))
+MAX_RESUME_ATTEMPTS = int(os.getenv("MAX_RESUME_ATTEMPTS", 3))
+COMPLETION_MAX_ATTEMPTS = int(os.getenv("COMPLETION_MAX_ATTEMPTS", 8))
+COMPLETION_BATCH_SIZE = int(os.getenv("COMPLETION_BATCH_SIZE", 1))
+RESUME_JOBS = os.getenv("RESUME_JOBS", "1") == "1"
+HEARTBEAT_SECONDS = float(os.getenv("HEARTBEAT_SECONDS", 10))
+PROGRESS_SAVE_SECONDS = float(os.getenv("PROGRESS_SAVE_SECONDS", 2))
+# width slides are detected at unless a request says otherwise; 0 for full size
+ANALYSIS_WIDTH = int(os.getenv("ANALYSIS_WIDTH", 640))
+# how long browsers may keep a job file fetched through a manifest URL; those
+# URLs carry the file's hash, so their contents never change
+ARTIFACT_MAX_AGE = int(os.getenv("ARTIFACT_MAX_AGE", 365 * 24 * 3600))
+# decode videos while they download; a download that stops growing for
+# DOWNLOAD_STALL_SECONDS fails the job
+STREAM_DOWNLOADS = os.getenv("STREAM_DOWNLOADS", "1") == "1"
+DOWNLOAD_STALL_SECONDS = float(os.getenv("DOWNLOAD_STALL_SECONDS", 120))
+
+scheduler = JobScheduler(workers=WORKER_COUNT, max_queue=MAX_QUEUED_JOBS, spawn=socketio.start_background_task)
+engine = Engine(app.static_folder, budget_bytes=int(DISK_BUDGET_GB * 1024 ** 3), checkpoint_seconds=CHECKPOINT_SECONDS,
+                stream_downloads=STREAM_DOWNLOADS, stall_seconds=DOWNLOAD_STALL_SECONDS)
+job_store = JobStore(os.getenv("JOB_STORE_PATH", os.path.join(app.static_folder, 'jobs.sqlite3')))
+# this process, as the owner of the jobs it runs
+owner = new_owner()
+# this request should have a custom header for authentication, which is stored in the environment variable X-COMPLETION-HEADER
+outbox = Outbox(
+    os.getenv("OUTBOX_PATH", os.path.join(app.static_folder, 'outbox.sqlite3')),
+    COMPLETION_CONFIRMATION_ENDPOINT,
+    headers={'X-Completion-Header': X_COMPLETION_HEADER},
+    max_attempts=COMPLETION_MAX_ATTEMPTS,
+    batch_size=COMPLETION_BATCH_SIZE,
+    spawn=socketio.start_background_task
+)
+result_cache = engine.result_cache
+
+metrics = MetricsRegistry()
+metrics.describe('stage_seconds', 'Time a job spent in each pipeline stage')
+metrics.describe('job_seconds', 'Wall time of a job from start to completion callback')
+metrics.describe('jobs_total', 'Finished jobs by outcome')
+metrics.describe('frames_sampled_total', 'Frames decoded and compared')
+metrics.describe('slides_found_total', 'Unique slides written')
+metrics.describe('slides_revisited_total', 'Slides shown again later and folded into the earlier page')
+metrics.describe('queue_depth', 'Jobs waiting for a worker')
+metrics.describe('active_workers', 'Workers currently running a job')
+metrics.gauge('queue_depth', scheduler.queue_depth)
+metrics.gauge('active_workers', scheduler.active_workers)
+metrics.gauge('worker_count', lambda: scheduler.workers)
+metrics.gauge('cache_hits_total', lambda: combined_stats('cache', result_cache.stats)['hits'], kind='counter')
+metrics.gauge('cache_misses_total', lambda: combined_stats('cache', result_cache.stats)['misses'], kind='counter')
+metrics.describe('outbox_pending', 'Completion callbacks waiting to be delivered')
+metrics.describe('outbox_dead', 'Completion callbacks that gave up and were kept as dead letters')
+metrics.gauge('outbox_pending', lambda: outbox.counts()['pending'])
+metrics.gauge('outbox_dead', lambda: outbox.counts()['dead'])
+metrics.gauge('outbox_sent_total', lambda: combined_stats('outbox', outbox.stats)['sent'], kind='counter')
+
+def publish_stats():
     """
-    Extract subtitles from a YouTube video link using yt-dlp.
-    Returns the path to the subtitle file (.srt) if successful, else None.
+    Save this process's running totals in the job store, where the other
+    server processes add them to their own for /metrics, /cache and
+    /outbox.
     """
+    job_store.save_stats(owner, {'metrics': metrics.to_state(), 'cache': dict(result_cache.stats),
+                                 'outbox': dict(outbox.stats)})
 
-    ytt_api = YouTubeTranscriptApi()
-    fetched_transcript = ytt_api.fetch(video_id)
-
-    return fetched_transcript
-
-def images_to_pdf(input_folder, output_pdf):
+def combined_stats(name, local):
     """
-    Convert all images in a folder to a single PDF file using img2pdf.
+    The `local` totals of this process plus the `name` totals every other
+    server process saved last.
     """
-    image_files = []
-    for f in os.listdir(input_folder):
-        if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')):
-            image_files.append(os.path.join(input_folder, f))
-    
-    image_files.sort(key=lambda x: [int(c) if c.isdigit() else c for c in re.split('([0-9]+)', x)])
-    
-    if not image_files:
-        print("No images found in the directory")
-        return
-    
-    with open(output_pdf, "wb") as f:
-        f.write(img2pdf.convert(image_files))
-    
-    print(f"Successfully created {output_pdf} with {len(image_files)} images")
+    totals = dict(local)
+    for stats in job_store.other_stats(owner, name):
+        for key, value in stats.items():
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+def record_job(trace, status):
+    metrics.record_job(trace, status)
+    try:
+        publish_stats()
+    except Exception as e:
+        # saved again on the next heartbeat
+        print(f"Saving stats failed: {e}")
 
-def compare_frames(frame1, frame2):
-    """
-    Compare two frames and return their similarity score (0-1).
-    """
-    if frame1.shape != frame2.shape:
-        return 0.0
-    
-    gray1 = cv2.cvtColor(frame1, cv2.COLOR_BGR2GRAY)
-    gray2 = cv2.cvtColor(frame2, cv2.COLOR_BGR2GRAY)
-    
-    (score, _) = compare_ssim(gray1, gray2, full=True)
-    return score
+# PDF viewers read Content-Range and Accept-Ranges to load a document piece by piece
+CORS(app, resources={r"*": {"origins": [os.getenv("CORS_ALLOW_ORIGIN", "http://127.0.0.1:3000")],
+                            "expose_headers": ["ETag", "Content-Range", "Accept-Ranges", "Content-Length"]}})
 
-def extract_frames_task(video_path, socket_id=None, interval_seconds=10, similarity_threshold=0.95, server_video_id=None):
+def extract_frames_task(video_path, socket_id=None, interval_seconds=10, similarity_threshold=0.95, server_video_id=None,
+                        shards=1, job_id=None, progress_callback=None, sampling='fps', language='en', progressive=False,
+                        output_format='png', quality=90, max_dimension=None, collapse_revisits=True, roi='auto',
+                        analysis_width=None):
     """
     Background task to extract frames and generate PDF.
-    """
-    video_id = extract_youtube_id(video_path)
 
-    video_identification_on_disk = server_video_id if server_video_id else generate_random_string()
+    Returns the result metadata (slide timestamps, subtitle groups, stats).
+    """
+    video_identification_on_disk = server_video_id if server_video_id else (job_id or generate_random_string())
     output_dir = os.path.join(app.static_folder, video_identification_on_disk)
-    os.makedirs(output_dir, exist_ok=True)
-    
-    video_dir = os.path.join(app.static_folder, 'videos')
-    video_full_path = os.path.join(video_dir, f'{video_id}.mp4')
-    
-    # Download video if it doesn't exist
-    if not os.path.exists(video_full_path):
-        print(f"Downloading video {video_id}...")
-        cmd = [
-            'yt-dlp', '-f', 'bestvideo[ext=mp4]',
-            '--merge-output-format', 'mp4',
-            '--output', video_full_path,
-            video_path
-        ]
-        subprocess.run(cmd, stderr=subprocess.DEVNULL)
-    
-    if not os.path.exists(video_full_path):
-        print("Failed to download video.")
-        if socket_id:
-            socketio.emit('processing_error', {'message': 'Failed to download video'}, room=socket_id)
-        return
-
-    # Temporary directory for extracted frames
-    temp_dir = os.path.join(output_dir, "temp_frames")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # Get video duration
-    try:
-        cmd = [
-            'ffprobe', '-v', 'error', '-show_entries', 
-            'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', 
-            video_full_path
-        ]
-        duration = float(subprocess.check_output(cmd).decode('utf-8').strip())
-    except Exception as e:
-        print(f"Error getting duration: {e}")
-        duration = 0
-    
-    print(f"Video duration: {timedelta(seconds=duration)}")
-    
-    # Extract frames at intervals using FFmpeg
-    frame_pattern = os.path.join(temp_dir, "frame_%04d.png")
-    cmd = [
-        'ffmpeg', '-y', '-i', video_full_path, '-vf', 
-        f'fps=1/{interval_seconds}', '-vsync', 'vfr', 
-        frame_pattern
-    ]
-    subprocess.run(cmd, stderr=subprocess.DEVNULL)
-    
-    frame_files = sorted([f for f in os.listdir(temp_dir) if f.startswith('frame_')])
-    
-    unique_frame_count = 0
-    unique_frame_timestamps = []
-    paths_collection = []
-
-    # We'll track the previous frame in the sequence and write the previous
-    # frame when we detect a change – that ensures we save the final frame of
-    # a repeated slide (end of the run) rather than the first frame.
-    prev_frame = None
-    prev_timestamp = None
-
-    for i, frame_file in enumerate(frame_files, 1):
-        frame_path = os.path.join(temp_dir, frame_file)
-        current_frame = cv2.imread(frame_path, cv2.IMREAD_COLOR)
-
-        if current_frame is None:
-            continue
-
-        # this is technically not true, but this allows us to process the subtitles easily
-        timestamp = (i - 1) * interval_seconds
-
-        if prev_frame is None:
-            # first frame of the video (start a run)
-            prev_frame = current_frame.copy()
-            prev_timestamp = timestamp
-            continue
-
-        # compare current frame with the previous frame to detect a boundary
-        similarity = compare_frames(current_frame, prev_frame)
-        if similarity < similarity_threshold:
-            # boundary detected: save the previous frame (end of the previous run)
-            unique_frame_count += 1
-            output_path = os.path.join(output_dir, f"frame_{unique_frame_count}.png")
-            cv2.imwrite(output_path, prev_frame)
-            unique_frame_timestamps.append(prev_timestamp)
-            paths_collection.append(output_path)
-
-        # advance previous to current for next iteration
-        prev_frame = current_frame.copy()
-        prev_timestamp = timestamp
-
-    # After iterating, save the last run's final frame (if any)
-    if prev_frame is not None:
-        unique_frame_count += 1
-        output_path = os.path.join(output_dir, f"frame_{unique_frame_count}.png")
-        cv2.imwrite(output_path, prev_frame)
-        unique_frame_timestamps.append(prev_timestamp)
-        paths_collection.append(output_path)
-
-    shutil.rmtree(temp_dir)
-    images_to_pdf(output_dir, os.path.join(output_dir, "output.pdf"))
-
-    # Group subtitles by unique frame timestamps
-    print(unique_frame_timestamps)
-    subtitle_groups = []
-
-    # insert (prepend) 0 at index 0
-    unique_frame_timestamps.insert(0, 0)
+    trace = JobTrace(video_identification_on_disk)
+    if job_id:
+        job_store.set_state(job_id, 'running')
+    last_saved = [0.0]
+
+    def report_progress(fraction):
+        if progress_callback:
+            progress_callback(fraction)
+        # shared with the other server processes, so /jobs works on any of them
+        if job_id and time.monotonic() - last_saved[0] >= PROGRESS_SAVE_SECONDS:
+            last_saved[0] = time.monotonic()
+            job_store.set_progress(job_id, fraction)
+
+    def on_slide(index, filename, timestamp, progress):
+        if progressive and socket_id:
+            socketio.emit('slide_detected', {
+                'video_id': video_identification_on_disk,
+                'frame_index': index,
+                'url': f'/static/{video_identification_on_disk}/{filename}',
+                'timestamp': timestamp,
+                'progress': round(progress * 100, 1) if progress is not None else None
+            }, room=socket_id)
+
+    def on_revisit(index, timestamp, progress):
+        if progressive and socket_id:
+            socketio.emit('slide_revisited', {
+                'video_id': video_identification_on_disk,
+                'frame_index': index,
+                'timestamp': timestamp,
+                'progress': round(progress * 100, 1) if progress is not None else None
+            }, room=socket_id)
 
     try:
-        subtitles = get_subtitles(video_id)
-        
-        for idx, ts in enumerate(unique_frame_timestamps[:-1]):
-            next_ts = unique_frame_timestamps[idx + 1] if idx + 1 < len(unique_frame_timestamps) else float('inf')
-            
-            group = {
-                "frame_index": idx + 1,
-                "timestamp": ts,
-                "subtitles": []
-            }
-
-            for sub in subtitles:
-                if ts <= sub.start < next_ts:
-                    group['subtitles'].append(sub.text)
-                elif sub.start > next_ts and idx == len(unique_frame_timestamps) - 2:
-                    group['subtitles'].append(sub.text)
-            
-            subtitle_groups.append(group)
-            
-        # Save to JSON file
-        json_path = os.path.join(output_dir, "subtitle_groups.json")
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(subtitle_groups, f, indent=4, ensure_ascii=False)
-            print(f"Successfully written to JSON file")
-            
+        result = engine.process(
+            video_path, output_dir,
+            interval_seconds=interval_seconds,
+            similarity_threshold=similarity_threshold,
+            shards=shards,
+            sampling=sampling,
+            language=language,
+            output_format=output_format,
+            quality=quality,
+            max_dimension=max_dimension,
+            progress_callback=report_progress,
+            on_slide=on_slide,
+            trace=trace,
+            checkpoint=job_store.checkpoint(job_id) if job_id else None,
+            collapse_revisits=collapse_revisits,
+            on_revisit=on_revisit,
+            roi=roi,
+            analysis_width=analysis_width
+        )
+    except ProcessingError as e:
+        print(f"{e} ({video_path})")
+        record_job(trace, 'failed')
+        if job_id:
+            job_store.set_state(job_id, 'failed', str(e))
+        if socket_id:
+            socketio.emit('processing_error', {'message': str(e)}, room=socket_id)
+        raise
     except Exception as e:
-        print(f"Error processing subtitles: {e}")
-
-    print(f"Finished processing {video_id}. Found {unique_frame_count} unique frames.")
+        # a bug rather than a bad video, but the client still has to hear about it
+        print(f"Unexpected error processing {video_path}: {e!r}")
+        record_job(trace, 'failed')
+        if job_id:
+            job_store.set_state(job_id, 'failed', str(e))
+        if socket_id:
+            socketio.emit('processing_error', {'message': 'Processing failed unexpectedly'}, room=socket_id)
+        raise
+
+    unique_frame_count = result['frames_count']
+    subtitle_groups = result['subtitle_groups']
+    appearances = result['appearances']
+    frame_ext = result.get('frame_ext', '.png')
+
+    print(f"Finished processing {video_path}. Found {unique_frame_count} unique frames, {result['revisits']} revisits.")
+    print(f"Detector stage hits: {result['detector_stats']}")
+    print(f"Sampling: {result['sampling']}")
+    print(f"Time to first slide: {result.get('first_slide_seconds')}s")
     
     if socket_id:
         socketio.emit('processing_complete', {
             'video_id': video_identification_on_disk,
             'pdf_path': f'/static/{video_identification_on_disk}/output.pdf',
             'video_path': f'/static/{video_identification_on_disk}/{video_identification_on_disk}.mp4',
-            'frames_count': unique_frame_count
+            'manifest_url': f'/jobs/{video_identification_on_disk}/manifest',
+            'frames_count': unique_frame_count,
+            'revisits': result['revisits'],
+            'region': result.get('region'),
+            'ignored': result.get('ignored'),
+            'analysis_size': result.get('analysis_size'),
+            'detector_stats': result['detector_stats'],
+            'sampling': result['sampling'],
+            'first_slide_seconds': result.get('first_slide_seconds'),
+            'write_seconds': result.get('write_seconds')
         }, room=socket_id)
 
-    ## also make
+    if server_video_id:
+        with trace.stage('completion_callback'):
+            send_completion_confirmation(server_video_id, video_identification_on_disk, unique_frame_count,
+                                         subtitle_groups, appearances, frame_ext)
+
+    trace.save(os.path.join(output_dir, "trace.json"))
+    record_job(trace, 'completed')
+    if job_id:
+        job_store.set_state(job_id, 'completed')
+    return result
+
+def send_completion_confirmation(server_video_id, video_identification_on_disk, unique_frame_count,
+                                 subtitle_groups, appearances, frame_ext):
+    """
+    Queue the finished slides for the completion endpoint. Delivery happens
+    on the outbox's sender, so this never waits on the network.
+    """
     # a POST request to the confirmation endpoint with a body containing a list of video_urls, which should have, video_id, url (this is the image url, image is saved inside /static/<yt_video_id>/frame_xxx.png), and captions from corresponding subtitle_groups
-    if not(server_video_id):
-        return
+    # elements will be in the format of {video_id, url, captions}
+    confirmation_data = []
+
+    for i in range(unique_frame_count):
+        frame_info = {
+            'video_id': server_video_id,
+            'url': f'/static/{video_identification_on_disk}/frame_{i+1}{frame_ext}',
+            'thumbnail_url': f'/static/{video_identification_on_disk}/{thumbnail_name(i + 1)}',
+            'captions': " ".join(subtitle_groups[i]['subtitles']) if i < len(subtitle_groups) else "",
+            'ts': appearances[i][0][0],
+            # every [start, end] the slide was on screen, revisits included
+            'appearances': appearances[i]
+        }
+        confirmation_data.append(frame_info)
 
+    outbox.enqueue(confirmation_data)
+
+def submit_job(job_id, priority, params):
+    """
+    Queue an extraction job on the shared worker pool, recording it in the
+    job store first so it can be resumed if the server goes down. `params`
+    are extract_frames_task's keyword arguments, video_path included.
+    """
+    job_store.add(job_id, params, priority, owner)
     try:
-        # elements will be in the format of {video_id, url, captions}
-        confirmation_data = []
-
-        for i in range(len(paths_collection)):
-            frame_info = {
-                'video_id': server_video_id,
-                'url': f'/static/{video_identification_on_disk}/frame_{i+1}.png',
-                'captions': " ".join(subtitle_groups[i]['subtitles']) if i < len(subtitle_groups) else "",
-                'ts': unique_frame_timestamps[i]
-            }
-            confirmation_data.append(frame_info)
-
-        # this request should have a custom header for authentication, which is stored in the environment variable X-COMPLETION-HEADER
-        headers = {
-            'Content-Type': 'application/json',
-            'X-Completion-Header': X_COMPLETION_HEADER
-        }
+        return enqueue_job(job_id, params, priority)
+    except QueueFull:
+        job_store.remove(job_id)
+        raise
+
+def enqueue_job(job_id, params, priority, ignore_limit=False):
+    params = dict(params)
+    video_path = params.pop('video_path')
+    return scheduler.submit(
+        job_id, extract_frames_task, video_path,
+        job_id=job_id,
+        **params,
+        priority=priority,
+        progress_kwarg='progress_callback',
+        ignore_limit=ignore_limit
+    )
+
+def resume_orphaned_jobs():
+    """
+    Queue again every job whose server process is gone: exited, or silent
+    for three heartbeats. After a restart that covers everything the old
+    process left queued or running. Jobs with a checkpoint continue from
+    it. Their sockets are gone, so resumed jobs report through the
+    completion callback and /jobs only.
+    """
+    for job_id, params, priority, attempts in job_store.claim_orphans(owner, stale_after=3 * HEARTBEAT_SECONDS):
+        if attempts > MAX_RESUME_ATTEMPTS:
+            print(f"Giving up on job {job_id} after {attempts - 1} resumes")
+            job_store.set_state(job_id, 'failed', 'Interrupted too many times')
+            continue
+        print(f"Resuming job {job_id}")
+        enqueue_job(job_id, {**params, 'socket_id': None}, priority, ignore_limit=True)
 
-        # Send request with a timeout and capture response for debugging
-        response = requests.post(COMPLETION_CONFIRMATION_ENDPOINT, json=confirmation_data, headers=headers, timeout=15)
+def heartbeat_loop():
+    """
+    Keep this process's jobs claimed, share its running totals, and pick
+    up the jobs of server processes that died, for as long as the server
+    runs.
+    """
+    while True:
+        try:
+            job_store.heartbeat(owner)
+            publish_stats()
+            if RESUME_JOBS:
+                resume_orphaned_jobs()
+        except Exception as e:
+            print(f"Heartbeat failed: {e}")
+        socketio.sleep(HEARTBEAT_SECONDS)
+
+def request_number(data, name, default, kind=int):
+    """
+    `data[name]` (or `default`) as an int or float, raising ValueError with
+    a message for the client when it isn't a number.
+    """
+    value = data.get(name, default)
+    if value is None or isinstance(value, bool):
+        raise ValueError(f'{name} must be a number')
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number') from None
 
-        if response.status_code == 200:
-            print("Successfully sent completion confirmation")
-        else:
-            print(f"Failed to send completion confirmation: {response.status_code} - {response.text}")
-    except requests.exceptions.Timeout:
-        print("Error sending completion confirmation: request timed out")
-    except Exception as e:
-        print(f"Error sending completion confirmation: {e}")
+def parse_job_request(data):
+    """
+    Read and validate a /compile or compute_task request: the video, how
+    slides are detected, and the options that shape the output files
+    (encoding, whether revisited slides are collapsed, which part of the
+    frame is compared and at what resolution).
+
+    Returns (extract_frames_task keyword arguments, priority, error
+    message).
+    """
+    if not isinstance(data, dict):
+        return None, None, 'the request must be a JSON object'
+    video_path = data.get('video_path')
+    if not video_path:
+        return None, None, 'video_path is required'
+    try:
+        interval = request_number(data, 'interval', 5)
+        threshold = request_number(data, 'threshold', 0.95, float)
+        shards = request_number(data, 'shards', 1)
+        priority = request_number(data, 'priority', 0)
+        quality = request_number(data, 'quality', 90)
+        max_dimension = request_number(data, 'max_dimension', None) if data.get('max_dimension') else None
+        analysis_width = request_number(data, 'analysis_width', ANALYSIS_WIDTH)
+        roi = parse_roi(data.get('roi'))
+    except ValueError as e:
+        return None, None, str(e)
+
+    if interval <= 0:
+        return None, None, 'interval must be greater than 0'
+    if not 0 < threshold <= 1:
+        return None, None, 'threshold must be greater than 0 and at most 1'
+    sampling = data.get('sampling', 'fps')
+    if sampling not in SAMPLING_MODES:
+        return None, None, f"sampling must be one of {', '.join(SAMPLING_MODES)}"
+    output_format = data.get('output_format', 'png')
+    if output_format not in OUTPUT_FORMATS:
+        return None, None, f"output_format must be one of {', '.join(OUTPUT_FORMATS)}"
+    if not 1 <= quality <= 100:
+        return None, None, 'quality must be between 1 and 100'
+    if max_dimension is not None and max_dimension < 1:
+        return None, None, 'max_dimension must be at least 1'
+    collapse_revisits = data.get('collapse_revisits', True)
+    if not isinstance(collapse_revisits, bool):
+        return None, None, 'collapse_revisits must be true or false'
+    if analysis_width and analysis_width < 64:
+        return None, None, 'analysis_width must be 0 (full size) or at least 64'
+
+    return {
+        'video_path': video_path,
+        'interval_seconds': interval,
+        'similarity_threshold': threshold,
+        # shards don't change the result, so asking for more than there are cores just gets fewer
+        'shards': max(1, min(shards, MAX_SHARDS)),
+        'sampling': sampling,
+        'language': data.get('language', 'en'),
+        'progressive': bool(data.get('progressive', False)),
+        'output_format': output_format,
+        'quality': quality,
+        'max_dimension': max_dimension,
+        'collapse_revisits': collapse_revisits,
+        'roi': roi,
+        'analysis_width': analysis_width or None
+    }, priority, None
 
 @app.route("/compile", methods=['POST'])
 def compile():
     if request.headers.get('X-Compile-Request-Header') != X_COMPILE_REQUEST_HEADER:
         return jsonify({'error': 'Unauthorized'}), 401
     
-    data = request.get_json()
-
-    video_path = data.get('video_path')
-    interval = int(data.get('interval', 5))
-    threshold = float(data.get('threshold', 0.95))
+    data = request.get_json(silent=True)
+    params, priority, error = parse_job_request(data)
+    if error:
+        return jsonify({'error': error}), 400
     video_id = data.get('video_id', None)
+    # a Socket.IO client (on any server process) to stream events to
+    socket_id = data.get('socket_id', None)
     
-    if not video_path:
-        return jsonify({'error': 'video_path is required'}), 400
-    
-    # Start background task
-    socketio.start_background_task(extract_frames_task, video_path, video_id, interval, threshold, video_id)
+    job_id = video_id or generate_random_string()
+    try:
+        submit_job(job_id, priority, {**params, 'socket_id': socket_id or video_id, 'server_video_id': video_id})
+    except QueueFull:
+        return jsonify({'error': 'Too many jobs queued, try again later'}), 429
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
     
-    return jsonify({'message': 'process begun'})
+    return jsonify({'message': 'process begun', 'job_id': job_id, 'queue_position': scheduler.queue_position(job_id)})
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = scheduler.status(job_id)
+    if status is None:
+        job = job_store.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        # queued on another server process, or finished before the last restart
+        status = {key: job[key] for key in ('job_id', 'state', 'priority', 'error', 'attempts', 'owner')}
+        status['progress'] = round(job['progress'], 4)
+    return jsonify(status)
+
+def job_manifest_entries(job_id):
+    """
+    The output dir and manifest of a finished job, or (None, None).
+    """
+    output_dir = safe_join(app.static_folder, job_id)
+    manifest = load_manifest(output_dir) if output_dir else None
+    return (output_dir, manifest) if manifest is not None else (None, None)
+
+def artifact_url(job_id, entry):
+    return f"/jobs/{job_id}/files/{entry['file']}?v={entry['sha256'][:16]}"
+
+@app.route('/jobs/<job_id>/manifest')
+def job_manifest(job_id):
+    _, manifest = job_manifest_entries(job_id)
+    if manifest is None:
+        return jsonify({'error': 'No results for this job'}), 404
+
+    def with_url(entry):
+        return {**entry, 'url': artifact_url(job_id, entry)} if entry is not None else None
+
+    response = jsonify({
+        'job_id': job_id,
+        'slides': [{**with_url(slide), 'thumbnail': with_url(slide['thumbnail'])} for slide in manifest['slides']],
+        'pdf': with_url(manifest['pdf']),
+        'subtitles': with_url(manifest['subtitles'])
+    })
+    # the manifest changes when the job is run again, so clients always
+    # revalidate it; the files it points to can be cached for good
+    response.set_etag(hashlib.sha256(response.get_data()).hexdigest())
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@app.route('/jobs/<job_id>/files/<name>')
+def job_file(job_id, name):
+    output_dir, manifest = job_manifest_entries(job_id)
+    entry = manifest_files(manifest).get(name) if manifest is not None else None
+    path = os.path.join(output_dir, name) if entry is not None else None
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+
+    # ETags are the content hash; conditional requests and byte ranges
+    # (If-None-Match, Range, If-Range) are handled by send_file
+    versioned = request.args.get('v') == entry['sha256'][:16]
+    response = send_file(path, etag=entry['sha256'], max_age=ARTIFACT_MAX_AGE if versioned else None)
+    # werkzeug only says so on range responses; PDF viewers look for it on the first one
+    response.accept_ranges = 'bytes'
+    if versioned:
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(job_store.other_stats(owner, 'metrics')), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache')
+def cache_stats():
+    return jsonify({**result_cache.report(), **combined_stats('cache', result_cache.stats)})
+
+@app.route('/outbox')
+def outbox_stats():
+    return jsonify({**outbox.report(), **combined_stats('outbox', outbox.stats)})
 
 @app.route('/')
 def index():
@@ -315,18 +497,37 @@ def index():
 
 @socketio.on('compute_task')
 def handle_compute_task(data):
-    video_path = data.get('video_path')
-    interval = int(data.get('interval', 5))
-    threshold = float(data.get('threshold', 0.95))
-    
-    if not video_path:
-        emit('processing_error', {'message': 'video_path is required'})
+    params, priority, error = parse_job_request(data)
+    if error:
+        emit('processing_error', {'message': error})
         return
     
-    # Start background task with client identifier
-    socketio.start_background_task(extract_frames_task, video_path, request.sid, interval, threshold)
-    emit('status', {'message': 'Processing started'})
+    # Queue the task with the client identifier
+    job_id = generate_random_string()
+    try:
+        submit_job(job_id, priority, {**params, 'socket_id': request.sid, 'server_video_id': None})
+    except QueueFull:
+        emit('processing_error', {'message': 'Too many jobs queued, try again later'})
+        return
+    emit('status', {'message': 'Processing queued', 'job_id': job_id, 'queue_position': scheduler.queue_position(job_id)})
 
-if __name__ == "__main__":
-    socketio.run(app, debug=True, port=5000)
+def start_server():
+    """
+    Claim this process as a job owner, start its heartbeat (which resumes
+    orphaned jobs) and deliver callbacks left over from the previous run.
+    Called by the serving process only: gunicorn's post_worker_init, or
+    the reloader's server process under `python app.py`. Shard workers
+    import this module too, and must never pick up jobs or callbacks.
+    """
+    if multiprocessing.parent_process() is not None:
+        return
+    job_store.heartbeat(owner)
+    socketio.start_background_task(heartbeat_loop)
+    if RESUME_JOBS:
+        outbox.start()
 
+if __name__ == "__main__":
+    # the reloader's watcher process runs this too but never serves
+    if os.getenv("WERKZEUG_RUN_MAIN") == "true":
+        start_server()
+    socketio.run(app, debug=True, port=5000)
\ No newline at end of file
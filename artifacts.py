@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+MANIFEST = 'manifest.json'
+# slide grids only need a small picture of each slide
+THUMBNAIL_WIDTH = 320
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_name(index):
+    return f'thumb_{index}.jpg'
+
+
+def encode_thumbnail(image, width=THUMBNAIL_WIDTH, quality=THUMBNAIL_QUALITY):
+    """
+    JPEG of a slide, given as a decoded frame or encoded bytes, scaled down
+    to `width` pixels wide (never up).
+    """
+    if isinstance(image, bytes):
+        image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+    height, image_width = image.shape[:2]
+    if image_width > width:
+        image = cv2.resize(image, (width, max(1, round(height * width / image_width))), interpolation=cv2.INTER_AREA)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def file_entry(output_dir, name):
+    """
+    {'file', 'sha256', 'bytes'} for a file in `output_dir`.
+    """
+    digest = hashlib.sha256()
+    with open(os.path.join(output_dir, name), 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'file': name, 'sha256': digest.hexdigest(), 'bytes': os.path.getsize(os.path.join(output_dir, name))}
+
+
+def write_manifest(output_dir, slide_files, appearances, pdf_file='output.pdf', subtitles_file=None):
+    """
+    Write `manifest.json` into `output_dir`: every slide with its
+    thumbnail and the times it was on screen, plus the PDF and subtitle
+    groups, each with its SHA-256 and size (None for a PDF or subtitle
+    groups that weren't written). Written last and renamed into
+    place, so a manifest only ever lists files that are complete.
+
+    `slide_files` are the slides' file names in order; their thumbnails
+    are looked up by `thumbnail_name`.
+    """
+    slides = []
+    for index, (name, ranges) in enumerate(zip(slide_files, appearances), 1):
+        thumbnail = thumbnail_name(index)
+        slides.append({
+            'index': index,
+            **file_entry(output_dir, name),
+            'thumbnail': file_entry(output_dir, thumbnail) if os.path.exists(os.path.join(output_dir, thumbnail)) else None,
+            'appearances': ranges
+        })
+    manifest = {
+        'slides': slides,
+        # a job that found no slides has no PDF
+        'pdf': file_entry(output_dir, pdf_file) if os.path.exists(os.path.join(output_dir, pdf_file)) else None,
+        'subtitles': file_entry(output_dir, subtitles_file) if subtitles_file else None
+    }
+
+    tmp_path = os.path.join(output_dir, f'.{MANIFEST}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST))
+    return manifest
+
+
+def load_manifest(output_dir):
+    """
+    The manifest of a finished result, or None.
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_files(manifest):
+    """
+    Every file entry in a manifest, by file name.
+    """
+    entries = [manifest['pdf'], manifest['subtitles']]
+    for slide in manifest['slides']:
+        entries += [slide, slide['thumbnail']]
+    return {entry['file']: entry for entry in entries if entry is not None}
@@ -0,0 +1,250 @@
+"""
+Batch mode: turn many videos into slides without running the server.
+
+    python batch.py lectures/ --out slides/ --jobs 4
+    python batch.py --list urls.txt --out slides/ --sampling scene
+
+Sources are local video files, directories (searched recursively) or
+YouTube URLs, given as arguments or one per line in a --list file. Each
+video gets its own folder under --out with the slides, output.pdf,
+subtitle_groups.json and trace.json. A video whose folder already holds a
+finished result for the same settings is skipped, so an interrupted run can
+simply be started again. A summary of every video goes to report.json.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from engine import ALGORITHM_VERSION, MAX_SHARDS, OUTPUT_FORMATS, SAMPLING_MODES, Engine, extract_youtube_id
+from metrics import JobTrace
+from roi import parse_roi
+
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.webm', '.mov', '.avi', '.m4v')
+MARKER = 'batch.json'
+
+# one engine per worker process, built by `init_worker`
+_engine = None
+
+
+def init_worker(cache_dir, budget_bytes, stream_downloads=True):
+    global _engine
+    _engine = Engine(cache_dir, budget_bytes=budget_bytes, allow_local_files=True, stream_downloads=stream_downloads)
+
+
+def collect_sources(paths, list_file=None):
+    """
+    Expand directories and list files into a flat, de-duplicated list of
+    video files and URLs.
+    """
+    entries = list(paths)
+    if list_file:
+        with open(list_file, encoding='utf-8') as f:
+            entries += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+    sources = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            for dirpath, dirnames, filenames in os.walk(entry):
+                dirnames.sort()
+                sources += [
+                    os.path.join(dirpath, name) for name in sorted(filenames)
+                    if name.lower().endswith(VIDEO_EXTENSIONS)
+                ]
+        else:
+            sources.append(entry)
+    return list(dict.fromkeys(sources))
+
+
+def output_name(source):
+    """
+    Folder name for a source: the file name without extension, or the
+    YouTube id for a URL.
+    """
+    if os.path.isfile(source):
+        name = os.path.splitext(os.path.basename(source))[0]
+    else:
+        name = extract_youtube_id(source) or source
+    return re.sub(r'[^0-9A-Za-z._-]+', '_', name).strip('._') or 'video'
+
+
+def plan_outputs(sources, out_dir):
+    """
+    Pair each source with its own output folder, numbering clashing names.
+    """
+    taken = set()
+    plan = []
+    for source in sources:
+        base = name = output_name(source)
+        n = 2
+        while name in taken:
+            name = f'{base}-{n}'
+            n += 1
+        taken.add(name)
+        plan.append((source, os.path.join(out_dir, name)))
+    return plan
+
+
+def is_complete(output_dir, source, options):
+    """
+    Whether `output_dir` already holds a result for `source` made with the
+    same options and algorithm version.
+    """
+    try:
+        with open(os.path.join(output_dir, MARKER), encoding='utf-8') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (marker.get('source') == source and marker.get('options') == options
+            and marker.get('algorithm_version') == ALGORITHM_VERSION)
+
+
+def run_item(source, output_dir, options):
+    """
+    Process-pool worker: process one video and mark its folder complete.
+    """
+    started = time.perf_counter()
+    trace = JobTrace(os.path.basename(output_dir))
+    try:
+        result = _engine.process(source, output_dir, trace=trace, **options)
+    except Exception as e:
+        return {'status': 'failed', 'error': str(e), 'wall_seconds': round(time.perf_counter() - started, 3)}
+
+    trace.save(os.path.join(output_dir, 'trace.json'))
+    summary = {
+        'status': 'completed',
+        'slides': result['frames_count'],
+        'revisits': result['revisits'],
+        'region': result['region'],
+        'ignored': result['ignored'],
+        'frames_sampled': result['sampling']['frames'],
+        'wall_seconds': round(time.perf_counter() - started, 3)
+    }
+    # written last, so a folder with a marker is always complete
+    with open(os.path.join(output_dir, MARKER), 'w', encoding='utf-8') as f:
+        json.dump({
+            'source': source,
+            'options': options,
+            'algorithm_version': ALGORITHM_VERSION,
+            'completed_at': time.time(),
+            **summary
+        }, f, indent=4)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Extract slides from many videos without running the server.')
+    parser.add_argument('sources', nargs='*', help='video files, directories or YouTube URLs')
+    parser.add_argument('--list', dest='list_file', help='file with one video path or URL per line')
+    parser.add_argument('--out', default='slides', help='output folder (default: slides)')
+    parser.add_argument('--jobs', type=int, default=2, help='videos processed at once (default: 2)')
+    parser.add_argument('--force', action='store_true', help='reprocess videos that are already done')
+    parser.add_argument('--report', help='summary file (default: <out>/report.json)')
+    parser.add_argument('--cache-dir', help='downloads and result cache (default: <out>/.video2slides)')
+    parser.add_argument('--disk-budget-gb', type=float, default=0, help='cap on the cache dir, 0 for none')
+    parser.add_argument('--no-stream', action='store_true', help='wait for each download to finish before decoding it')
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--sampling', choices=SAMPLING_MODES, default='fps')
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--output-format', choices=list(OUTPUT_FORMATS), default='png')
+    parser.add_argument('--quality', type=int, default=90)
+    parser.add_argument('--max-dimension', type=int, default=None)
+    parser.add_argument('--keep-revisits', action='store_true',
+                        help='write a slide again each time it comes back instead of folding it into the first page')
+    parser.add_argument('--analysis-width', type=int, default=640,
+                        help='width slides are detected at, 0 for full size (default: 640)')
+    parser.add_argument('--roi', default='auto',
+                        help="part of the frame to compare: auto, full or x,y,width,height as fractions (default: auto)")
+    args = parser.parse_args()
+
+    sources = collect_sources(args.sources, args.list_file)
+    if not sources:
+        parser.error('no videos given')
+    if args.interval <= 0:
+        parser.error('--interval must be greater than 0')
+    if not 0 < args.threshold <= 1:
+        parser.error('--threshold must be greater than 0 and at most 1')
+    if args.max_dimension is not None and args.max_dimension < 1:
+        parser.error('--max-dimension must be at least 1')
+    if not 1 <= args.quality <= 100:
+        parser.error('--quality must be between 1 and 100')
+    if args.analysis_width and args.analysis_width < 64:
+        parser.error('--analysis-width must be 0 or at least 64')
+    try:
+        roi = parse_roi(args.roi if ',' not in args.roi else [float(v) for v in args.roi.split(',')])
+    except ValueError as e:
+        parser.error(f'--roi: {e}')
+
+    options = {
+        'interval_seconds': args.interval,
+        'similarity_threshold': args.threshold,
+        'shards': max(1, min(args.shards, MAX_SHARDS)),
+        'sampling': args.sampling,
+        'language': args.language,
+        'output_format': args.output_format,
+        'quality': args.quality,
+        'max_dimension': args.max_dimension,
+        'collapse_revisits': not args.keep_revisits,
+        'roi': roi,
+        'analysis_width': args.analysis_width or None
+    }
+    os.makedirs(args.out, exist_ok=True)
+    cache_dir = args.cache_dir or os.path.join(args.out, '.video2slides')
+    report_path = args.report or os.path.join(args.out, 'report.json')
+
+    started_at = time.time()
+    items = []
+    pending = []
+    for source, output_dir in plan_outputs(sources, args.out):
+        item = {'source': source, 'output_dir': output_dir}
+        items.append(item)
+        if not args.force and is_complete(output_dir, source, options):
+            item['status'] = 'skipped'
+        else:
+            pending.append(item)
+
+    print(f'{len(items)} videos, {len(items) - len(pending)} already done, {len(pending)} to process')
+
+    context = multiprocessing.get_context('spawn')
+    budget_bytes = int(args.disk_budget_gb * 1024 ** 3)
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs), mp_context=context,
+                             initializer=init_worker, initargs=(cache_dir, budget_bytes, not args.no_stream)) as pool:
+        futures = {pool.submit(run_item, item['source'], item['output_dir'], options): item for item in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            item = futures[future]
+            try:
+                item.update(future.result())
+            except Exception as e:
+                # the worker process itself died
+                item.update({'status': 'failed', 'error': str(e)})
+            if item['status'] == 'completed':
+                print(f"[{done}/{len(pending)}] {item['source']}: {item['slides']} slides in {item['wall_seconds']}s")
+            else:
+                print(f"[{done}/{len(pending)}] {item['source']}: failed: {item['error']}")
+
+    counts = {status: sum(1 for item in items if item['status'] == status)
+              for status in ('completed', 'skipped', 'failed')}
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'started_at': started_at,
+            'finished_at': time.time(),
+            'wall_seconds': round(time.time() - started_at, 3),
+            'algorithm_version': ALGORITHM_VERSION,
+            'options': options,
+            'counts': counts,
+            'items': items
+        }, f, indent=4)
+    print(f"{counts['completed']} completed, {counts['skipped']} skipped, {counts['failed']} failed. Report: {report_path}")
+
+    if counts['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,495 @@
+"""
+Offline benchmark and accuracy suite.
+
+Renders synthetic lecture videos with known slide change times, runs the
+frame-extraction pipeline on them with the YouTube download and transcript
+fetch stubbed out, and writes wall time, frames/sec, peak RSS and boundary
+precision/recall per (video, strategy) to a JSON file, along with a timing
+of the SSIM scorers against skimage.
+
+    python benchmark.py --out benchmark_results.json
+    python benchmark.py --strategies fps,scene --baseline benchmark_results.json
+
+Each case runs in a fresh process so peak RSS is per case. With
+--baseline, cases that got slower or less accurate than the baseline are
+listed and the script exits non-zero.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+WIDTH = 640
+HEIGHT = 360
+FPS = 10
+
+WORDS = (
+    'gradient descent loss function matrix vector kernel tensor layer network '
+    'batch epoch sample model data feature weight bias error norm basis proof '
+    'lemma theorem graph node edge tree heap queue cache memory latency'
+).split()
+
+# name -> (noise sigma, draw cursor, x264 crf, chance a change goes back to an earlier slide,
+#          webcam overlay)
+SCENARIOS = {
+    'clean': (0, False, 20, 0, False),
+    'noisy': (6, False, 34, 0, False),
+    'cursor': (0, True, 26, 0, False),
+    'lecture': (4, True, 30, 0, False),
+    'revisits': (4, True, 30, 0.4, False),
+    'webcam': (4, True, 30, 0, True),
+}
+
+# name -> Engine.process kwargs
+STRATEGIES = {
+    'fps': {'sampling': 'fps'},
+    'fps-sharded': {'sampling': 'fps', 'shards': 4},
+    'keyframes': {'sampling': 'keyframes'},
+    'scene': {'sampling': 'scene'},
+    'refine': {'sampling': 'refine'},
+    'fps-full-frame': {'sampling': 'fps', 'roi': 'full'},
+    'fps-analysis-320': {'sampling': 'fps', 'analysis_width': 320},
+}
+
+
+def render_slide(rng, index):
+    """
+    A slide with a title bar, a few lines of text and a box or two.
+    """
+    slide = np.full((HEIGHT, WIDTH, 3), 245, dtype=np.uint8)
+    color = tuple(int(c) for c in rng.integers(40, 200, size=3))
+    cv2.rectangle(slide, (0, 0), (WIDTH, 60), color, -1)
+    title = f'{index}. ' + ' '.join(rng.choice(WORDS, size=3))
+    cv2.putText(slide, title, (20, 42), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2, cv2.LINE_AA)
+
+    lines = int(rng.integers(3, 7))
+    for line in range(lines):
+        text = '- ' + ' '.join(rng.choice(WORDS, size=int(rng.integers(3, 6))))
+        cv2.putText(slide, text, (30, 100 + 40 * line), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (30, 30, 30), 1, cv2.LINE_AA)
+
+    for _ in range(int(rng.integers(0, 3))):
+        x, y = int(rng.integers(380, 560)), int(rng.integers(90, 260))
+        cv2.rectangle(slide, (x, y), (x + int(rng.integers(40, 80)), y + int(rng.integers(30, 80))), color, 2)
+    return slide
+
+
+def draw_cursor(frame, t):
+    """
+    A pointer that wanders around the slide, resting every few seconds.
+    """
+    phase = t % 6.0
+    if phase > 4.0:
+        t -= phase - 4.0
+    x = int(WIDTH * (0.5 + 0.35 * np.sin(t * 0.9)))
+    y = int(HEIGHT * (0.55 + 0.3 * np.sin(t * 1.3 + 1.0)))
+    points = np.array([[x, y], [x, y + 18], [x + 5, y + 13], [x + 12, y + 13]], dtype=np.int32)
+    cv2.fillPoly(frame, [points], (0, 0, 0))
+
+
+def draw_webcam(frame, t, rng):
+    """
+    A picture-in-picture webcam in the bottom right corner: a speaker in
+    front of a bookshelf who sways, nods and talks, filmed by a slightly
+    shaky, noisy camera.
+    """
+    width, height = 240, 180
+    x0, y0 = WIDTH - width - 10, HEIGHT - height - 10
+    shake = int(round(2 * np.sin(t * 5.3)))
+    view = np.full((height, width, 3), (70, 90, 110), dtype=np.uint8)
+    for shelf in range(3):
+        top = 10 + 45 * shelf + shake
+        cv2.rectangle(view, (0, top + 36), (width, top + 40), (40, 60, 80), -1)
+        for book in range(16):
+            left = 4 + 15 * book + shake
+            shade = 60 + (37 * (book + 3 * shelf)) % 150
+            cv2.rectangle(view, (left, top + 6 + book % 3 * 3), (left + 11, top + 36), (shade, 255 - shade, 120), -1)
+
+    sway = int(22 * np.sin(t * 2.1))
+    nod = int(9 * np.sin(t * 3.7 + 0.5))
+    cx = width // 2 + sway
+    for stripe in range(7):
+        top = 128 + 8 * stripe
+        cv2.rectangle(view, (cx - 60, top), (cx + 60, top + 4),
+                      (40, 40, 160) if stripe % 2 else (220, 220, 220), -1)
+    cv2.ellipse(view, (cx, 80 + nod), (30, 40), 0, 0, 360, (120, 150, 200), -1)
+    mouth = 2 + int(6 * abs(np.sin(t * 9.0)))
+    cv2.ellipse(view, (cx, 101 + nod), (10, mouth), 0, 0, 360, (40, 40, 90), -1)
+    for eye in (-12, 12):
+        cv2.circle(view, (cx + eye, 72 + nod), 4, (20, 20, 20), -1)
+
+    view = np.clip(view + rng.normal(0, 10, view.shape), 0, 255).astype(np.uint8)
+    frame[y0:y0 + height, x0:x0 + width] = view
+
+
+def make_video(path, scenario, duration, seed):
+    """
+    Write a synthetic lecture video and return the ground-truth slide
+    change times and the number of distinct slides shown.
+    """
+    noise, cursor, crf, revisit, webcam = SCENARIOS[scenario]
+    rng = np.random.default_rng(seed)
+
+    changes = []
+    t = float(rng.uniform(6, 30))
+    while t < duration - 4:
+        changes.append(round(t, 2))
+        t += float(rng.uniform(6, 40))
+
+    slides = [render_slide(rng, i + 1) for i in range(len(changes) + 1)]
+    boundaries = [round(c * FPS) for c in changes]
+    # which slide each run shows: the next new one, or with revisits
+    # sometimes one shown before
+    order = [0]
+    for _ in changes:
+        earlier = [s for s in set(order) if s != order[-1]] if revisit else []
+        if earlier and rng.random() < revisit:
+            order.append(int(rng.choice(sorted(earlier))))
+        else:
+            order.append(max(order) + 1)
+
+    encoder = subprocess.Popen([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{WIDTH}x{HEIGHT}', '-r', str(FPS), '-i', 'pipe:',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(crf), '-pix_fmt', 'yuv420p',
+        # index first, as YouTube serves them, so the videos can be streamed
+        '-movflags', '+faststart', path
+    ], stdin=subprocess.PIPE)
+
+    slide_index = 0
+    for n in range(int(duration * FPS)):
+        while slide_index < len(boundaries) and n >= boundaries[slide_index]:
+            slide_index += 1
+        frame = slides[order[slide_index]].copy()
+        if cursor:
+            draw_cursor(frame, n / FPS)
+        if webcam:
+            draw_webcam(frame, n / FPS, rng)
+        if noise:
+            frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+        encoder.stdin.write(frame.tobytes())
+
+    encoder.stdin.close()
+    if encoder.wait() != 0:
+        raise RuntimeError(f'ffmpeg failed to encode {path}')
+
+    # a slide shows from one frame boundary to the next
+    return [b / FPS for b in boundaries], len(set(order))
+
+
+def match_boundaries(detected, truth, tolerance):
+    """
+    Greedily pair detected and true change times that lie within
+    `tolerance` seconds of each other, closest first.
+    """
+    pairs = sorted(
+        (abs(d - t), i, j)
+        for i, d in enumerate(detected)
+        for j, t in enumerate(truth)
+        if abs(d - t) <= tolerance
+    )
+    used_detected, used_truth, errors = set(), set(), []
+    for error, i, j in pairs:
+        if i in used_detected or j in used_truth:
+            continue
+        used_detected.add(i)
+        used_truth.add(j)
+        errors.append(error)
+
+    precision = len(errors) / len(detected) if detected else 1.0
+    recall = len(errors) / len(truth) if truth else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+        'f1': round(f1, 4),
+        'missed': len(truth) - len(errors),
+        'spurious': len(detected) - len(errors),
+        'mean_boundary_error': round(sum(errors) / len(errors), 3) if errors else None
+    }
+
+
+def run_case(video_file, case_id, strategy, interval, threshold, tolerance, duration, changes, work_dir):
+    """
+    Run one strategy over one video in this (fresh) process and report.
+    """
+    from engine import Engine
+    from metrics import JobTrace
+    from transcripts import TranscriptStore
+
+    static_folder = os.path.join(work_dir, 'static', case_id)
+    engine = Engine(
+        static_folder,
+        transcripts=TranscriptStore(
+            os.path.join(static_folder, 'transcripts'),
+            fetcher=lambda video_id, language: [
+                {'start': float(s), 'duration': 5.0, 'text': f'cue {s}'} for s in range(0, int(duration), 5)
+            ]
+        ),
+        downloader=lambda video_path, output_path: shutil.copyfile(video_file, output_path)
+    )
+
+    # any 11-character id satisfies extract_youtube_id
+    video_url = f'https://youtu.be/{case_id[-11:].rjust(11, "x")}'
+    trace = JobTrace(case_id)
+    started = time.perf_counter()
+    result = engine.process(
+        video_url,
+        os.path.join(static_folder, case_id),
+        interval_seconds=interval,
+        similarity_threshold=threshold,
+        trace=trace,
+        **STRATEGIES[strategy]
+    )
+    wall = time.perf_counter() - started
+    trace = trace.to_dict()
+    frames = trace['counters'].get('frames_sampled', 0)
+
+    # the last timestamp closes the final slide rather than marking a change
+    detected = result['timestamps'][:-1]
+    return {
+        'wall_seconds': round(wall, 3),
+        'frames_sampled': frames,
+        'decode_seconds': result['sampling']['decode_seconds'],
+        'frames_per_second': round(frames / wall, 2) if wall else None,
+        'realtime_factor': round(duration / wall, 2) if wall else None,
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'peak_child_rss_mb': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        'slides_found': result['frames_count'],
+        'revisits': result['revisits'],
+        'region': result['region'],
+        'ignored': result['ignored'],
+        'detected_changes': [round(t, 3) for t in detected],
+        **match_boundaries(detected, changes, tolerance),
+        'stages': trace['stages'],
+        'detector_stats': result['detector_stats']
+    }
+
+
+def ssim_benchmark(video_file, sizes=((640, 360), (1920, 1080)), max_frames=30, batch_size=8):
+    """
+    Time skimage SSIM against the cached and batched scorers in
+    similarity.py on consecutive frames of a video, and check they agree.
+    Also times the detector's SSIM lower and upper bounds and records how
+    far from SSIM they land (`bound_max_excess` and
+    `upper_bound_max_shortfall` must stay at or under BOUND_SLACK).
+    """
+    from skimage.metrics import structural_similarity
+    from engine import iter_video_frames
+    from similarity import FrameStats, ssim, ssim_batch, ssim_lower_bound, ssim_upper_bound
+
+    decoded = [frame for _, frame in iter_video_frames(video_file, 1, WIDTH, HEIGHT)][:max_frames]
+    report = []
+    for width, height in sizes:
+        frames = [cv2.resize(frame, (width, height)) for frame in decoded]
+        pairs = len(frames) - 1
+
+        started = time.perf_counter()
+        reference = [
+            structural_similarity(cv2.cvtColor(frames[i], cv2.COLOR_BGR2GRAY),
+                                  cv2.cvtColor(frames[i - 1], cv2.COLOR_BGR2GRAY))
+            for i in range(1, len(frames))
+        ]
+        skimage_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        previous = FrameStats(frames[0])
+        cached = []
+        for frame in frames[1:]:
+            current = FrameStats(frame)
+            cached.append(ssim(current, previous))
+            previous = current
+        cached_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stats = [FrameStats(frame) for frame in frames]
+        pairs_list = list(zip(stats[1:], stats[:-1]))
+        batched = np.concatenate([ssim_batch(pairs_list[i:i + batch_size])
+                                  for i in range(0, len(pairs_list), batch_size)])
+        batch_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        stats = [FrameStats(frame) for frame in frames]
+        bounds = np.array([ssim_lower_bound(stats[i], stats[i - 1]) for i in range(1, len(stats))])
+        bound_seconds = time.perf_counter() - started
+        gaps = np.array(cached) - bounds
+
+        started = time.perf_counter()
+        stats = [FrameStats(frame) for frame in frames]
+        upper_bounds = np.array([ssim_upper_bound(stats[i], stats[i - 1]) for i in range(1, len(stats))])
+        upper_bound_seconds = time.perf_counter() - started
+        upper_gaps = upper_bounds - np.array(cached)
+
+        report.append({
+            'width': width,
+            'height': height,
+            'pairs': pairs,
+            'skimage_ms_per_frame': round(skimage_seconds / pairs * 1000, 3),
+            'cached_ms_per_frame': round(cached_seconds / pairs * 1000, 3),
+            'batch_ms_per_frame': round(batch_seconds / pairs * 1000, 3),
+            'bound_ms_per_frame': round(bound_seconds / pairs * 1000, 3),
+            'speedup': round(skimage_seconds / cached_seconds, 2),
+            'bound_max_excess': float(-gaps.min()),
+            'bound_median_gap': float(np.median(gaps)),
+            'upper_bound_ms_per_frame': round(upper_bound_seconds / pairs * 1000, 3),
+            'upper_bound_max_shortfall': float(-upper_gaps.min()),
+            'upper_bound_median_gap': float(np.median(upper_gaps)),
+            'max_abs_diff': float(max(np.abs(np.array(cached) - reference).max(),
+                                      np.abs(batched - reference).max()))
+        })
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def add_decode_savings(results):
+    """
+    Give every case the decode seconds of the `fps` case on the same video
+    and the share of them it saved (negative when it spent more), if that
+    case ran.
+    """
+    fps = {r['video']: r['decode_seconds'] for r in results if r['strategy'] == 'fps' and 'error' not in r}
+    for r in results:
+        baseline = fps.get(r['video'])
+        if baseline and 'error' not in r:
+            r['fps_decode_seconds'] = baseline
+            r['decode_savings'] = round(1 - r['decode_seconds'] / baseline, 4)
+
+
+def compare(results, baseline_path, max_slowdown, max_accuracy_drop):
+    """
+    List cases that are slower or less accurate than in the baseline file.
+    """
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(r['video'], r['strategy']): r for r in json.load(f)['results']}
+
+    regressions = []
+    for r in results:
+        old = baseline.get((r['video'], r['strategy']))
+        if old is None or 'error' in r or 'error' in old:
+            continue
+        if old['wall_seconds'] and r['wall_seconds'] > old['wall_seconds'] * (1 + max_slowdown):
+            regressions.append(f"{r['video']}/{r['strategy']}: wall {old['wall_seconds']}s -> {r['wall_seconds']}s")
+        for key in ('precision', 'recall'):
+            if r[key] < old[key] - max_accuracy_drop:
+                regressions.append(f"{r['video']}/{r['strategy']}: {key} {old[key]} -> {r[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--strategies', default=','.join(STRATEGIES))
+    parser.add_argument('--duration', type=float, default=180, help='seconds per synthetic video')
+    parser.add_argument('--interval', type=float, default=2)
+    parser.add_argument('--threshold', type=float, default=0.95)
+    parser.add_argument('--tolerance', type=float, default=None,
+                        help='seconds a detected change may be off by (default: interval + 0.5)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--work-dir', default=None, help='keep videos and outputs here instead of a temp dir')
+    parser.add_argument('--baseline', default=None, help='previous results file to check for regressions')
+    parser.add_argument('--max-slowdown', type=float, default=0.2)
+    parser.add_argument('--max-accuracy-drop', type=float, default=0.02)
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(',')
+    strategies = args.strategies.split(',')
+    for name in scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name}; choose from {", ".join(SCENARIOS)}')
+    for name in strategies:
+        if name not in STRATEGIES:
+            parser.error(f'unknown strategy {name}; choose from {", ".join(STRATEGIES)}')
+    tolerance = args.tolerance if args.tolerance is not None else args.interval + 0.5
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='video2slides-bench-')
+    os.makedirs(os.path.join(work_dir, 'videos'), exist_ok=True)
+
+    videos = []
+    for i, scenario in enumerate(scenarios):
+        path = os.path.join(work_dir, 'videos', f'{scenario}-{args.seed}.mp4')
+        print(f'Rendering {scenario} ({args.duration:.0f}s)...')
+        changes, slides = make_video(path, scenario, args.duration, args.seed + i)
+        videos.append({'name': scenario, 'path': path, 'duration': args.duration, 'changes': changes, 'slides': slides})
+
+    results = []
+    spawn = multiprocessing.get_context('spawn')
+    for video in videos:
+        for strategy in strategies:
+            case_id = f"{video['name']}-{strategy}"
+            print(f'Running {case_id}...')
+            with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                try:
+                    report = pool.submit(run_case, video['path'], case_id, strategy, args.interval, args.threshold,
+                                         tolerance, video['duration'], video['changes'], work_dir).result()
+                except Exception as e:
+                    report = {'error': str(e)}
+            results.append({'video': video['name'], 'strategy': strategy, **report})
+            if 'error' in report:
+                print(f'  failed: {report["error"]}')
+            else:
+                print(f"  {report['wall_seconds']}s, {report['frames_per_second']} frames/s, "
+                      f"precision {report['precision']}, recall {report['recall']}")
+
+    add_decode_savings(results)
+    for r in results:
+        if 'decode_savings' in r and r['strategy'] != 'fps':
+            print(f"  {r['video']}/{r['strategy']}: decoding took {r['decode_seconds']}s against "
+                  f"{r['fps_decode_seconds']}s for fps ({r['decode_savings']:.0%} saved)")
+
+    print('Timing SSIM...')
+    ssim_report = ssim_benchmark(videos[-1]['path'])
+    for row in ssim_report:
+        print(f"  {row['width']}x{row['height']}: skimage {row['skimage_ms_per_frame']}ms, "
+              f"cached {row['cached_ms_per_frame']}ms per frame ({row['speedup']}x)")
+
+    output = {
+        'created_at': time.time(),
+        'git_commit': git_commit(),
+        'python': sys.version.split()[0],
+        'config': {
+            'interval': args.interval,
+            'threshold': args.threshold,
+            'tolerance': tolerance,
+            'seed': args.seed,
+            'width': WIDTH,
+            'height': HEIGHT,
+            'fps': FPS
+        },
+        'videos': [{key: v[key] for key in ('name', 'duration', 'changes', 'slides')} for v in videos],
+        'results': results,
+        'ssim': ssim_report
+    }
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(output, f, indent=4)
+    print(f'Wrote {args.out}')
+
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.max_slowdown, args.max_accuracy_drop)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Shared pytest fixtures. Videos are rendered with benchmark.py's synthetic
+slide generator and "downloaded" by copying them, so nothing here needs the
+network or YouTube.
+"""
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+import pytest
+
+import benchmark
+
+# a client for a live server, run by hand (see README)
+collect_ignore = ['test_app.py']
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """
+    The app module, imported with its static folder, job store and outbox
+    in a temp dir. Importing it starts nothing; the heartbeat and outbox
+    sender only run once `start_server()` is called.
+    """
+    with pytest.MonkeyPatch.context() as env:
+        env.setenv('STATIC_FOLDER', str(tmp_path_factory.mktemp('server')))
+        env.delenv('JOB_STORE_PATH', raising=False)
+        env.delenv('OUTBOX_PATH', raising=False)
+        import app
+    return app
+
+
+@pytest.fixture(scope='session')
+def slide_video(tmp_path_factory):
+    """
+    (path, change times) of a 60-second synthetic slide video.
+    """
+    path = str(tmp_path_factory.mktemp('videos') / 'clean.mp4')
+    changes, _ = benchmark.make_video(path, 'clean', 60, seed=0)
+    return path, changes
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """
+    `make_engine(video_file, name='static', **kwargs)`: an Engine with its
+    own static folder under tmp_path, whose downloads copy `video_file` and
+    whose transcripts are empty.
+    """
+    from engine import Engine
+    from transcripts import TranscriptStore
+
+    def make(video_file, name='static', **kwargs):
+        static_folder = str(tmp_path / name)
+        kwargs.setdefault('downloader', lambda video_path, output_path: shutil.copyfile(video_file, output_path))
+        return Engine(
+            static_folder,
+            transcripts=TranscriptStore(os.path.join(static_folder, 'transcripts'),
+                                        fetcher=lambda video_id, language: []),
+            **kwargs
+        )
+
+    return make
+
+
+@pytest.fixture(scope='session')
+def lecture_video(tmp_path_factory):
+    """
+    Path of a 60-second synthetic video with noise, a moving cursor and
+    heavy compression.
+    """
+    path = str(tmp_path_factory.mktemp('videos') / 'lecture.mp4')
+    benchmark.make_video(path, 'lecture', 60, seed=0)
+    return path
+
+
+@pytest.fixture(scope='session')
+def webcam_video(tmp_path_factory):
+    """
+    (path, change times) of a 60-second synthetic slide video with a talking
+    head in the corner.
+    """
+    path = str(tmp_path_factory.mktemp('videos') / 'webcam.mp4')
+    changes, _ = benchmark.make_video(path, 'webcam', 60, seed=0)
+    return path, changes
+
+
+@pytest.fixture(scope='session')
+def late_webcam_video(tmp_path_factory, slide_video, webcam_video):
+    """
+    Path of a 60-second video whose webcam only shows up after 20 seconds,
+    so the first frames and the whole video disagree on what to leave out.
+    """
+    path = str(tmp_path_factory.mktemp('videos') / 'late_webcam.mp4')
+    subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error', '-i', slide_video[0], '-i', webcam_video[0],
+        '-filter_complex', '[0:v]trim=0:20,setpts=PTS-STARTPTS[a];[1:v]trim=20:60,setpts=PTS-STARTPTS[b];'
+                           '[a][b]concat=n=2[v]',
+        '-map', '[v]', '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', path
+    ], check=True)
+    return path
+
+
+@pytest.fixture(scope='session')
+def revisit_slides():
+    """
+    Slides (a, b, c) as BGR images, where c is a with three more lines of
+    text: close enough to share most of a's layout, but a slide of its own.
+    """
+    rng = np.random.default_rng(0)
+    a = benchmark.render_slide(rng, 1)
+    c = a.copy()
+    for line in range(3):
+        text = '- ' + ' '.join(rng.choice(benchmark.WORDS, size=4))
+        cv2.putText(c, text, (30, 260 + 30 * line), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (30, 30, 30), 1, cv2.LINE_AA)
+    b = benchmark.render_slide(rng, 2)
+    return a, b, c
+
+
+@pytest.fixture(scope='session')
+def revisit_video(tmp_path_factory, revisit_slides):
+    """
+    (path, change times) of a 60-second noisy video of `revisit_slides`
+    that goes a, b, a, c, a in 12-second runs.
+    """
+    path = str(tmp_path_factory.mktemp('videos') / 'revisit.mp4')
+    a, b, c = revisit_slides
+    rng = np.random.default_rng(0)
+    encoder = subprocess.Popen([
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{benchmark.WIDTH}x{benchmark.HEIGHT}',
+        '-r', str(benchmark.FPS), '-i', 'pipe:',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '30', '-pix_fmt', 'yuv420p', '-movflags', '+faststart', path
+    ], stdin=subprocess.PIPE)
+    for slide in (a, b, a, c, a):
+        for _ in range(12 * benchmark.FPS):
+            noisy = np.clip(slide + rng.normal(0, 4, slide.shape), 0, 255).astype(np.uint8)
+            encoder.stdin.write(noisy.tobytes())
+    encoder.stdin.close()
+    assert encoder.wait() == 0
+    return path, [12.0, 24.0, 36.0, 48.0]
@@ -0,0 +1,146 @@
+"""
+Stand-in message broker for running several server processes locally.
+
+Speaks just enough of the Redis protocol (HELLO, PUBLISH, SUBSCRIBE,
+UNSUBSCRIBE, PING) for Socket.IO's Redis message queue, so the production code path can
+be exercised without installing Redis:
+
+    python dev_broker.py --port 6390
+    SOCKETIO_MESSAGE_QUEUE=redis://127.0.0.1:6390/0 gunicorn app:app
+
+Messages live in memory and are only delivered to current subscribers.
+Not for production use.
+"""
+import argparse
+import socketserver
+import threading
+from collections import defaultdict
+
+
+def encode(value):
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, (list, tuple)):
+        return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+    if isinstance(value, str):
+        value = value.encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class Broker:
+    def __init__(self):
+        self.channels = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def publish(self, channel, data):
+        with self.lock:
+            subscribers = list(self.channels.get(channel, ()))
+        message = encode([b'message', channel, data])
+        delivered = 0
+        for subscriber in subscribers:
+            if subscriber.send(message):
+                delivered += 1
+        return delivered
+
+    def subscribe(self, channel, handler):
+        with self.lock:
+            self.channels[channel].add(handler)
+
+    def unsubscribe(self, channel, handler):
+        with self.lock:
+            self.channels[channel].discard(handler)
+            if not self.channels[channel]:
+                del self.channels[channel]
+
+
+class Handler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.protocol = 2
+        self.subscriptions = set()
+        self.write_lock = threading.Lock()
+
+    def send(self, data):
+        try:
+            with self.write_lock:
+                self.wfile.write(data)
+                self.wfile.flush()
+            return True
+        except OSError:
+            return False
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def handle(self):
+        broker = self.server.broker
+        try:
+            while True:
+                args = self.read_command()
+                if args is None:
+                    break
+                if not args:
+                    continue
+                command = args[0].upper()
+                if command == b'PUBLISH':
+                    self.send(encode(broker.publish(args[1], args[2])))
+                elif command == b'SUBSCRIBE':
+                    for channel in args[1:]:
+                        broker.subscribe(channel, self)
+                        self.subscriptions.add(channel)
+                        self.send(encode([b'subscribe', channel, len(self.subscriptions)]))
+                elif command == b'UNSUBSCRIBE':
+                    for channel in args[1:] or list(self.subscriptions):
+                        broker.unsubscribe(channel, self)
+                        self.subscriptions.discard(channel)
+                        self.send(encode([b'unsubscribe', channel, len(self.subscriptions)]))
+                elif command == b'HELLO':
+                    # pub/sub messages are sent as RESP2 arrays either way,
+                    # which RESP3 clients read just the same
+                    self.protocol = int(args[1]) if len(args) > 1 else self.protocol
+                    self.send(b'%%2\r\n%s%s%s:%d\r\n' % (encode('server'), encode('redis'), encode('proto'), self.protocol))
+                elif command == b'PING':
+                    subscribed = self.subscriptions and self.protocol == 2
+                    self.send(encode([b'pong', b'']) if subscribed else b'+PONG\r\n')
+                elif command in (b'CLIENT', b'SELECT'):
+                    self.send(b'+OK\r\n')
+                else:
+                    self.send(b'-ERR unknown command\r\n')
+        except (OSError, ValueError, IndexError):
+            pass
+        finally:
+            for channel in self.subscriptions:
+                broker.unsubscribe(channel, self)
+
+
+class BrokerServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        super().__init__(address, Handler)
+        self.broker = Broker()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Redis message queue.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    args = parser.parse_args()
+
+    server = BrokerServer((args.host, args.port))
+    print(f'Broker listening on redis://{args.host}:{args.port}/0')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Stand-in downloader for trying streamed downloads locally.
+
+Copies a local video the way yt-dlp downloads one: into `<output>.part`, a
+chunk at a time at a set rate, renamed to `<output>` once complete. It can
+also pause part-way (a stall) or give up part-way (a truncated download).
+Pass it to `Engine(downloader=...)`, or run it to process a video once
+waiting for the download and once streaming it, and compare the two:
+
+    python dev_download.py lecture.mp4 --rate 2 --interval 2
+    python dev_download.py lecture.mp4 --rate 2 --stall-at 0.5 --stall-seconds 5
+    python dev_download.py lecture.mp4 --rate 2 --fail-at 0.6
+
+MP4 files with their index at the end can only be decoded once complete,
+so both runs wait for them; `ffmpeg -i in.mp4 -c copy -movflags +faststart
+out.mp4` moves it to the front. Not for production use.
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from download_stream import HEADER_LIMIT, mp4_header_end
+
+CHUNK_SIZE = 64 * 1024
+
+
+class ThrottledDownload:
+    """
+    `downloader(url, output_path)` for Engine that copies `source` at `rate`
+    bytes per second, whatever the URL. `stall_at` and `fail_at` are
+    fractions of the file: at `stall_at` nothing is written for
+    `stall_seconds`, and at `fail_at` the download gives up, leaving the
+    .part file behind as yt-dlp does.
+    """
+
+    def __init__(self, source, rate, stall_at=None, stall_seconds=0, fail_at=None):
+        self.source = source
+        self.rate = rate
+        self.stall_at = stall_at
+        self.stall_seconds = stall_seconds
+        self.fail_at = fail_at
+
+    def __call__(self, video_path, output_path):
+        total = os.path.getsize(self.source)
+        part = f'{output_path}.part'
+        written = 0
+        stalled = False
+        started = time.monotonic()
+        with open(self.source, 'rb') as src, open(part, 'wb') as dst:
+            while True:
+                if self.fail_at is not None and written >= self.fail_at * total:
+                    return
+                if not stalled and self.stall_at is not None and written >= self.stall_at * total:
+                    stalled = True
+                    time.sleep(self.stall_seconds)
+                    started += self.stall_seconds
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                dst.write(chunk)
+                dst.flush()
+                written += len(chunk)
+                delay = started + written / self.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+        os.replace(part, output_path)
+
+
+def run(args, stream_downloads, work_dir):
+    from engine import Engine, ProcessingError
+    from metrics import JobTrace
+    from transcripts import TranscriptStore
+
+    static_folder = os.path.join(work_dir, 'streamed' if stream_downloads else 'waited')
+    engine = Engine(
+        static_folder,
+        transcripts=TranscriptStore(os.path.join(static_folder, 'transcripts'), fetcher=lambda video_id, language: []),
+        downloader=ThrottledDownload(args.video, args.rate * 1024 ** 2, args.stall_at, args.stall_seconds, args.fail_at),
+        stream_downloads=stream_downloads,
+        stall_seconds=args.stall_limit
+    )
+    output_dir = os.path.join(static_folder, 'job')
+    trace = JobTrace('dev-download')
+    started = time.perf_counter()
+    try:
+        result = engine.process('https://youtu.be/devdownload', output_dir, interval_seconds=args.interval,
+                                sampling=args.sampling, roi=args.roi, analysis_width=args.analysis_width or None,
+                                trace=trace)
+    except ProcessingError as e:
+        return {'error': str(e), 'wall_seconds': round(time.perf_counter() - started, 3)}
+
+    slides = []
+    for i in range(1, result['frames_count'] + 1):
+        with open(os.path.join(output_dir, f"frame_{i}{result['frame_ext']}"), 'rb') as f:
+            slides.append(hashlib.md5(f.read()).hexdigest())
+    return {
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'first_slide_seconds': result['first_slide_seconds'],
+        'timestamps': result['timestamps'],
+        'slides': slides,
+        'stages': trace.to_dict()['stages']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a local video through a throttled stand-in download.')
+    parser.add_argument('video')
+    parser.add_argument('--rate', type=float, default=2, help='download speed in MB/s (default: 2)')
+    parser.add_argument('--stall-at', type=float, help='pause the download at this fraction of the file')
+    parser.add_argument('--stall-seconds', type=float, default=5)
+    parser.add_argument('--fail-at', type=float, help='give up on the download at this fraction of the file')
+    parser.add_argument('--stall-limit', type=float, default=30, help="engine's stall_seconds (default: 30)")
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--sampling', default='fps')
+    parser.add_argument('--roi', default='auto')
+    parser.add_argument('--analysis-width', type=int, default=640)
+    args = parser.parse_args()
+
+    with open(args.video, 'rb') as f:
+        if mp4_header_end(f.read(HEADER_LIMIT)) is False:
+            print(f"{args.video} has its index at the end, so the streamed run waits for the whole download too; "
+                  "move it to the front with -movflags +faststart")
+
+    work_dir = tempfile.mkdtemp(prefix='v2s-dev-download-')
+    try:
+        results = {}
+        for stream_downloads in (False, True):
+            name = 'streamed' if stream_downloads else 'waited'
+            results[name] = result = run(args, stream_downloads, work_dir)
+            if 'error' in result:
+                print(f"{name}: failed after {result['wall_seconds']}s: {result['error']}")
+            else:
+                print(f"{name}: {len(result['slides'])} slides in {result['wall_seconds']}s, "
+                      f"first after {result['first_slide_seconds']}s, stages {result['stages']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    waited, streamed = results['waited'], results['streamed']
+    if 'error' in waited or 'error' in streamed:
+        same = 'error' in waited and 'error' in streamed
+    else:
+        same = waited['timestamps'] == streamed['timestamps'] and waited['slides'] == streamed['slides']
+    print('Same result both ways' if same else 'Results differ')
+    sys.exit(0 if same else 1)
+
+
+if __name__ == '__main__':
+    main()
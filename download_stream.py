@@ -0,0 +1,233 @@
+import os
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+# a download that adds nothing to the file for this long is given up on
+STALL_SECONDS = 120
+POLL_SECONDS = 0.1
+CHUNK_SIZE = 1 << 20
+# how much of a file that isn't an MP4 to wait for before probing it
+PROBE_BYTES = 1 << 20
+# an MP4 whose index hasn't turned up in this many bytes is treated as
+# having it at the end
+HEADER_LIMIT = 16 << 20
+
+
+class DownloadError(Exception):
+    pass
+
+
+def mp4_header_end(data):
+    """
+    Where the `moov` box (the index a decoder needs before anything else)
+    ends in an MP4 file starting with `data`.
+
+    Returns False when the media data comes first, as in files written
+    without 'faststart': those can't be decoded front to back before they
+    are complete. Returns 0 for files that aren't MP4 and None when `data`
+    is too short to tell.
+    """
+    if len(data) < 8:
+        return None
+    if data[4:8] != b'ftyp':
+        return 0
+    offset = 0
+    while offset + 8 <= len(data):
+        size, kind = struct.unpack('>I4s', data[offset:offset + 8])
+        if size == 1:
+            if offset + 16 > len(data):
+                return None
+            size = struct.unpack('>Q', data[offset + 8:offset + 16])[0]
+        if kind == b'moov':
+            return offset + size
+        # a size of 0 means the box runs to the end of the file
+        if kind == b'mdat' or size < 8:
+            return False
+        offset += size
+    return None
+
+
+class DownloadStream:
+    """
+    A video that is decoded while it is still being downloaded.
+
+    `start(download)` runs the download on a background thread. The
+    download calls `attach(path)` when it starts writing `path`, or
+    `path.part` which it renames to `path` once complete (as yt-dlp does).
+    The file is then hard-linked under `self.path`, which stays valid
+    through those renames, for tools that need a path.
+
+    `feed` copies the file into a pipe as it grows. A pause in the download
+    is waited out rather than taken for the end of the video, unless
+    nothing arrives for `stall_seconds`. The pipe is only closed normally
+    once the download has finished successfully; a download that stops
+    short raises DownloadError, so a truncated video is never mistaken for
+    a short one.
+    """
+
+    def __init__(self, stall_seconds=STALL_SECONDS):
+        self.stall_seconds = stall_seconds
+        self.path = None
+        self.download_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._target = None
+        self._file = None
+        self._size = 0
+        self._grew_at = time.monotonic()
+        self._complete = False
+        self._started = threading.Event()
+        self._done = threading.Event()
+        self._wake = threading.Event()
+        self._result = Future()
+
+    @property
+    def complete(self):
+        return self._done.is_set() and self._complete
+
+    def start(self, download):
+        """
+        Run `download(attach)` on a background thread. It returns whether
+        the download succeeded, like `Engine.download`.
+        """
+        def run():
+            started = time.perf_counter()
+            complete = False
+            try:
+                complete = bool(download(self.attach))
+                self._result.set_result(complete)
+            except Exception as e:
+                self._result.set_exception(e)
+            finally:
+                self.download_seconds = time.perf_counter() - started
+                self.finish(complete)
+
+        threading.Thread(target=run, daemon=True, name='download-stream').start()
+
+    def attach(self, path):
+        self._target = path
+        self._grew_at = time.monotonic()
+        self._started.set()
+
+    def finish(self, complete):
+        self._complete = complete
+        self._done.set()
+        self._started.set()
+        self._wake.set()
+
+    def result(self):
+        """
+        Wait for the download to end. Returns whether it succeeded and
+        re-raises its exception if it failed with one.
+        """
+        return self._result.result()
+
+    def open(self):
+        """
+        Wait for the download's file to appear and open it. Returns False
+        when there is nothing to read along with: the download was already
+        in flight for another job (`attach` is never called), or it ended
+        before the file could be opened.
+        """
+        self._started.wait()
+        while self._target is not None:
+            link = f'{self._target}.stream'
+            for candidate in (f'{self._target}.part', self._target):
+                try:
+                    os.link(candidate, link)
+                except FileNotFoundError:
+                    # not there yet, or renamed in the meantime
+                    continue
+                except OSError as e:
+                    print(f"Can't link {candidate} to read it while it downloads: {e}")
+                    return False
+                self.path = link
+                self._file = open(link, 'rb', buffering=0)
+                self._grew_at = time.monotonic()
+                return True
+            if self._done.is_set():
+                return False
+            self._pause()
+        return False
+
+    def wait_header(self):
+        """
+        Wait until enough of the file is there to probe it and start
+        decoding. Returns False when it can't be decoded before it is
+        complete (see `mp4_header_end`), or the download failed first.
+        """
+        while True:
+            available = self._available()
+            end = mp4_header_end(os.pread(self._file.fileno(), min(available, HEADER_LIMIT), 0))
+            if end is False or (end is None and available >= HEADER_LIMIT):
+                return False
+            if end is not None:
+                needed = end or PROBE_BYTES
+                while self._available() < needed and not self._done.is_set():
+                    self._pause()
+                return self._available() >= needed or self.complete
+            if self._done.is_set():
+                return self.complete
+            self._pause()
+
+    def feed(self, pipe, wanted=lambda: True):
+        """
+        Copy the download into `pipe` as it arrives and close the pipe at
+        the end. Stops early, quietly, once `wanted()` is false or the
+        reader closes its end. Raises DownloadError when the download fails
+        or stalls before the end.
+
+        Every call starts from the beginning of the file, so a video can be
+        read more than once while it downloads.
+        """
+        offset = 0
+        try:
+            while wanted():
+                # read after checking, so bytes written just before the
+                # download finished aren't missed
+                done = self._done.is_set()
+                data = os.pread(self._file.fileno(), CHUNK_SIZE, offset)
+                if data:
+                    offset += len(data)
+                    pipe.write(data)
+                    pipe.flush()
+                elif done:
+                    if not self._complete:
+                        raise DownloadError('Download failed before the end of the video')
+                    break
+                else:
+                    self._available()
+                    self._pause()
+        except (OSError, ValueError):
+            # the decoder went away, or the stream was closed under us
+            pass
+        finally:
+            try:
+                pipe.close()
+            except OSError:
+                pass
+
+    def close(self):
+        """
+        Stop reading and remove the link. The download itself carries on.
+        """
+        self._wake.set()
+        if self._file is not None:
+            self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _available(self):
+        size = os.fstat(self._file.fileno()).st_size
+        if size > self._size:
+            self._size = size
+            self._grew_at = time.monotonic()
+        return size
+
+    def _pause(self):
+        if time.monotonic() - self._grew_at > self.stall_seconds:
+            raise DownloadError(f'Download stalled: nothing arrived for {self.stall_seconds:g}s')
+        started = time.perf_counter()
+        self._wake.wait(POLL_SECONDS)
+        self.wait_seconds += time.perf_counter() - started
@@ -0,0 +1,1530 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_EXCEPTION, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from datetime import timedelta
+from functools import partial
+from itertools import islice
+
+import cv2
+import img2pdf
+import numpy as np
+import pikepdf
+
+from artifacts import encode_thumbnail, thumbnail_name, write_manifest
+from download_stream import STALL_SECONDS, DownloadError, DownloadStream
+from metrics import JobTrace
+from result_cache import ResultCache, link_or_copy
+from roi import crop, find_ignored, region_from_fractions
+from similarity import BOUND_SLACK, WIN_SIZE, FrameStats, Mask, ssim, ssim_batch, ssim_lower_bound, ssim_upper_bound
+from slide_index import SlideIndex
+from single_flight import SingleFlight
+from transcripts import TranscriptStore, group_subtitles, slide_appearances
+
+# bump whenever a change alters which slides are picked and when (or which files a
+# result is made of), so cached results from the old algorithm stop being
+# served
+ALGORITHM_VERSION = 11
+
+class ProcessingError(Exception):
+    """
+    A job could not produce a result; the message is sent to the client.
+    """
+
+class RegionChanged(Exception):
+    """
+    A job decoded while downloading, with the region picked from the start
+    of the video, and the whole video called for a different one. The job
+    starts over on the complete file.
+    """
+
+
+def generate_random_string(length=8):
+    """
+    Generate a random string of fixed length.
+    
+    Args:
+        length (int): Length of the random string
+    
+    Returns:
+        str: Random string
+    """
+    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    return ''.join(random.choice(letters) for i in range(length))
+
+def extract_youtube_id(url):
+    """
+    Extract the YouTube video ID from a URL.
+    """
+    patterns = [
+        r'(?:v=|\/)([0-9A-Za-z_-]{11}).*',
+        r'(?:embed\/|v\/|shorts\/)([0-9A-Za-z_-]{11})',
+        r'(?:youtu\.be\/)([0-9A-Za-z_-]{11})'
+    ]
+    for pattern in patterns:
+        match = re.search(pattern, url)
+        if match:
+            return match.group(1)
+    return None
+
+class PdfBuilder:
+    """
+    Assemble a PDF one page at a time as slides come in, using img2pdf for
+    each page so images are embedded without re-encoding.
+    """
+
+    def __init__(self):
+        self.pdf = pikepdf.Pdf.new()
+        self.seconds = 0.0
+        # pages copied from another Pdf point into it until we save
+        self._sources = []
+
+    def add_page(self, image_bytes):
+        started = time.perf_counter()
+        page = pikepdf.Pdf.open(io.BytesIO(img2pdf.convert(image_bytes)))
+        self._sources.append(page)
+        self.pdf.pages.extend(page.pages)
+        self.seconds += time.perf_counter() - started
+
+    def save(self, output_pdf):
+        if not len(self.pdf.pages):
+            print("No images found for the PDF")
+            return
+        started = time.perf_counter()
+        self.pdf.save(output_pdf)
+        for source in self._sources:
+            source.close()
+        self.seconds += time.perf_counter() - started
+        print(f"Successfully created {output_pdf} with {len(self.pdf.pages)} images")
+
+def exact_match_stage(stats1, stats2, threshold):
+    """
+    Identical grayscale frames have an SSIM of exactly 1, so they are never a
+    boundary. Anything else is left for the next stage.
+    """
+    if np.array_equal(stats1.gray, stats2.gray):
+        return False
+    return None
+
+def bound_stage(stats1, stats2, threshold):
+    """
+    Frames whose SSIM lower bound (see `ssim_lower_bound`) already clears
+    the threshold are the same slide, whatever full SSIM would add on top.
+    Everything else is left for full SSIM.
+    """
+    if min(stats1.gray.shape) < WIN_SIZE:
+        return None
+    if ssim_lower_bound(stats1, stats2) >= threshold + BOUND_SLACK:
+        return False
+    return None
+
+def upper_bound_stage(stats1, stats2, threshold):
+    """
+    Frames whose SSIM upper bound (see `ssim_upper_bound`) is already below
+    the threshold are different slides, whatever full SSIM would take off
+    it. Everything else is left for full SSIM.
+    """
+    if min(stats1.gray.shape) < WIN_SIZE:
+        return None
+    if ssim_upper_bound(stats1, stats2) < threshold - BOUND_SLACK:
+        return True
+    return None
+
+DEFAULT_DETECTOR_STAGES = [
+    ('exact', exact_match_stage),
+    ('bound', bound_stage),
+    ('upper_bound', upper_bound_stage),
+]
+
+class ChangeDetector:
+    """
+    Decide whether two consecutive frames belong to different slides.
+
+    Each stage is a `(name, fn)` pair where `fn(stats1, stats2, threshold)`
+    gets the frames' FrameStats and returns True (boundary), False (same
+    slide) or None (can't tell). Pairs no stage could decide fall through to
+    full-resolution SSIM, which is exactly what the SSIM-only path computes.
+    Stages only decide when the answer provably matches full SSIM, so the
+    default stages give the same slides as `stages=[]`.
+
+    The stats of the last `cache_frames` frames are kept, so a frame that
+    is compared once as the new frame and then as the previous one is only
+    converted and filtered once.
+
+    With a `region` (a pixel box x, y, width, height), only that part of
+    each frame is looked at. `ignored` pixel boxes are left out of the
+    comparison instead, so a webcam overlay inside them can't make frames
+    look different while the slide around it is still compared.
+    """
+
+    def __init__(self, threshold, stages=None, cache_frames=2, region=None, ignored=None):
+        self.threshold = threshold
+        self.region = tuple(region) if region is not None else None
+        self.ignored = [tuple(box) for box in ignored] if ignored else None
+        self._mask = None
+        self.stages = DEFAULT_DETECTOR_STAGES if stages is None else stages
+        self.stats = {name: 0 for name, _ in self.stages}
+        self.stats['ssim'] = 0
+        self.seconds = 0.0
+        self._recent = deque(maxlen=cache_frames)
+
+    def frame_stats(self, frame):
+        """
+        FrameStats for `frame`, reused if it is one of the recently seen
+        frame objects.
+        """
+        for i, (cached, stats) in enumerate(self._recent):
+            if cached is frame:
+                del self._recent[i]
+                self._recent.append((cached, stats))
+                return stats
+        compared = crop(frame, self.region)
+        stats = FrameStats(compared, self.mask(compared.shape[:2]) if self.ignored else None)
+        self._recent.append((frame, stats))
+        return stats
+
+    def mask(self, shape):
+        """
+        The Mask of frames of `shape` that leaves the `ignored` boxes out.
+        """
+        if self._mask is None or self._mask.keep.shape != shape:
+            keep = np.ones(shape, dtype=bool)
+            for x, y, width, height in self.ignored:
+                keep[y:y + height, x:x + width] = False
+            self._mask = Mask(keep)
+        return self._mask
+
+    def is_boundary(self, frame1, frame2):
+        started = time.perf_counter()
+        try:
+            return self._is_boundary(frame1, frame2)
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def boundaries(self, pairs):
+        """
+        `is_boundary` for each of many (frame1, frame2) pairs. The stages
+        decide pair by pair; the pairs left over are scored together with
+        `ssim_batch`, one batch per frame size.
+        """
+        started = time.perf_counter()
+        try:
+            decisions = [None] * len(pairs)
+            undecided = {}
+            for i, (frame1, frame2) in enumerate(pairs):
+                if frame1.shape != frame2.shape:
+                    decisions[i] = True
+                    continue
+                stats1 = self.frame_stats(frame1)
+                stats2 = self.frame_stats(frame2)
+                decisions[i] = self._stage_decision(stats1, stats2)
+                if decisions[i] is None:
+                    undecided.setdefault(stats1.gray.shape, []).append((i, stats1, stats2))
+
+            for group in undecided.values():
+                self.stats['ssim'] += len(group)
+                scores = ssim_batch([(stats1, stats2) for _, stats1, stats2 in group])
+                for (i, _, _), score in zip(group, scores):
+                    decisions[i] = bool(score < self.threshold)
+            return decisions
+        finally:
+            self.seconds += time.perf_counter() - started
+
+    def _stage_decision(self, stats1, stats2):
+        for name, stage in self.stages:
+            decision = stage(stats1, stats2, self.threshold)
+            if decision is not None:
+                self.stats[name] += 1
+                return decision
+        return None
+
+    def _is_boundary(self, frame1, frame2):
+        if frame1.shape != frame2.shape:
+            return True
+
+        stats1 = self.frame_stats(frame1)
+        stats2 = self.frame_stats(frame2)
+
+        decision = self._stage_decision(stats1, stats2)
+        if decision is not None:
+            return decision
+
+        self.stats['ssim'] += 1
+        return ssim(stats1, stats2) < self.threshold
+
+def get_video_duration(video_path):
+    """
+    Return the duration of a video in seconds using ffprobe (0 on failure).
+    """
+    try:
+        cmd = [
+            'ffprobe', '-v', 'error', '-show_entries', 
+            'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', 
+            video_path
+        ]
+        return float(subprocess.check_output(cmd).decode('utf-8').strip())
+    except Exception as e:
+        print(f"Error getting duration: {e}")
+        return 0
+
+def get_video_dimensions(video_path):
+    """
+    Return (width, height) of the first video stream using ffprobe, or None.
+    """
+    try:
+        cmd = [
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height', '-of', 'csv=p=0',
+            video_path
+        ]
+        width, height = subprocess.check_output(cmd).decode('utf-8').strip().split(',')[:2]
+        return int(width), int(height)
+    except Exception as e:
+        print(f"Error getting dimensions: {e}")
+        return None
+
+SAMPLING_MODES = ('fps', 'keyframes', 'scene', 'refine')
+
+# each shard is decoded in its own process (and ffmpeg), so more shards than
+# cores only adds processes
+MAX_SHARDS = os.cpu_count() or 1
+# how often a sharded job adds up and reports its shards' progress
+SHARD_PROGRESS_SECONDS = 0.5
+
+# decoder settings for frames that are only analysed: B-frames are skipped
+# (nothing else references them, so the other frames still decode cleanly)
+# and so is the deblocking filter. Several times cheaper on H.264; slides are
+# captured with a normal decode
+FAST_DECODE_OPTIONS = ['-skip_frame', 'bidir', '-skip_loop_filter', 'all']
+
+def iter_video_frames(video_path, interval_seconds, width, height, start=None, end=None, sampling='fps', scene_threshold=0.05,
+                      fast_decode=False, stream=None):
+    """
+    Stream sampled frames out of ffmpeg as raw BGR.
+
+    ffmpeg writes rawvideo to a pipe instead of PNGs to disk. Frames keep
+    their original presentation timestamps, which `showinfo` reports on
+    stderr. Only the frame being yielded is held in memory.
+
+    `sampling` picks which frames become candidates:
+        fps        the first frame of every `interval_seconds` window
+        keyframes  every keyframe; non-key frames are skipped by the decoder
+        scene      the first frame plus every frame whose ffmpeg scene score
+                   exceeds `scene_threshold`
+
+    ('refine' sampling is built on top of this, see `find_slides_refined`.)
+
+    `start`/`end` restrict decoding to [start, end) seconds. The seek keeps
+    the original timestamps (-copyts) so a range sees exactly the frames a
+    full decode would have sampled inside it.
+
+    `fast_decode` decodes with FAST_DECODE_OPTIONS, for frames that are
+    only compared: candidates then come from the frames that are still
+    decoded, at most a few frames later.
+
+    With a `stream` (a DownloadStream), ffmpeg reads the video through a
+    pipe as it is downloaded instead of opening `video_path`. Raises
+    DownloadError once the frames run out if the download failed or
+    stalled.
+
+    Yields:
+        (float, numpy.ndarray): presentation timestamp in seconds and the frame
+    """
+    frame_size = width * height * 3
+    input_options = ['-ss', str(start), '-copyts'] if start else []
+    if sampling != 'keyframes' and fast_decode:
+        input_options += FAST_DECODE_OPTIONS
+    if sampling == 'keyframes':
+        input_options += ['-skip_frame', 'nokey']
+        vf = f"scale={width}:{height},showinfo"
+    elif sampling == 'scene':
+        vf = f"select='isnan(prev_selected_t)+gt(scene,{scene_threshold})',scale={width}:{height},showinfo"
+    else:
+        vf = (
+            f"select='isnan(prev_selected_t)+gte(floor(t/{interval_seconds})-floor(prev_selected_t/{interval_seconds}),1)',"
+            f"scale={width}:{height},showinfo"
+        )
+    cmd = [
+        'ffmpeg', '-hide_banner', '-nostats', *input_options, '-i', video_path if stream is None else 'pipe:0',
+        '-vf', vf, '-vsync', 'vfr', '-an',
+        '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'
+    ]
+    process = subprocess.Popen(cmd, stdin=subprocess.PIPE if stream is not None else None, stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE, bufsize=frame_size)
+
+    # reading the growing file directly would end at the first pause in the
+    # download, so it is fed through stdin by a thread that waits those out
+    feed_errors = []
+
+    def feed():
+        try:
+            stream.feed(process.stdin, wanted=lambda: process.poll() is None)
+        except DownloadError as e:
+            feed_errors.append(e)
+
+    feeder = threading.Thread(target=feed, daemon=True) if stream is not None else None
+    if feeder is not None:
+        feeder.start()
+
+    # showinfo logs each frame before it is written to stdout, so the n-th
+    # pts_time always belongs to the n-th raw frame. stderr has to be drained
+    # on its own thread anyway or ffmpeg blocks once the pipe fills up.
+    timestamps = queue.Queue()
+
+    def read_timestamps():
+        for line in process.stderr:
+            if b'showinfo' in line:
+                match = re.search(rb'pts_time:\s*(-?[0-9.]+)', line)
+                if match:
+                    timestamps.put(float(match.group(1)))
+        timestamps.put(None)
+
+    reader = threading.Thread(target=read_timestamps, daemon=True)
+    reader.start()
+
+    index = 0
+    stderr_done = False
+    try:
+        while True:
+            raw = process.stdout.read(frame_size)
+            if len(raw) < frame_size:
+                # the video may have only looked finished because the
+                # download stopped short
+                if feeder is not None:
+                    feeder.join()
+                if feed_errors:
+                    raise feed_errors[0]
+                break
+
+            timestamp = None
+            if not stderr_done:
+                try:
+                    timestamp = timestamps.get(timeout=5)
+                except queue.Empty:
+                    pass
+                if timestamp is None:
+                    stderr_done = True
+            if timestamp is None:
+                timestamp = (start or 0) + index * interval_seconds
+            index += 1
+
+            if start is not None and timestamp < start:
+                continue
+            if end is not None and timestamp >= end:
+                break
+
+            yield timestamp, np.frombuffer(raw, dtype=np.uint8).reshape((height, width, 3))
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+        reader.join(timeout=1)
+        if feeder is not None:
+            feeder.join(timeout=1)
+
+def find_slides(frames, detector, include_last=True, close_at_boundary=False, end_timestamp=None, resume_from=None):
+    """
+    Walk (timestamp, frame) pairs and yield the last frame of every run of
+    similar frames, as (run timestamp, frame, frame timestamp).
+
+    We track the previous frame in the sequence and yield it when we detect
+    a change – that ensures we keep the final frame of a repeated slide (end
+    of the run) rather than the first frame. The final frame of the last run
+    is only yielded when `include_last` is set.
+
+    A run is stamped with the time of its last frame, or with the time of the
+    frame that ended it if `close_at_boundary` is set (`end_timestamp` for the
+    last run, or what it returns once the frames have run out if it is a
+    function). The latter suits sparse samplers that only emit a frame when
+    something changed, where the last frame is also the first. The frame
+    timestamp is always the time the yielded frame was decoded at.
+
+    `resume_from` is a (timestamp, frame) pair to continue from, as if it
+    had been the last frame of an earlier pass.
+    """
+    prev_timestamp, prev_frame = resume_from if resume_from is not None else (None, None)
+
+    for timestamp, current_frame in frames:
+        if prev_frame is not None and detector.is_boundary(current_frame, prev_frame):
+            # boundary detected: the previous frame ends the previous run
+            yield (timestamp if close_at_boundary else prev_timestamp), prev_frame, prev_timestamp
+
+        # frames come from fresh pipe reads so there is nothing to copy
+        prev_frame = current_frame
+        prev_timestamp = timestamp
+
+    if prev_frame is not None and include_last:
+        if callable(end_timestamp):
+            end_timestamp = end_timestamp()
+        run_end = prev_timestamp
+        if close_at_boundary and end_timestamp is not None:
+            run_end = max(prev_timestamp, end_timestamp)
+        yield run_end, prev_frame, prev_timestamp
+
+def encode_png(frame):
+    """
+    Encode a frame to PNG bytes, byte-for-byte what cv2.imwrite would write.
+    """
+    ok, buffer = cv2.imencode('.png', frame)
+    return buffer.tobytes() if ok else None
+
+OUTPUT_FORMATS = {'png': '.png', 'jpeg': '.jpg', 'webp': '.webp'}
+
+def encode_slide(image, output_format='png', quality=90, max_dimension=None):
+    """
+    Encode a slide, given as a decoded frame or PNG bytes, for output.
+
+    Frames larger than `max_dimension` on their long side are scaled down
+    first. `quality` applies to JPEG and WebP.
+
+    Returns:
+        (bytes, bytes): the file contents and the image to put in the PDF,
+        which is the same buffer except for WebP – img2pdf can't embed WebP,
+        so those pages get a JPEG at the same quality.
+    """
+    if isinstance(image, bytes):
+        if output_format == 'png' and not max_dimension:
+            return image, image
+        image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    height, width = image.shape[:2]
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+    if output_format == 'png':
+        data = encode_png(image)
+        return data, data
+
+    jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+    if output_format == 'jpeg':
+        return jpeg, jpeg
+    webp = cv2.imencode('.webp', image, [cv2.IMWRITE_WEBP_QUALITY, quality])[1].tobytes()
+    return webp, jpeg
+
+class SlideWriter:
+    """
+    Encode and write slides on a small thread pool so detection never waits
+    on image encoding or disk.
+
+    Slides are finished in the order they were found: each one's PDF page is
+    added and `on_written(index, filename, timestamp, progress)` is called
+    once its file is on disk. At most `max_pending` slides are held in
+    memory; submitting more blocks until the oldest is done.
+
+    A slide can also be submitted as a function that returns the image,
+    which is then called on the pool too (see `capture_slide`); the time it
+    takes goes to `capture_seconds`. Every slide also gets a small JPEG
+    thumbnail next to it (see artifacts.py).
+    """
+
+    def __init__(self, output_dir, pdf, output_format='png', quality=90, max_dimension=None,
+                 on_written=None, workers=2, max_pending=4):
+        self.output_dir = output_dir
+        self.pdf = pdf
+        self.output_format = output_format
+        self.quality = quality
+        self.max_dimension = max_dimension
+        self.on_written = on_written
+        self.max_pending = max_pending
+        self.write_seconds = 0.0
+        self.capture_seconds = 0.0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='slide-writer')
+        self._pending = deque()
+
+    def _write(self, filename, thumbnail, image):
+        capture_seconds = 0.0
+        if callable(image):
+            started = time.perf_counter()
+            image = image()
+            capture_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        data, pdf_data = encode_slide(image, self.output_format, self.quality, self.max_dimension)
+        with open(os.path.join(self.output_dir, filename), 'wb') as f:
+            f.write(data)
+        with open(os.path.join(self.output_dir, thumbnail), 'wb') as f:
+            f.write(encode_thumbnail(image))
+        return pdf_data, time.perf_counter() - started, capture_seconds
+
+    def submit(self, index, timestamp, image, progress=None):
+        filename = f"frame_{index}{OUTPUT_FORMATS[self.output_format]}"
+        future = self._pool.submit(self._write, filename, thumbnail_name(index), image)
+        self._pending.append((future, index, filename, timestamp, progress))
+        self._drain(block=len(self._pending) > self.max_pending)
+        return filename
+
+    def _drain(self, block=False):
+        while self._pending and (block or self._pending[0][0].done()):
+            future, index, filename, timestamp, progress = self._pending.popleft()
+            pdf_data, seconds, capture_seconds = future.result()
+            self.write_seconds += seconds
+            self.capture_seconds += capture_seconds
+            self.pdf.add_page(pdf_data)
+            if self.on_written:
+                self.on_written(index, filename, timestamp, progress)
+            block = False
+
+    def flush(self):
+        """
+        Wait for every submitted slide to be written.
+        """
+        while self._pending:
+            self._drain(block=True)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self._pool.shutdown(wait=True)
+
+# seconds of video each shard of the job has decoded, one slot per shard,
+# shared with the parent; set in each pool process by init_shard_worker
+_shard_progress = None
+
+def init_shard_worker(progress):
+    global _shard_progress
+    _shard_progress = progress
+
+def process_shard(video_path, interval_seconds, width, height, start, end, similarity_threshold, sampling='fps',
+                  region=None, fast_decode=False, close_at_boundary=False, ignored=None, slot=None):
+    """
+    Process-pool worker: find the slides inside [start, end) of a video.
+
+    Slides are returned PNG-encoded to keep the result small. The run that
+    is still open at the end of the shard is not closed here, since that
+    depends on the first frame of the next shard; the raw first and last
+    frames are returned so the parent can make that comparison. How far the
+    shard has got goes into its `slot` of the pool's shared progress.
+    """
+    detector = ChangeDetector(similarity_threshold, region=region, ignored=ignored)
+    decode_stats = new_decode_stats()
+    edges = {}
+
+    def frames():
+        decoded = iter_video_frames(video_path, interval_seconds, width, height, start, end, sampling,
+                                    fast_decode=fast_decode)
+        for timestamp, frame in track_decode(decoded, 0, None, decode_stats):
+            edges.setdefault('first', (timestamp, frame))
+            edges['last'] = (timestamp, frame)
+            if slot is not None and _shard_progress is not None:
+                _shard_progress[slot] = timestamp - start
+            yield timestamp, frame
+
+    slides = [
+        (ts, encode_png(frame), decoded_at)
+        for ts, frame, decoded_at in find_slides(frames(), detector, include_last=False,
+                                                 close_at_boundary=close_at_boundary)
+    ]
+    return {
+        'first': edges.get('first'),
+        'last': edges.get('last'),
+        'slides': slides,
+        'stats': detector.stats,
+        'compare_seconds': detector.seconds,
+        'decode_stats': decode_stats
+    }
+
+def shard_ranges(duration, interval_seconds, shards):
+    """
+    Split [0, duration) into `shards` ranges whose edges sit on the sampling
+    grid, so every sampling interval belongs to exactly one shard.
+    """
+    buckets = int(duration // interval_seconds) + 1
+    shards = max(1, min(shards, buckets))
+    edges = [round(i * buckets / shards) * interval_seconds for i in range(shards + 1)]
+    edges[-1] = None
+    return [(edges[i], edges[i + 1]) for i in range(shards)]
+
+def find_slides_sharded(video_path, interval_seconds, width, height, duration, shards, detector, sampling='fps', decode_stats=None,
+                        fast_decode=False, close_at_boundary=False, progress_callback=None):
+    """
+    Same result as `find_slides` over the whole video, but each time range
+    is decoded and compared in its own process.
+
+    Shard results are stitched by comparing the last frame of each shard with
+    the first frame of the next one, which is the only pair the shards never
+    saw. Slides come back as PNG bytes. Scene sampling can't be sharded: a
+    shard has no previous frame to score its first frame against.
+
+    With `close_at_boundary`, runs are stamped as in `find_slides`: a run
+    that is still open at a shard's end closes at the next shard's first
+    frame, and the last one at `duration`.
+
+    While the shards run, `progress_callback(fraction)` gets the share of
+    the video they have decoded between them, every
+    SHARD_PROGRESS_SECONDS.
+    """
+    ranges = shard_ranges(duration, interval_seconds, min(shards, MAX_SHARDS))
+    context = multiprocessing.get_context('spawn')
+    # each slot is only written by its own shard
+    progress = context.Array('d', len(ranges), lock=False)
+
+    with ProcessPoolExecutor(max_workers=min(len(ranges), MAX_SHARDS), mp_context=context,
+                             initializer=init_shard_worker, initargs=(progress,)) as pool:
+        futures = [
+            pool.submit(process_shard, video_path, interval_seconds, width, height, start, end,
+                        similarity_threshold=detector.threshold, sampling=sampling, region=detector.region,
+                        fast_decode=fast_decode, close_at_boundary=close_at_boundary, ignored=detector.ignored,
+                        slot=slot)
+            for slot, (start, end) in enumerate(ranges)
+        ]
+        while True:
+            done, pending = wait(futures, timeout=SHARD_PROGRESS_SECONDS, return_when=FIRST_EXCEPTION)
+            if progress_callback and duration > 0:
+                progress_callback(min(sum(progress) / duration, 1.0))
+            if not pending or any(future.exception() is not None for future in done):
+                break
+        results = [future.result() for future in futures]
+
+    results = [result for result in results if result['first'] is not None]
+    for result in results:
+        for name, count in result['stats'].items():
+            detector.stats[name] = detector.stats.get(name, 0) + count
+        detector.seconds += result['compare_seconds']
+        if decode_stats is not None:
+            for name, value in result['decode_stats'].items():
+                decode_stats[name] += value
+
+    # the pairs across shard edges, decided together
+    edges = detector.boundaries([(results[i + 1]['first'][1], results[i]['last'][1])
+                                 for i in range(len(results) - 1)])
+    for i, result in enumerate(results):
+        yield from result['slides']
+
+        last_timestamp, last_frame = result['last']
+        if i + 1 == len(results):
+            run_end = max(last_timestamp, duration) if close_at_boundary else last_timestamp
+            yield run_end, encode_png(last_frame), last_timestamp
+        elif edges[i]:
+            run_end = results[i + 1]['first'][0] if close_at_boundary else last_timestamp
+            yield run_end, encode_png(last_frame), last_timestamp
+
+def grab_frame(video_path, timestamp, width, height, fast_decode=False):
+    """
+    Decode the first frame at or after `timestamp` with a targeted seek.
+
+    Returns (timestamp, frame) with the frame's real timestamp, or None past
+    the end of the video.
+    """
+    frames = iter_video_frames(video_path, 1, width, height, start=timestamp, fast_decode=fast_decode)
+    try:
+        return next(frames, None)
+    finally:
+        frames.close()
+
+def analysis_size(width, height, analysis_width):
+    """
+    The size to decode a `width` x `height` video at for slide detection:
+    `analysis_width` wide with the same aspect ratio, or None when that
+    wouldn't be any smaller.
+    """
+    if not analysis_width or analysis_width >= width:
+        return None
+    # ffmpeg's scaler wants even dimensions
+    return analysis_width - analysis_width % 2, max(2, round(height * analysis_width / width / 2) * 2)
+
+def capture_slide(video_path, timestamp, width, height, fallback=None):
+    """
+    The frame at `timestamp` decoded at full size with a targeted seek, for
+    a slide that was found on a scaled-down decode. Returns `fallback` when
+    the frame can't be decoded.
+    """
+    # showinfo rounds timestamps, so seek to just before the frame
+    frame = grab_frame(video_path, max(timestamp - 0.001, 0), width, height)
+    return frame[1] if frame is not None else fallback
+
+# roi 'auto' picks the region from this many frames, REGION_GAP seconds
+# apart from the start of the video (8 consecutive pairs), and as many pairs
+# REGION_GAP apart spread over the video
+REGION_FRAMES = 9
+REGION_GAP = 1.0
+
+def sample_frame_pairs(video_path, width, height, duration, count, gap, fast_decode=False):
+    """
+    Grayscale frames `gap` seconds apart at `count` points spread over the
+    video, decoded at `width` x `height` with one targeted seek each.
+    Returns a list of (frame, frame) pairs.
+    """
+    pairs = []
+    for i in range(count):
+        # on the sampling grid, so the second frame is the first one `gap` later
+        timestamp = int(duration * (i + 0.5) / count / gap) * gap
+        frames = iter_video_frames(video_path, gap, width, height, start=timestamp, fast_decode=fast_decode)
+        try:
+            pair = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for _, frame in islice(frames, 2)]
+        finally:
+            frames.close()
+        if len(pair) == 2:
+            pairs.append(tuple(pair))
+    return pairs
+
+def detect_region(video_path, width, height, roi='auto', fast_decode=False, stream=None, duration=0):
+    """
+    The part of a `width` x `height` video that slide detection compares,
+    as (region, ignored): the pixel box frames are cropped to (None for the
+    whole frame) and the pixel boxes left out of it (None for none).
+
+    `roi` is 'full', a box given as fractions of the frame, or 'auto': leave
+    out the cells that change between most of the pairs of either sample
+    (see roi.py). One is the first REGION_FRAMES frames, taken REGION_GAP
+    seconds apart; the other is REGION_FRAMES - 1 pairs spread over the
+    `duration` of the video, for an overlay that only shows up later.
+    Both depend on the video alone, not on how it was read.
+
+    With a `stream` (a DownloadStream) only the start is sampled, as soon
+    as it has arrived. The job calls this again without the stream once
+    the download is complete, and starts over if the answer changed (see
+    RegionChanged).
+    """
+    if roi == 'full':
+        return None, None
+    if roi != 'auto':
+        return region_from_fractions(roi, width, height), None
+    frames = iter_video_frames(video_path, REGION_GAP, width, height, fast_decode=fast_decode, stream=stream)
+    try:
+        gray = [cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for _, frame in islice(frames, REGION_FRAMES)]
+    finally:
+        frames.close()
+    groups = [list(zip(gray, gray[1:]))]
+    if stream is None and duration > 0:
+        groups.append(sample_frame_pairs(video_path, width, height, duration, REGION_FRAMES - 1, REGION_GAP,
+                                         fast_decode))
+    return None, find_ignored(groups, width, height)
+
+# frames of a boundary's window refine_boundary scores together
+REFINE_BATCH = 4
+
+def refine_boundary(video_path, width, height, detector, before, after, precision, decode_stats, fast_decode=False):
+    """
+    Find the change between two sampled frames on different slides.
+
+    The window between them is decoded once, in a single ffmpeg call that
+    keeps the first frame of every `precision` seconds. Those frames are
+    compared in order, REFINE_BATCH pairs at a time, until the first one
+    that shows a new slide; the rest of the window isn't decoded. Returns
+    the last frame of the old slide and the first frame of the new one, as
+    (timestamp, frame) pairs.
+    """
+    window = iter_video_frames(video_path, precision, width, height, start=before[0], end=after[0],
+                               fast_decode=fast_decode)
+    try:
+        frames = (frame for frame in track_decode(window, 0, None, decode_stats) if frame[0] > before[0])
+        while True:
+            batch = list(islice(frames, REFINE_BATCH))
+            if not batch:
+                return before, after
+            previous = [before] + batch[:-1]
+            changed = detector.boundaries([(frame[1], last[1]) for frame, last in zip(batch, previous)])
+            if True in changed:
+                first_new = changed.index(True)
+                return previous[first_new], batch[first_new]
+            before = batch[-1]
+    finally:
+        window.close()
+
+def find_slides_refined(video_path, width, height, duration, interval_seconds, detector, decode_stats,
+                        progress_callback=None, precision=0.25, fast_decode=False):
+    """
+    Coarse-then-refine slide detection.
+
+    The coarse pass samples every `interval_seconds` in one sequential
+    decode, like fps sampling. Each change it sees is then pinned down to
+    within `precision` seconds by `refine_boundary`, which decodes only the
+    window between the two samples again, so slides get sub-second
+    timestamps at about the cost of the coarse pass plus one short decode
+    per change.
+
+    Yields the last frame of every slide, like `find_slides`.
+    """
+    frames = iter_video_frames(video_path, interval_seconds, width, height, fast_decode=fast_decode)
+    try:
+        current = None
+        for candidate in track_decode(frames, duration, progress_callback, decode_stats):
+            if current is not None and detector.is_boundary(candidate[1], current[1]):
+                last_old, first_new = refine_boundary(video_path, width, height, detector, current, candidate,
+                                                      precision, decode_stats, fast_decode)
+                yield last_old[0], last_old[1], last_old[0]
+                current = first_new
+            else:
+                current = candidate
+        if current is not None:
+            yield current[0], current[1], current[0]
+    finally:
+        frames.close()
+
+def new_decode_stats():
+    return {'frames': 0, 'decode_seconds': 0.0}
+
+def track_decode(frames, duration, progress_callback, decode_stats):
+    """
+    Pass frames through, counting them, timing how long each one took to
+    come out of the decoder and reporting how far into the video it got.
+    """
+    iterator = iter(frames)
+    while True:
+        started = time.perf_counter()
+        try:
+            timestamp, frame = next(iterator)
+        except StopIteration:
+            break
+        finally:
+            decode_stats['decode_seconds'] += time.perf_counter() - started
+
+        decode_stats['frames'] += 1
+        if progress_callback and duration > 0:
+            progress_callback(min(timestamp / duration, 1.0))
+        yield timestamp, frame
+
+def until_downloaded(frames, stream, on_downloaded):
+    """
+    Pass frames decoded from a DownloadStream through, calling
+    `on_downloaded()` as soon as the download is complete (at the latest
+    when the frames run out) for work that needs the whole video.
+    """
+    iterator = iter(frames)
+    if not stream.complete:
+        for timestamp, frame in iterator:
+            yield timestamp, frame
+            if stream.complete:
+                break
+    on_downloaded()
+    yield from iterator
+
+def sampling_report(sampling, decode_stats, duration, interval_seconds):
+    """
+    Summarise a job's sampling against what fixed-interval sampling would
+    have produced for the same video. Only the frame counts can be compared
+    without decoding the video twice; benchmark.py runs both modes on the
+    same video and compares their `decode_seconds`.
+    """
+    fps_frames = int(duration // interval_seconds) + 1 if duration > 0 else None
+    return {
+        'mode': sampling,
+        'frames': decode_stats['frames'],
+        'decode_seconds': round(decode_stats['decode_seconds'], 3),
+        'fps_frames': fps_frames,
+        'frame_savings': round(1 - decode_stats['frames'] / fps_frames, 4) if fps_frames else None
+    }
+
+def clear_output_dir(output_dir):
+    """
+    Remove files left in a job's output dir by an earlier run with the same id.
+
+    Outputs may be hard-linked into the result cache, so they are unlinked
+    rather than overwritten in place.
+    """
+    for name in os.listdir(output_dir):
+        path = os.path.join(output_dir, name)
+        if os.path.isfile(path):
+            os.remove(path)
+
+def run_yt_dlp(video_path, output_path):
+    """
+    Download a YouTube video to `output_path` with yt-dlp.
+    """
+    cmd = [
+        'yt-dlp', '-f', 'bestvideo[ext=mp4]',
+        '--merge-output-format', 'mp4',
+        '--output', output_path,
+        video_path
+    ]
+    subprocess.run(cmd, stderr=subprocess.DEVNULL)
+
+
+def pdf_page_from_file(path, output_format='png', quality=90):
+    """
+    The PDF page image for a slide already on disk, as `encode_slide` would
+    have produced it.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if output_format != 'webp':
+        return data
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+def resume_start(timestamp, interval_seconds, sampling):
+    """
+    Where to restart decoding after the frame at `timestamp`. For `fps`
+    sampling this is the next grid line, so the resumed decode samples the
+    same frames an uninterrupted one would have.
+    """
+    if sampling == 'fps':
+        return (int(timestamp // interval_seconds) + 1) * interval_seconds
+    return timestamp
+
+def drop_slides_after(output_dir, count):
+    """
+    Remove slide files (and thumbnails) numbered past `count`, written after
+    the checkpoint being resumed from.
+    """
+    for name in os.listdir(output_dir):
+        match = re.match(r'(?:frame|thumb)_(\d+)\.', name)
+        if match and int(match.group(1)) > count:
+            os.remove(os.path.join(output_dir, name))
+
+def local_video_id(path):
+    """
+    Cache id for a local video file, which changes whenever the file does.
+    """
+    st = os.stat(path)
+    fingerprint = f'{os.path.realpath(path)}:{st.st_size}:{st.st_mtime_ns}'
+    return 'local-' + hashlib.sha256(fingerprint.encode('utf-8')).hexdigest()[:16]
+
+def empty_transcript():
+    """
+    An already resolved transcript future with no cues, for local files.
+    """
+    future = Future()
+    future.set_result([])
+    return future
+
+class Engine:
+    """
+    The slide extraction pipeline, with no web server attached.
+
+    Holds everything a job needs apart from its output dir: downloaded
+    videos, the result cache and the transcript cache under
+    `static_folder`, plus the single-flight groups that let concurrent jobs
+    share a download or an analysis. The Flask app and the batch CLI each
+    build one.
+
+    `downloader(url, output_path)` defaults to yt-dlp and `transcripts` to a
+    YouTube-backed TranscriptStore; pass stand-ins to run offline. Local
+    video files are only accepted with `allow_local_files` and are processed
+    in place, with an empty transcript. Jobs given a checkpoint save their
+    progress at most every `checkpoint_seconds`.
+
+    With `stream_downloads`, serial jobs start decoding a video while it is
+    still downloading (see `stream_download`), giving up on a download that
+    makes no progress for `stall_seconds`.
+    """
+
+    def __init__(self, static_folder, budget_bytes=0, transcripts=None, downloader=None, allow_local_files=False,
+                 checkpoint_seconds=10, stream_downloads=False, stall_seconds=STALL_SECONDS):
+        self.static_folder = static_folder
+        self.result_cache = ResultCache(static_folder, budget_bytes=budget_bytes, version=ALGORITHM_VERSION)
+        self.transcripts = transcripts or TranscriptStore(os.path.join(static_folder, 'transcripts'))
+        self.downloader = downloader or run_yt_dlp
+        self.allow_local_files = allow_local_files
+        self.checkpoint_seconds = checkpoint_seconds
+        self.stream_downloads = stream_downloads
+        self.stall_seconds = stall_seconds
+        # concurrent requests for the same video share one download, and
+        # requests with the same cache key share one analysis
+        self.downloads = SingleFlight()
+        self.analyses = SingleFlight()
+
+    def resolve(self, source):
+        """
+        Return (video id, local path or None) for a YouTube URL or a local
+        file, raising ProcessingError for anything else.
+        """
+        if self.allow_local_files and os.path.isfile(source):
+            return local_video_id(source), source
+        video_id = extract_youtube_id(source)
+        if video_id is None:
+            raise ProcessingError(f'Not a YouTube URL: {source}')
+        return video_id, None
+
+    def download(self, video_path, video_full_path, on_start=None):
+        """
+        Download a YouTube video unless it is already on disk.
+
+        Concurrent calls for the same file share a single download. The
+        video is downloaded to a hidden temp name next to the final path and
+        renamed into place, so a partial download is never mistaken for a
+        cached video. `on_start(path)` is called with that temp name just
+        before the download starts, unless it is another call's download.
+        """
+        def fetch():
+            if os.path.exists(video_full_path):
+                return True
+
+            print(f"Downloading video {video_full_path}...")
+            video_dir, name = os.path.split(video_full_path)
+            os.makedirs(video_dir, exist_ok=True)
+            tmp_path = os.path.join(video_dir, f".{generate_random_string()}.{name}")
+            if on_start:
+                on_start(tmp_path)
+            try:
+                self.downloader(video_path, tmp_path)
+                if not os.path.exists(tmp_path):
+                    return False
+                os.replace(tmp_path, video_full_path)
+                return True
+            finally:
+                # yt-dlp leaves its .part file behind when it gives up
+                for path in (tmp_path, f'{tmp_path}.part'):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+        downloaded, shared = self.downloads.do(video_full_path, fetch)
+        if shared:
+            print(f"Attached to in-flight download of {video_full_path}")
+        return downloaded
+
+    def stream_download(self, video_path, video_full_path, trace):
+        """
+        Start downloading a video in the background and return a
+        DownloadStream to decode it from as it arrives.
+
+        Returns None once the download is done when the video can't be read
+        along with it: the download is another job's, or the file keeps its
+        index at the end. Raises ProcessingError if the download fails or
+        stalls first.
+        """
+        stream = DownloadStream(self.stall_seconds)
+        stream.start(lambda attach: self.download(video_path, video_full_path, on_start=attach))
+        try:
+            if stream.open() and stream.wait_header():
+                print(f"Decoding {video_full_path} while it downloads")
+                return stream
+        except DownloadError as e:
+            stream.close()
+            raise ProcessingError(str(e)) from e
+        stream.close()
+
+        downloaded = stream.result()
+        trace.add('download', stream.download_seconds)
+        if not downloaded:
+            raise ProcessingError('Failed to download video')
+        return None
+
+    def compute(self, video_path, video_id, output_dir, interval_seconds, similarity_threshold, shards, sampling,
+                progress_callback, transcript, on_slide=None, output_format='png', quality=90, max_dimension=None,
+                trace=None, local_path=None, checkpoint=None, resume=None, checkpoint_key=None,
+                collapse_revisits=True, on_revisit=None, roi='auto', analysis_width=None):
+        """
+        Download, decode and compare a video, writing slides, PDF and
+        subtitle groups into `output_dir`.
+
+        `transcript` is a future for the video's transcript cues, fetched
+        while the video downloads and decodes. Slides are encoded in
+        `output_format` and written off-thread; each is added to the PDF as
+        soon as it is written, and `on_slide(index, filename, timestamp,
+        progress)` is called once it is on disk. Stage timings and counters
+        go to `trace`. `local_path` skips the download.
+
+        With `collapse_revisits`, every slide found is looked up in a
+        SlideIndex of the slides kept so far. A slide shown again later is
+        not written a second time; the run is recorded against the original
+        slide and `on_revisit(index, timestamp, progress)` is called instead.
+
+        `roi` picks the part of the frame that is compared, see
+        `detect_region`. Slides are still saved whole.
+
+        With an `analysis_width` narrower than the video, frames are decoded
+        (with the cheaper FAST_DECODE_OPTIONS) and compared at that width,
+        and each new slide is then decoded again at full size with a
+        targeted seek (`capture_slide`) on the writer's threads, so output
+        quality doesn't change.
+
+        With a `checkpoint`, the serial detection loop (fps, keyframes and
+        scene sampling) saves its state every `checkpoint_seconds`: the
+        last frame compared, the slides found so far and the stats. Passing
+        such a state back as `resume` continues from there instead of
+        decoding the video again; sharded and refine jobs start over.
+        `checkpoint_key` is saved along with the state so a checkpoint is
+        only resumed with the settings it was made with.
+
+        Returns the result metadata, raising ProcessingError if the video
+        could not be read.
+        """
+        started = time.perf_counter()
+        trace = trace or JobTrace(None)
+        video_full_path = local_path or os.path.join(self.static_folder, 'videos', f'{video_id}.mp4')
+
+        with self.result_cache.pin(video_full_path), ExitStack() as cleanup:
+            stream = None
+            if local_path is None:
+                # refine and sharded jobs seek all over the video, so they need all of it
+                if self.stream_downloads and sampling != 'refine' and (shards <= 1 or sampling == 'scene') \
+                        and not os.path.exists(video_full_path):
+                    stream = self.stream_download(video_path, video_full_path, trace)
+                if stream is None:
+                    with trace.stage('download'):
+                        downloaded = self.download(video_path, video_full_path)
+                    if not downloaded:
+                        raise ProcessingError('Failed to download video')
+                    self.result_cache.touch(video_full_path)
+                else:
+                    cleanup.callback(stream.close)
+
+                    # on the way out, so a job that fails or starts over part-way still shows its download
+                    @cleanup.callback
+                    def record_download():
+                        trace.add('download', stream.download_seconds)
+                        trace.add('download_wait', stream.wait_seconds)
+            # while streaming, ffmpeg and ffprobe read the download through its link
+            source_path = stream.path if stream is not None else video_full_path
+
+            with trace.stage('ffprobe'):
+                # only an estimate while streaming, for fragmented files; it
+                # is read again once the download is complete
+                duration = get_video_duration(source_path)
+                dimensions = get_video_dimensions(source_path)
+            print(f"Video duration: {timedelta(seconds=duration)}")
+
+            if dimensions is None:
+                raise ProcessingError('Failed to read video')
+            width, height = dimensions
+            analysis = analysis_size(width, height, analysis_width)
+            decode_width, decode_height = analysis or (width, height)
+
+            def check_region():
+                """
+                Pick the region again from the complete video, raising
+                RegionChanged if it isn't the one in use.
+                """
+                nonlocal region_final
+                with trace.stage('roi_detect'):
+                    final = detect_region(video_full_path, decode_width, decode_height, roi,
+                                          fast_decode=analysis is not None, duration=duration)
+                if final != (region, ignored):
+                    raise RegionChanged()
+                region_final = True
+
+            if resume is not None:
+                region = tuple(resume['region']) if resume['region'] is not None else None
+                ignored = [tuple(box) for box in resume['ignored']] if resume.get('ignored') else None
+                region_final = resume.get('region_final', True)
+                if not region_final and stream is None:
+                    check_region()
+            else:
+                try:
+                    with trace.stage('roi_detect'):
+                        region, ignored = detect_region(video_full_path, decode_width, decode_height, roi,
+                                                        fast_decode=analysis is not None, stream=stream,
+                                                        duration=duration)
+                except DownloadError as e:
+                    raise ProcessingError(str(e)) from e
+                # only the start of a video that is still arriving was sampled
+                region_final = stream is None or roi != 'auto'
+            if region is not None:
+                print(f"Comparing region {region} of {decode_width}x{decode_height}")
+            if ignored is not None:
+                print(f"Ignoring {len(ignored)} changing area(s) of {decode_width}x{decode_height}")
+
+            unique_frame_count = 0
+            # the end of every run of one slide, and which slide it showed
+            slide_timestamps = []
+            run_slides = []
+            index = SlideIndex(similarity_threshold) if collapse_revisits else None
+            first_slide_seconds = None
+            pdf = PdfBuilder()
+
+            def on_written(index, filename, timestamp, progress):
+                nonlocal first_slide_seconds
+                if first_slide_seconds is None:
+                    first_slide_seconds = time.perf_counter() - started
+                if on_slide:
+                    on_slide(index, filename, timestamp, progress)
+
+            writer = SlideWriter(output_dir, pdf, output_format, quality, max_dimension, on_written)
+
+            detector = ChangeDetector(similarity_threshold, region=region, ignored=ignored)
+            decode_stats = new_decode_stats()
+            # scene and keyframe sampling emit the first frame of each slide, so
+            # a slide lasts until the next candidate rather than its own timestamp
+            close_at_boundary = sampling in ('scene', 'keyframes')
+            if sampling == 'refine':
+                slides = find_slides_refined(video_full_path, decode_width, decode_height, duration, interval_seconds,
+                                             detector, decode_stats=decode_stats, progress_callback=progress_callback,
+                                             fast_decode=analysis is not None)
+            elif shards > 1 and duration > 0 and sampling != 'scene':
+                slides = find_slides_sharded(video_full_path, interval_seconds, decode_width, decode_height, duration,
+                                             shards, detector, sampling=sampling, decode_stats=decode_stats,
+                                             fast_decode=analysis is not None, close_at_boundary=close_at_boundary,
+                                             progress_callback=progress_callback)
+            else:
+                start = None
+                resume_from = None
+                if resume is not None:
+                    resume_from = (resume['timestamp'],
+                                   cv2.imdecode(np.frombuffer(resume['frame'], dtype=np.uint8), cv2.IMREAD_COLOR))
+                    start = resume_start(resume['timestamp'], interval_seconds, sampling)
+                    slide_timestamps = [timestamp for timestamp, _ in resume['runs']]
+                    run_slides = [slide for _, slide in resume['runs']]
+                    unique_frame_count = resume['slides']
+                    if index is not None:
+                        index = SlideIndex.from_state(resume['index'], similarity_threshold)
+                    for i in range(1, unique_frame_count + 1):
+                        path = os.path.join(output_dir, f'frame_{i}{OUTPUT_FORMATS[output_format]}')
+                        pdf.add_page(pdf_page_from_file(path, output_format, quality))
+                    decode_stats.update(resume['decode_stats'])
+                    detector.stats.update(resume['detector_stats'])
+                    if index is not None:
+                        index.stats.update(resume['index_stats'])
+                    print(f"Resuming at {timedelta(seconds=resume['timestamp'])} with {unique_frame_count} slides")
+
+                def checkpointed(frames, last):
+                    saved_at = time.monotonic()
+                    for timestamp, frame in frames:
+                        if last is not None and timestamp <= last[0]:
+                            continue
+                        if checkpoint is not None and last is not None \
+                                and time.monotonic() - saved_at >= self.checkpoint_seconds:
+                            # every slide found so far came from frames up to `last`,
+                            # so once they are on disk the state is consistent
+                            writer.flush()
+                            checkpoint.save({
+                                'key': checkpoint_key,
+                                'timestamp': last[0],
+                                'frame': encode_png(last[1]),
+                                'slides': unique_frame_count,
+                                'region': region,
+                                'ignored': ignored,
+                                'region_final': region_final,
+                                'runs': [list(run) for run in zip(slide_timestamps, run_slides)],
+                                'index': index.to_state() if index is not None else None,
+                                'index_stats': dict(index.stats) if index is not None else None,
+                                # the frame in hand is counted already but not compared yet
+                                'decode_stats': {**decode_stats, 'frames': decode_stats['frames'] - 1},
+                                'detector_stats': dict(detector.stats)
+                            })
+                            saved_at = time.monotonic()
+                        last = (timestamp, frame)
+                        yield timestamp, frame
+
+                def on_downloaded():
+                    nonlocal duration
+                    self.result_cache.touch(video_full_path)
+                    duration = get_video_duration(video_full_path) or duration
+                    if not region_final:
+                        check_region()
+
+                frames = iter_video_frames(video_full_path, interval_seconds, decode_width, decode_height, start=start,
+                                           sampling=sampling, fast_decode=analysis is not None, stream=stream)
+                frames = track_decode(frames, duration, progress_callback, decode_stats)
+                if stream is not None:
+                    frames = until_downloaded(frames, stream, on_downloaded)
+                frames = checkpointed(frames, resume_from)
+                slides = find_slides(frames, detector, close_at_boundary=close_at_boundary,
+                                     end_timestamp=lambda: duration, resume_from=resume_from)
+
+            try:
+                for timestamp, image, decoded_at in slides:
+                    progress = min(timestamp / duration, 1.0) if duration > 0 else None
+                    revisited = None
+                    if index is not None:
+                        started_lookup = time.perf_counter()
+                        if isinstance(image, bytes):
+                            image = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+                        revisited, entry = index.lookup(detector.frame_stats(image))
+                        if revisited is None:
+                            index.add(entry)
+                        trace.add('revisit_lookup', time.perf_counter() - started_lookup)
+
+                    slide_timestamps.append(timestamp)
+                    if revisited is None:
+                        unique_frame_count += 1
+                        run_slides.append(unique_frame_count)
+                        if analysis is not None:
+                            # the run's timestamp can be the next slide's first frame
+                            image = partial(capture_slide, source_path, decoded_at, width, height, image)
+                        writer.submit(unique_frame_count, timestamp, image, progress)
+                    else:
+                        run_slides.append(revisited + 1)
+                        if on_revisit:
+                            # the original may still be on its way to disk
+                            writer.flush()
+                            on_revisit(revisited + 1, timestamp, progress)
+            except DownloadError as e:
+                raise ProcessingError(str(e)) from e
+            finally:
+                writer.close()
+
+        pdf.save(os.path.join(output_dir, "output.pdf"))
+
+        # decode, compare, write and PDF work interleave, so each is timed where
+        # it happens and added up here
+        trace.add('decode', decode_stats['decode_seconds'])
+        trace.add('compare', detector.seconds)
+        trace.add('image_write', writer.write_seconds)
+        trace.add('capture', writer.capture_seconds)
+        trace.add('pdf_build', pdf.seconds)
+        trace.count('frames_sampled', decode_stats['frames'])
+        trace.count('slides_found', unique_frame_count)
+        trace.count('slides_revisited', len(run_slides) - unique_frame_count)
+
+        # Group subtitles by the runs of each unique frame
+        print(slide_timestamps)
+        subtitle_groups = []
+        subtitles_fetched = False
+
+        try:
+            with trace.stage('transcript_wait'):
+                cues = transcript.result()
+            subtitle_groups = group_subtitles(slide_timestamps, cues, run_slides)
+
+            # Save to JSON file
+            json_path = os.path.join(output_dir, "subtitle_groups.json")
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump(subtitle_groups, f, indent=4, ensure_ascii=False)
+                print(f"Successfully written to JSON file")
+            subtitles_fetched = True
+
+        except Exception as e:
+            print(f"Error processing subtitles: {e}")
+
+        appearances = slide_appearances(slide_timestamps, run_slides)
+        with trace.stage('manifest'):
+            write_manifest(
+                output_dir,
+                [f'frame_{i}{OUTPUT_FORMATS[output_format]}' for i in range(1, unique_frame_count + 1)],
+                appearances,
+                subtitles_file='subtitle_groups.json' if subtitles_fetched else None
+            )
+
+        return {
+            'frames_count': unique_frame_count,
+            'timestamps': slide_timestamps,
+            'run_slides': run_slides,
+            'appearances': appearances,
+            'revisits': len(run_slides) - unique_frame_count,
+            'index_stats': dict(index.stats) if index is not None else None,
+            'region': list(region) if region is not None else None,
+            'ignored': [list(box) for box in ignored] if ignored is not None else None,
+            'analysis_size': list(analysis) if analysis is not None else None,
+            'subtitle_groups': subtitle_groups,
+            'subtitles_fetched': subtitles_fetched,
+            'detector_stats': detector.stats,
+            'sampling': sampling_report(sampling, decode_stats, duration, interval_seconds),
+            'first_slide_seconds': round(first_slide_seconds, 3) if first_slide_seconds is not None else None,
+            'write_seconds': round(writer.write_seconds, 3),
+            'frame_ext': OUTPUT_FORMATS[output_format]
+        }
+
+    def _can_resume(self, resume, cache_key, output_dir, output_format):
+        """
+        Whether a saved state can be continued in `output_dir`: it was made
+        with the same settings, its slides are all still there, and no
+        finished result has turned up in the cache in the meantime.
+        """
+        if resume.get('key') != cache_key or not resume.get('frame'):
+            return False
+        if os.path.exists(os.path.join(self.result_cache.entry_dir(cache_key), 'result.json')):
+            return False
+        return all(
+            os.path.exists(os.path.join(output_dir, f'frame_{i}{OUTPUT_FORMATS[output_format]}'))
+            for i in range(1, resume['slides'] + 1)
+        )
+
+    def process(self, video_path, output_dir, interval_seconds=10, similarity_threshold=0.95, shards=1,
+                sampling='fps', language='en', output_format='png', quality=90, max_dimension=None,
+                progress_callback=None, on_slide=None, trace=None, checkpoint=None, collapse_revisits=True,
+                on_revisit=None, roi='auto', analysis_width=None):
+        """
+        Run one job end to end: slides, PDF and subtitle groups for
+        `video_path` end up in `output_dir`, served from the result cache
+        when the same video was already processed with the same settings.
+
+        `checkpoint` is an object with `load()` and `save(state)`; the job
+        saves its progress there and, if it holds a state from an
+        interrupted run with the same settings, picks up from it.
+
+        Returns the result metadata; raises ProcessingError when the video
+        can't be downloaded or read.
+        """
+        trace = trace or JobTrace(None)
+        video_id, local_path = self.resolve(video_path)
+        os.makedirs(output_dir, exist_ok=True)
+
+        # shards only change how the work is split, not the result
+        cache_key = self.result_cache.key(
+            video_id,
+            interval=interval_seconds,
+            threshold=similarity_threshold,
+            sampling=sampling,
+            language=language,
+            output_format=output_format,
+            quality=quality if output_format != 'png' else None,
+            max_dimension=max_dimension,
+            collapse_revisits=collapse_revisits,
+            roi=roi,
+            analysis_width=analysis_width
+        )
+
+        resume = checkpoint.load() if checkpoint is not None else None
+        if resume is not None and not self._can_resume(resume, cache_key, output_dir, output_format):
+            resume = None
+        if resume is None:
+            clear_output_dir(output_dir)
+        else:
+            drop_slides_after(output_dir, resume['slides'])
+
+        def analyze():
+            result = self.result_cache.restore(cache_key, output_dir)
+            if result is not None:
+                print(f"Serving cached result for {video_id} ({cache_key})")
+                return result, output_dir
+
+            if local_path is None:
+                fetch_started = time.perf_counter()
+                transcript = self.transcripts.prefetch(video_id, language)
+                transcript.add_done_callback(lambda _: trace.add('transcript_fetch', time.perf_counter() - fetch_started))
+            else:
+                transcript = empty_transcript()
+
+            def compute(resume):
+                return self.compute(
+                    video_path, video_id, output_dir,
+                    interval_seconds=interval_seconds,
+                    similarity_threshold=similarity_threshold,
+                    shards=shards,
+                    sampling=sampling,
+                    progress_callback=progress_callback,
+                    transcript=transcript,
+                    on_slide=on_slide,
+                    output_format=output_format,
+                    quality=quality,
+                    max_dimension=max_dimension,
+                    trace=trace,
+                    local_path=local_path,
+                    checkpoint=checkpoint,
+                    resume=resume,
+                    checkpoint_key=cache_key,
+                    collapse_revisits=collapse_revisits,
+                    on_revisit=on_revisit,
+                    roi=roi,
+                    analysis_width=analysis_width
+                )
+
+            try:
+                result = compute(resume)
+            except RegionChanged:
+                print(f"Region of {video_id} changed once all of it was there; starting over")
+                trace.count('region_restarts')
+                clear_output_dir(output_dir)
+                result = compute(None)
+            # a failed transcript fetch may be transient, so don't pin it in the cache
+            if result['subtitles_fetched']:
+                self.result_cache.store(cache_key, output_dir, result)
+            return result, output_dir
+
+        with self.result_cache.pin(output_dir):
+            (result, source_dir), shared = self.analyses.do(cache_key, analyze)
+
+            if shared:
+                # another job just produced this result; take a copy of its outputs
+                print(f"Attached to in-flight analysis of {video_id} ({cache_key})")
+                clear_output_dir(output_dir)
+                with self.result_cache.pin(source_dir):
+                    for name in os.listdir(source_dir):
+                        if os.path.isfile(os.path.join(source_dir, name)):
+                            link_or_copy(os.path.join(source_dir, name), os.path.join(output_dir, name))
+
+        self.result_cache.enforce_budget()
+        return result
@@ -0,0 +1,27 @@
+"""
+Production server settings, read by `gunicorn app:app`.
+
+Every worker process runs its own job workers. Socket.IO events reach
+clients on other processes through SOCKETIO_MESSAGE_QUEUE, and job state is
+shared through the job store, so set the queue whenever WEB_CONCURRENCY is
+above 1. Clients must connect with the websocket transport: gunicorn does
+not route long-polling requests back to the same process.
+"""
+import os
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+# one thread per open websocket, plus the job workers' background threads
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', 100))
+# each worker imports the app and runs its own heartbeat, job workers and
+# outbox sender, so it's not imported once in the master
+preload_app = False
+timeout = 60
+graceful_timeout = 30
+accesslog = '-'
+
+
+def post_worker_init(worker):
+    from app import start_server
+    start_server()
@@ -0,0 +1,277 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    checkpoint TEXT,
+    checkpoint_frame BLOB,
+    owner TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    owner TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS process_stats (
+    owner TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stats TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (owner, name)
+);
+'''
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+def new_owner():
+    """
+    Identity of this server process as a job owner: host, pid and a random
+    token, since pids are reused.
+    """
+    return f'{socket.gethostname()}:{os.getpid()}:{os.urandom(4).hex()}'
+
+
+def owner_is_dead(owner, current):
+    """
+    Whether `owner` is known to be gone without waiting for its heartbeat to
+    go stale: a process on this host whose pid no longer exists, or whose
+    pid is now ours. Owners on other hosts are never known dead.
+    """
+    try:
+        host, pid, _ = owner.rsplit(':', 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return True
+    if host != socket.gethostname():
+        return False
+    if pid == os.getpid():
+        return owner != current
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+
+class JobStore:
+    """
+    SQLite record of every job's parameters, state and latest checkpoint.
+
+    Several server processes can share one store. Each active job has an
+    `owner`, the process running it, and every process records a heartbeat.
+    Jobs whose owner stopped heartbeating, or has exited, are taken over
+    with `claim_orphans()` and submitted again; the claim is atomic, so
+    exactly one process resumes each job. A job's checkpoint is a JSON
+    document plus one image blob, replaced wholesale on every save and
+    dropped once the job finishes.
+
+    Processes also save their running totals (metrics, cache and outbox
+    counters) here with `save_stats`, so any of them can report the totals
+    of all of them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    cursor = conn.execute(sql, args)
+                    return cursor.fetchall(), cursor.rowcount
+            finally:
+                conn.close()
+
+    def add(self, job_id, params, priority=0, owner=None):
+        """
+        Record a newly queued job run by `owner`. Raises ValueError if a job
+        with the same id is still queued or running.
+        """
+        now = time.time()
+        _, changed = self._execute(
+            '''INSERT INTO jobs (job_id, params, priority, state, owner, created_at, updated_at)
+               VALUES (?, ?, ?, 'queued', ?, ?, ?)
+               ON CONFLICT(job_id) DO UPDATE SET
+                   params = excluded.params, priority = excluded.priority, state = 'queued',
+                   error = NULL, attempts = 0, checkpoint = NULL, checkpoint_frame = NULL,
+                   owner = excluded.owner, progress = 0,
+                   created_at = excluded.created_at, updated_at = excluded.updated_at
+               WHERE jobs.state NOT IN ('queued', 'running')''',
+            (job_id, json.dumps(params), priority, owner, now, now)
+        )
+        if not changed:
+            raise ValueError(f"Job {job_id} is already queued or running")
+
+    def remove(self, job_id):
+        self._execute('DELETE FROM jobs WHERE job_id = ?', (job_id,))
+
+    def set_state(self, job_id, state, error=None):
+        """
+        Move a job to `state`. Finished jobs lose their checkpoint.
+        """
+        if state in ACTIVE_STATES:
+            self._execute('UPDATE jobs SET state = ?, updated_at = ? WHERE job_id = ?',
+                          (state, time.time(), job_id))
+        else:
+            self._execute(
+                '''UPDATE jobs SET state = ?, error = ?, checkpoint = NULL, checkpoint_frame = NULL,
+                   progress = CASE WHEN ? = 'completed' THEN 1 ELSE progress END,
+                   updated_at = ? WHERE job_id = ?''',
+                (state, error, state, time.time(), job_id)
+            )
+
+    def set_progress(self, job_id, fraction):
+        self._execute('UPDATE jobs SET progress = ?, updated_at = ? WHERE job_id = ?',
+                      (fraction, time.time(), job_id))
+
+    def get(self, job_id):
+        rows, _ = self._execute(
+            '''SELECT job_id, params, priority, state, error, attempts, owner, progress, created_at, updated_at
+               FROM jobs WHERE job_id = ?''',
+            (job_id,)
+        )
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def heartbeat(self, owner):
+        """
+        Record that `owner` is alive, and forget owners silent for a day.
+        """
+        now = time.time()
+        self._execute('INSERT INTO workers (owner, heartbeat_at) VALUES (?, ?) '
+                      'ON CONFLICT(owner) DO UPDATE SET heartbeat_at = excluded.heartbeat_at', (owner, now))
+        self._execute('DELETE FROM workers WHERE heartbeat_at < ?', (now - 86400,))
+
+    def claim_orphans(self, owner, stale_after):
+        """
+        Take over every queued or running job whose owner has exited or
+        hasn't heartbeated for `stale_after` seconds, counting an attempt on
+        each. Returns the claimed jobs, oldest first, as
+        (job_id, params, priority, attempts).
+
+        Runs in one write transaction, so two processes never claim the
+        same job.
+        """
+        cutoff = time.time() - stale_after
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    rows = conn.execute(
+                        """SELECT jobs.job_id, jobs.params, jobs.priority, jobs.attempts, jobs.owner,
+                                  COALESCE(workers.heartbeat_at, jobs.updated_at) AS seen_at
+                           FROM jobs LEFT JOIN workers ON workers.owner = jobs.owner
+                           WHERE jobs.state IN ('queued', 'running') AND jobs.owner IS NOT ?
+                           ORDER BY jobs.created_at""",
+                        (owner,)
+                    ).fetchall()
+                    claimed = []
+                    for row in rows:
+                        if row['seen_at'] >= cutoff and not owner_is_dead(row['owner'], owner):
+                            continue
+                        conn.execute('UPDATE jobs SET owner = ?, attempts = attempts + 1, updated_at = ? WHERE job_id = ?',
+                                     (owner, time.time(), row['job_id']))
+                        claimed.append((row['job_id'], json.loads(row['params']), row['priority'], row['attempts'] + 1))
+                    return claimed
+            finally:
+                conn.close()
+
+    def save_stats(self, owner, stats):
+        """
+        Replace `owner`'s saved totals with `stats`, a dict of JSON-safe
+        values by name.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO process_stats (owner, name, stats, updated_at) VALUES (?, ?, ?, ?) '
+                        'ON CONFLICT(owner, name) DO UPDATE SET stats = excluded.stats, updated_at = excluded.updated_at',
+                        [(owner, name, json.dumps(value), now) for name, value in stats.items()]
+                    )
+            finally:
+                conn.close()
+
+    def other_stats(self, owner, name):
+        """
+        The `name` totals last saved by every process but `owner`, those
+        that have since exited included, so totals never go down when a
+        worker is replaced.
+        """
+        rows, _ = self._execute('SELECT stats FROM process_stats WHERE name = ? AND owner != ?', (name, owner))
+        return [json.loads(row['stats']) for row in rows]
+
+    def save_checkpoint(self, job_id, state, frame=None):
+        self._execute(
+            'UPDATE jobs SET checkpoint = ?, checkpoint_frame = ?, updated_at = ? WHERE job_id = ?',
+            (json.dumps(state), frame, time.time(), job_id)
+        )
+
+    def load_checkpoint(self, job_id):
+        """
+        Returns (state, frame bytes), or None if the job has no checkpoint.
+        """
+        rows, _ = self._execute('SELECT checkpoint, checkpoint_frame FROM jobs WHERE job_id = ?', (job_id,))
+        if not rows or rows[0]['checkpoint'] is None:
+            return None
+        return json.loads(rows[0]['checkpoint']), rows[0]['checkpoint_frame']
+
+    def checkpoint(self, job_id):
+        return JobCheckpoint(self, job_id)
+
+
+class JobCheckpoint:
+    """
+    The checkpoint of one job, in the `load()`/`save(state)` form the engine
+    takes. A state's 'frame' entry (image bytes) goes into the blob column.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def load(self):
+        saved = self.store.load_checkpoint(self.job_id)
+        if saved is None:
+            return None
+        state, frame = saved
+        return {**state, 'frame': frame}
+
+    def save(self, state):
+        state = dict(state)
+        frame = state.pop('frame', None)
+        self.store.save_checkpoint(self.job_id, state, frame)
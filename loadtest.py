@@ -0,0 +1,222 @@
+"""
+Load test for the multi-process server.
+
+Starts the stand-in broker and gunicorn with each given number of worker
+processes, then has concurrent Socket.IO clients submit jobs over REST and
+wait for `processing_complete`. Every client is connected over websocket to
+whichever process gunicorn hands it, and submits to whichever process takes
+the POST, so completion events usually cross the message queue.
+
+    python loadtest.py --workers 1,2,4 --clients 8 --jobs-per-client 2
+
+Videos are synthetic (see benchmark.py) and seeded into the server's static
+folder along with empty transcripts, so nothing is downloaded. Each job uses
+a slightly different threshold to miss the result cache. Throughput only
+grows with worker processes as far as there are CPU cores to run them.
+"""
+import argparse
+import json
+import math
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+import socketio
+
+from benchmark import make_video
+
+COMPILE_HEADER = 'loadtest'
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Nothing listening on port {port} after {timeout}s')
+
+
+def seed_videos(static_folder, count, duration):
+    """
+    Render `count` synthetic videos into the static folder as if they had
+    been downloaded, with empty cached transcripts. Returns their URLs.
+    """
+    os.makedirs(os.path.join(static_folder, 'videos'), exist_ok=True)
+    os.makedirs(os.path.join(static_folder, 'transcripts'), exist_ok=True)
+    urls = []
+    for i in range(count):
+        video_id = f'loadtest{i:03d}'
+        make_video(os.path.join(static_folder, 'videos', f'{video_id}.mp4'), 'lecture', duration, seed=i)
+        with open(os.path.join(static_folder, 'transcripts', f'{video_id}.en.json'), 'w', encoding='utf-8') as f:
+            json.dump([], f)
+        urls.append(f'https://www.youtube.com/watch?v={video_id}')
+    return urls
+
+
+def start_server(workers, static_folder, broker_url, port, job_workers):
+    env = {
+        **os.environ,
+        'STATIC_FOLDER': static_folder,
+        'SOCKETIO_MESSAGE_QUEUE': broker_url,
+        'WEB_CONCURRENCY': str(workers),
+        'BIND': f'127.0.0.1:{port}',
+        'WORKER_COUNT': str(job_workers),
+        'MAX_QUEUED_JOBS': '1000',
+        'DISK_BUDGET_GB': '0',
+        'X_COMPILE_REQUEST_HEADER': COMPILE_HEADER,
+        'COMPLETION_CONFIRMATION_ENDPOINT': 'http://127.0.0.1:9/unused',
+        'RESUME_JOBS': '0'
+    }
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py', 'app:app'],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    wait_for_port(port)
+    return server
+
+
+def run_client(base_url, jobs, results, timeout):
+    """
+    Submit `jobs` one after another and wait for each to complete.
+    """
+    finished = {}
+    done = threading.Condition()
+    sio = socketio.Client()
+
+    @sio.on('processing_complete')
+    def on_complete(data):
+        with done:
+            finished[data['video_id']] = ('completed', time.perf_counter())
+            done.notify_all()
+
+    @sio.on('processing_error')
+    def on_error(data):
+        # errors don't say which job they are about; only one is in flight
+        with done:
+            finished[None] = ('failed', time.perf_counter())
+            done.notify_all()
+
+    # long-polling needs sticky sessions, which gunicorn doesn't do
+    sio.connect(base_url, transports=['websocket'])
+    try:
+        for body in jobs:
+            started = time.perf_counter()
+            response = requests.post(f'{base_url}/compile', json={**body, 'socket_id': sio.get_sid()},
+                                     headers={'X-Compile-Request-Header': COMPILE_HEADER}, timeout=30)
+            response.raise_for_status()
+            job_id = response.json()['job_id']
+            with done:
+                done.wait_for(lambda: job_id in finished or None in finished, timeout=timeout)
+                state, ended = finished.pop(job_id, None) or finished.pop(None, ('timeout', time.perf_counter()))
+            results.append({'job_id': job_id, 'state': state, 'latency': ended - started})
+    finally:
+        sio.disconnect()
+
+
+def run_round(workers, urls, args, static_folder, broker_url):
+    port = free_port()
+    server = start_server(workers, static_folder, broker_url, port, args.job_workers)
+    base_url = f'http://127.0.0.1:{port}'
+    # a distinct threshold per job, so none is answered from the result cache
+    offset = workers * 10000
+    plans = [[] for _ in range(args.clients)]
+    for n in range(args.clients * args.jobs_per_client):
+        plans[n % args.clients].append({
+            'video_path': urls[n % len(urls)],
+            'interval': args.interval,
+            'threshold': 0.95 + (offset + n) * 1e-7
+        })
+
+    results = []
+    try:
+        started = time.perf_counter()
+        threads = [threading.Thread(target=run_client, args=(base_url, plan, results, args.timeout)) for plan in plans]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    completed = [r['latency'] for r in results if r['state'] == 'completed']
+    latencies = sorted(completed)
+    return {
+        'workers': workers,
+        'jobs': len(results),
+        'completed': len(completed),
+        'failed': len(results) - len(completed),
+        'wall_seconds': round(wall, 3),
+        'jobs_per_second': round(len(completed) / wall, 3),
+        'latency_p50': round(statistics.median(latencies), 3) if latencies else None,
+        # nearest rank, so it's never below the median on a handful of jobs
+        'latency_p95': round(latencies[math.ceil(0.95 * len(latencies)) - 1], 3) if latencies else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure job throughput against the number of server processes.')
+    parser.add_argument('--workers', default='1,2,4', help='comma-separated server process counts')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent Socket.IO clients')
+    parser.add_argument('--jobs-per-client', type=int, default=2)
+    parser.add_argument('--job-workers', type=int, default=2, help='WORKER_COUNT in each server process')
+    parser.add_argument('--videos', type=int, default=4, help='synthetic videos to rotate through')
+    parser.add_argument('--duration', type=float, default=120, help='length of each video in seconds')
+    parser.add_argument('--interval', type=float, default=1)
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for one job')
+    parser.add_argument('--out', default='loadtest_results.json')
+    args = parser.parse_args()
+
+    from dev_broker import BrokerServer
+    broker = BrokerServer(('127.0.0.1', free_port()))
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+    broker_url = f'redis://127.0.0.1:{broker.server_address[1]}/0'
+
+    workdir = tempfile.mkdtemp(prefix='v2s-loadtest-')
+    static_folder = os.path.join(workdir, 'static')
+    try:
+        print(f'Rendering {args.videos} videos...')
+        urls = seed_videos(static_folder, args.videos, args.duration)
+
+        rounds = []
+        for workers in [int(w) for w in args.workers.split(',')]:
+            print(f'{workers} worker process(es), {args.clients} clients...')
+            result = run_round(workers, urls, args, static_folder, broker_url)
+            rounds.append(result)
+            print(f"  {result['completed']}/{result['jobs']} jobs in {result['wall_seconds']}s: "
+                  f"{result['jobs_per_second']} jobs/s, p50 {result['latency_p50']}s, p95 {result['latency_p95']}s")
+    finally:
+        broker.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    base = rounds[0]['jobs_per_second'] or None
+    for result in rounds:
+        result['speedup'] = round(result['jobs_per_second'] / base, 2) if base else None
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump({'config': {**vars(args), 'cpu_count': os.cpu_count()}, 'results': rounds}, f, indent=4)
+    print(f'Results written to {args.out}')
+
+    if any(result['failed'] for result in rounds):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
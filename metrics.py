@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+
+class JobTrace:
+    """
+    Per-job record of time spent in each pipeline stage plus a few counters.
+
+    Stages can be timed more than once (or from other threads) and add up.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.started_at = time.time()
+        self.stages = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'job_id': self.job_id,
+                'started_at': self.started_at,
+                'wall_seconds': round(time.time() - self.started_at, 4),
+                'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                'counters': dict(self.counters)
+            }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class MetricsRegistry:
+    """
+    Aggregates job traces into Prometheus histograms and counters, and
+    renders them along with gauges read at scrape time.
+
+    Each process only sees its own jobs. Server processes behind one port
+    save `to_state()` somewhere shared and pass the others' states to
+    `render`, which adds them up.
+    """
+
+    def __init__(self, prefix='video2slides'):
+        self.prefix = prefix
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, fn, kind='gauge'):
+        """
+        Register a metric whose value is `fn()` at scrape time. Use
+        kind='counter' for running totals kept elsewhere.
+        """
+        self._gauges[name] = (fn, kind)
+
+    def record_job(self, trace, status):
+        """
+        Fold a finished job's trace into the aggregates.
+        """
+        data = trace.to_dict()
+        self.inc('jobs_total', status=status)
+        self.observe('job_seconds', data['wall_seconds'], status=status)
+        for stage, seconds in data['stages'].items():
+            self.observe('stage_seconds', seconds, stage=stage)
+        for counter, value in data['counters'].items():
+            self.inc(f'{counter}_total', value)
+
+    def to_state(self):
+        """
+        The histograms and counters as JSON-safe lists, for `render` in
+        another process.
+        """
+        with self._lock:
+            return {
+                'histograms': [[name, [list(label) for label in labels], list(h.buckets), list(h.counts), h.sum, h.count]
+                               for (name, labels), h in self._histograms.items()],
+                'counters': [[name, [list(label) for label in labels], value]
+                             for (name, labels), value in self._counters.items()]
+            }
+
+    def _combined(self, others):
+        """
+        This process's histograms and counters plus those of `others`
+        (states from `to_state`).
+        """
+        histograms = {}
+        counters = {}
+        for state in (self.to_state(), *others):
+            for name, labels, buckets, counts, total, count in state['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = histograms.setdefault(key, Histogram(tuple(buckets)))
+                # saved by a process that used other buckets
+                if list(histogram.buckets) != list(buckets):
+                    continue
+                histogram.counts = [a + b for a, b in zip(histogram.counts, counts)]
+                histogram.sum += total
+                histogram.count += count
+            for name, labels, value in state['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                counters[key] = counters.get(key, 0) + value
+        return histograms, counters
+
+    def render(self, others=()):
+        """
+        Prometheus text exposition format, adding in the histograms and
+        counters of `others` (states from other processes' `to_state`).
+        """
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name in seen:
+                return
+            seen.add(name)
+            full = f'{self.prefix}_{name}'
+            if name in self._help:
+                lines.append(f'# HELP {full} {self._help[name]}')
+            lines.append(f'# TYPE {full} {kind}')
+
+        histograms, counters = self._combined(others)
+        for (name, labels), histogram in sorted(histograms.items()):
+            header(name, 'histogram')
+            full = f'{self.prefix}_{name}'
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f'{full}_bucket{_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{full}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.count}')
+            lines.append(f'{full}_sum{_labels(labels)} {histogram.sum}')
+            lines.append(f'{full}_count{_labels(labels)} {histogram.count}')
+
+        for (name, labels), value in sorted(counters.items()):
+            header(name, 'counter')
+            lines.append(f'{self.prefix}_{name}{_labels(labels)} {value}')
+
+        for name, (fn, kind) in sorted(self._gauges.items()):
+            header(name, kind)
+            lines.append(f'{self.prefix}_{name} {fn()}')
+
+        return '\n'.join(lines) + '\n'
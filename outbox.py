@@ -0,0 +1,232 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+'''
+
+# worth another try; other 4xx responses won't change on retry
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+class Outbox:
+    """
+    Durable queue of completion callbacks, delivered by one background
+    sender so job workers never wait on the downstream API.
+
+    `enqueue` stores the payload in SQLite and returns at once. The sender
+    POSTs pending payloads over one keep-alive session. Failures are retried
+    with exponential backoff and jitter, honouring `Retry-After`. After
+    `max_attempts`, or on a 4xx that retrying won't fix, a payload is kept
+    as a dead letter with its last error instead of being dropped.
+    Delivered payloads are deleted. Anything still pending when the process
+    stops is sent after the next start.
+
+    Payloads are JSON lists. With `batch_size` > 1, payloads that are due
+    together are concatenated into one request. Several processes can share
+    one outbox file; each payload is leased to one sender at a time.
+    """
+
+    def __init__(self, path, endpoint, headers=None, session=None, timeout=15, max_attempts=8,
+                 base_delay=2.0, max_delay=600.0, batch_size=1, spawn=None):
+        self.path = path
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.batch_size = max(1, batch_size)
+        self.stats = {'sent': 0, 'requests': 0, 'failures': 0, 'dead': 0}
+        self._spawn = spawn or self._spawn_thread
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+
+        self.session = session or requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.headers.update({'Content-Type': 'application/json', **(headers or {})})
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(SCHEMA)
+
+    @staticmethod
+    def _spawn_thread(target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    cursor = conn.execute(sql, args)
+                    return cursor.fetchall(), cursor.lastrowid
+            finally:
+                conn.close()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._spawn(self._run)
+
+    def enqueue(self, payload):
+        """
+        Persist `payload` for delivery and return its id without waiting.
+        """
+        now = time.time()
+        _, row_id = self._execute(
+            'INSERT INTO outbox (payload, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?)',
+            (json.dumps(payload), now, now, now)
+        )
+        self.start()
+        self._wake.set()
+        return row_id
+
+    def _claim_due(self):
+        """
+        Pending payloads that are due, leased to this sender by pushing
+        their next attempt past the request timeout. Other processes sharing
+        the outbox skip leased rows, and a lease left by a sender that died
+        mid-request simply expires.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    rows = conn.execute(
+                        "SELECT id, payload, attempts FROM outbox WHERE state = 'pending' AND next_attempt_at <= ? "
+                        "ORDER BY next_attempt_at, id LIMIT ?",
+                        (now, self.batch_size)
+                    ).fetchall()
+                    ids = [row['id'] for row in rows]
+                    if ids:
+                        conn.execute(f"UPDATE outbox SET next_attempt_at = ? WHERE id IN ({','.join('?' * len(ids))})",
+                                     (now + self.timeout + 30, *ids))
+                    return rows
+            finally:
+                conn.close()
+
+    def _next_due_in(self):
+        rows, _ = self._execute("SELECT MIN(next_attempt_at) AS due FROM outbox WHERE state = 'pending'")
+        due = rows[0]['due']
+        return None if due is None else max(0.0, due - time.time())
+
+    def _post(self, body):
+        """
+        Returns (delivered, retryable, error message, Retry-After seconds).
+        """
+        try:
+            response = self.session.post(self.endpoint, data=body, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            return False, True, f'{type(e).__name__}: {e}', None
+
+        if 200 <= response.status_code < 300:
+            return True, False, None, None
+        retry_after = response.headers.get('Retry-After')
+        retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+        retryable = response.status_code >= 500 or response.status_code in RETRYABLE_STATUS
+        return False, retryable, f'{response.status_code} - {response.text[:200]}', retry_after
+
+    def _backoff(self, attempts, retry_after=None):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)
+        return max(delay, retry_after or 0)
+
+    def send_due(self):
+        """
+        Deliver one batch of due payloads. Returns how many were attempted.
+        """
+        rows = self._claim_due()
+        if not rows:
+            return 0
+
+        body = json.dumps([item for row in rows for item in json.loads(row['payload'])])
+        delivered, retryable, error, retry_after = self._post(body)
+        self.stats['requests'] += 1
+        ids = [row['id'] for row in rows]
+
+        if delivered:
+            self._execute(f"DELETE FROM outbox WHERE id IN ({','.join('?' * len(ids))})", ids)
+            self.stats['sent'] += len(ids)
+            print(f"Sent {len(ids)} completion confirmation(s)")
+            return len(rows)
+
+        self.stats['failures'] += 1
+        now = time.time()
+        for row in rows:
+            attempts = row['attempts'] + 1
+            if not retryable or attempts >= self.max_attempts:
+                print(f"Giving up on completion confirmation {row['id']} after {attempts} attempt(s): {error}")
+                self._execute(
+                    "UPDATE outbox SET state = 'dead', attempts = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                    (attempts, error, now, row['id'])
+                )
+                self.stats['dead'] += 1
+            else:
+                delay = self._backoff(attempts, retry_after)
+                print(f"Completion confirmation {row['id']} failed ({error}), retrying in {delay:.1f}s")
+                self._execute(
+                    'UPDATE outbox SET attempts = ?, last_error = ?, next_attempt_at = ?, updated_at = ? WHERE id = ?',
+                    (attempts, error, now + delay, now, row['id'])
+                )
+        return len(rows)
+
+    def _run(self):
+        while True:
+            try:
+                if self.send_due():
+                    continue
+                wait = self._next_due_in()
+            except Exception as e:
+                print(f"Outbox sender error: {e}")
+                wait = self.base_delay
+            self._wake.wait(timeout=60 if wait is None else min(wait, 60))
+            self._wake.clear()
+
+    def counts(self):
+        rows, _ = self._execute('SELECT state, COUNT(*) AS n FROM outbox GROUP BY state')
+        counts = {'pending': 0, 'dead': 0}
+        counts.update({row['state']: row['n'] for row in rows})
+        return counts
+
+    def dead_letters(self, limit=50):
+        rows, _ = self._execute(
+            "SELECT id, payload, attempts, last_error, created_at, updated_at FROM outbox WHERE state = 'dead' "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (limit,)
+        )
+        return [{**dict(row), 'payload': json.loads(row['payload'])} for row in rows]
+
+    def report(self):
+        return {**self.stats, **self.counts(), 'dead_letters': self.dead_letters(10)}
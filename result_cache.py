@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no flock (Windows): pins only hold within one process
+    fcntl = None
+
+
+def link_or_copy(src, dst):
+    """
+    Hard-link `src` to `dst` (replacing `dst`), falling back to a copy when
+    linking isn't possible, e.g. across filesystems.
+    """
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ResultCache:
+    """
+    Content-addressed store of finished job outputs, plus one disk budget
+    covering everything under the static folder.
+
+    Entries live in `<static>/cache/<key>/` and are keyed on the YouTube id,
+    every parameter that changes the output and the algorithm version, so a
+    repeat request can be answered by linking the stored files into the new
+    job's output dir. Files are hard-linked in both directions, so a job dir
+    and its cache entry share disk until one of them is evicted.
+
+    The budget spans downloaded videos (`<static>/videos/*`), cached
+    transcripts, cache entries and per-job output dirs, evicting the least
+    recently used first. Paths an in-flight job has pinned are never evicted.
+
+    Pins hold across processes sharing the static folder: each pinned path
+    has a lock file under `<static>/.pins/` that pins hold a shared flock on
+    and eviction needs an exclusive one for. Whoever holds it exclusively
+    may remove the lock file, so a lock is only trusted once the file it
+    was taken on is still the one at its path.
+    """
+
+    def __init__(self, static_folder, budget_bytes=0, version=1):
+        self.static_folder = static_folder
+        self.root = os.path.join(static_folder, 'cache')
+        self.budget_bytes = budget_bytes
+        self.version = version
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'bytes_served': 0,
+            'bytes_stored': 0,
+            'evictions': 0,
+            'bytes_evicted': 0
+        }
+        self._pins = Counter()
+        self._lock = threading.RLock()
+
+    def key(self, video_id, **params):
+        payload = json.dumps({'video_id': video_id, 'version': self.version, **params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key)
+
+    def restore(self, key, dest_dir):
+        """
+        Link a cached result into `dest_dir` and return its metadata, or
+        None on a miss.
+        """
+        entry = self.entry_dir(key)
+        with self.pin(entry):
+            meta_path = os.path.join(entry, 'result.json')
+            if not os.path.exists(meta_path):
+                with self._lock:
+                    self.stats['misses'] += 1
+                return None
+
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+
+            os.makedirs(dest_dir, exist_ok=True)
+            served = 0
+            for name in os.listdir(entry):
+                if name == 'result.json':
+                    continue
+                src = os.path.join(entry, name)
+                link_or_copy(src, os.path.join(dest_dir, name))
+                served += os.path.getsize(src)
+
+            self.touch(entry)
+            with self._lock:
+                self.stats['hits'] += 1
+                self.stats['bytes_served'] += served
+            return meta
+
+    def store(self, key, source_dir, meta):
+        """
+        Save the files in `source_dir` along with `meta` under `key`.
+
+        The entry is assembled in a temp dir and renamed into place, so a
+        half-written entry is never visible to `restore`.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        entry = self.entry_dir(key)
+        tmp = os.path.join(self.root, f'.tmp-{uuid.uuid4().hex}')
+        os.makedirs(tmp)
+
+        stored = 0
+        for name in os.listdir(source_dir):
+            src = os.path.join(source_dir, name)
+            if os.path.isfile(src):
+                link_or_copy(src, os.path.join(tmp, name))
+                stored += os.path.getsize(src)
+        with open(os.path.join(tmp, 'result.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # another job stored the same result first
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        with self._lock:
+            self.stats['bytes_stored'] += stored
+
+    @contextmanager
+    def pin(self, *paths):
+        """
+        Keep `paths` from being evicted while the block runs.
+        """
+        real = [os.path.realpath(p) for p in paths]
+        locks = [self._flock(path, shared=True) for path in real]
+        with self._lock:
+            self._pins.update(real)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins.subtract(real)
+                self._pins += Counter()
+            for path, fd in zip(real, locks):
+                self._unflock(path, fd)
+
+    def _lock_path(self, real_path):
+        name = hashlib.sha256(real_path.encode('utf-8')).hexdigest()[:32]
+        return os.path.join(self.static_folder, '.pins', f'{name}.lock')
+
+    def _flock(self, real_path, shared):
+        """
+        Open and flock the lock file of `real_path`: shared (waiting for an
+        eviction of the path to finish) or exclusive (without waiting).
+        Returns the descriptor, or None if another process holds a pin.
+        """
+        if fcntl is None:
+            return None
+        lock_path = self._lock_path(real_path)
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        while True:
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return None
+            try:
+                current = os.stat(lock_path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            if current:
+                return fd
+            # removed by its last holder while we waited; take the new one
+            os.close(fd)
+
+    def _unflock(self, real_path, fd):
+        """
+        Release a lock from `_flock`, removing the lock file when nobody
+        else holds it.
+        """
+        if fd is None:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(self._lock_path(real_path))
+        except (BlockingIOError, FileNotFoundError):
+            pass
+        finally:
+            os.close(fd)
+
+    def touch(self, path):
+        """
+        Mark `path` as recently used for LRU eviction.
+        """
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _items(self):
+        """
+        Every evictable path under the static folder with its last use time.
+        """
+        items = []
+        if not os.path.isdir(self.static_folder):
+            return items
+        for name in os.listdir(self.static_folder):
+            path = os.path.join(self.static_folder, name)
+            if not os.path.isdir(path) or name.startswith('.'):
+                continue
+            if name in ('videos', 'cache', 'transcripts'):
+                for child in os.listdir(path):
+                    if child.startswith('.') or child.endswith(('.part', '.ytdl', '.tmp')):
+                        continue
+                    items.append(os.path.join(path, child))
+            else:
+                items.append(path)
+        return [(os.path.getmtime(p), p) for p in items if os.path.exists(p)]
+
+    @staticmethod
+    def _files(path):
+        if os.path.isfile(path):
+            yield path
+            return
+        for dirpath, _, filenames in os.walk(path):
+            for filename in filenames:
+                yield os.path.join(dirpath, filename)
+
+    def usage_bytes(self):
+        """
+        Bytes on disk under the budget, counting hard-linked files once.
+        """
+        seen = set()
+        total = 0
+        for _, path in self._items():
+            for file_path in self._files(path):
+                try:
+                    st = os.stat(file_path)
+                except OSError:
+                    continue
+                if (st.st_dev, st.st_ino) not in seen:
+                    seen.add((st.st_dev, st.st_ino))
+                    total += st.st_size
+        return total
+
+    def _freed_by(self, path):
+        """
+        Bytes that removing `path` would actually give back.
+        """
+        freed = 0
+        for file_path in self._files(path):
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if st.st_nlink <= 1:
+                freed += st.st_size
+        return freed
+
+    def enforce_budget(self):
+        """
+        Evict least recently used items until usage fits the budget.
+        """
+        if not self.budget_bytes:
+            return
+        with self._lock:
+            usage = self.usage_bytes()
+            for _, path in sorted(self._items()):
+                if usage <= self.budget_bytes:
+                    break
+                real = os.path.realpath(path)
+                if self._pins[real] > 0:
+                    continue
+                # held until the path is gone, so no other process pins it meanwhile
+                lock = self._flock(real, shared=False)
+                if lock is None and fcntl is not None:
+                    # in use by a job in another process
+                    continue
+
+                try:
+                    freed = self._freed_by(path)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path, ignore_errors=True)
+                    elif os.path.exists(path):
+                        os.remove(path)
+                finally:
+                    self._unflock(real, lock)
+                usage -= freed
+                self.stats['evictions'] += 1
+                self.stats['bytes_evicted'] += freed
+                print(f"Evicted {path} ({freed} bytes)")
+
+    def report(self):
+        with self._lock:
+            return {**self.stats, 'usage_bytes': self.usage_bytes(), 'budget_bytes': self.budget_bytes}
@@ -0,0 +1,126 @@
+import cv2
+import numpy as np
+
+# a pixel has changed when it moved by more than this between the two
+# frames of a pair
+PIXEL_DELTA = 12
+# the frame is split into a grid this many cells wide (and as many tall as
+# keeps the cells square); a cell has changed in a pair when more than
+# CELL_CHANGED of its pixels did
+GRID_COLUMNS = 32
+CELL_CHANGED = 0.02
+# a cell that changed in at least this share of the pairs is dynamic. Slide
+# changes and a wandering cursor only touch a cell in the odd pair; a
+# webcam keeps changing in nearly all of them
+DYNAMIC_SHARE = 0.5
+# with less than this share of the frame left, the slide isn't where the
+# static area is, so the whole frame is compared instead
+MIN_STATIC_AREA = 0.4
+
+ROI_MODES = ('auto', 'full')
+
+
+def parse_roi(value):
+    """
+    Validate a request's `roi`: 'auto', 'full' or [x, y, width, height] as
+    fractions of the frame. Returns the normalised value, raising
+    ValueError with a message for the client.
+    """
+    if value is None:
+        return 'auto'
+    if value in ROI_MODES:
+        return value
+    if isinstance(value, (list, tuple)) and len(value) == 4 \
+            and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in value):
+        x, y, width, height = (float(v) for v in value)
+        # a little slack for fractions like 0.3 + 0.7 that add up to just over 1
+        if min(x, y) >= 0 and width > 0 and height > 0 and x + width <= 1 + 1e-9 and y + height <= 1 + 1e-9:
+            return [x, y, width, height]
+    raise ValueError("roi must be 'auto', 'full' or [x, y, width, height] as fractions of the frame")
+
+
+def region_from_fractions(fractions, width, height):
+    """
+    Pixel box (x, y, width, height) for a region given as fractions of a
+    `width` x `height` frame.
+    """
+    x, y, w, h = fractions
+    left, top = round(x * width), round(y * height)
+    right, bottom = round((x + w) * width), round((y + h) * height)
+    return left, top, max(1, right - left), max(1, bottom - top)
+
+
+def crop(frame, region):
+    """
+    The part of `frame` inside a pixel box, or the whole frame for None.
+    """
+    if region is None:
+        return frame
+    x, y, width, height = region
+    return frame[y:y + height, x:x + width]
+
+
+def dynamic_cells(pairs):
+    """
+    Boolean grid of the cells that keep changing across `pairs` of
+    grayscale frames, each pair taken a moment apart.
+    """
+    height, width = pairs[0][0].shape
+    columns = GRID_COLUMNS
+    rows = max(1, round(GRID_COLUMNS * height / width))
+    changed = np.zeros((rows, columns), dtype=np.int32)
+    for first, second in pairs:
+        moved = (cv2.absdiff(first, second) > PIXEL_DELTA).astype(np.float32)
+        changed += cv2.resize(moved, (columns, rows), interpolation=cv2.INTER_AREA) > CELL_CHANGED
+    dynamic = changed >= max(2, DYNAMIC_SHARE * len(pairs))
+    # overlays have soft edges and move about a little
+    return cv2.dilate(dynamic.astype(np.uint8), np.ones((3, 3), dtype=np.uint8)).astype(bool)
+
+
+def cell_boxes(cells, width, height):
+    """
+    Pixel boxes (x, y, width, height) of a `width` x `height` frame that
+    cover the True cells of a grid: one per run of cells in a row, grown
+    down while the rows below have the same run.
+    """
+    rows, columns = cells.shape
+    boxes = []
+    above = {}
+    for row in range(rows):
+        runs = {}
+        column = 0
+        while column < columns:
+            if not cells[row, column]:
+                column += 1
+                continue
+            start = column
+            while column < columns and cells[row, column]:
+                column += 1
+            box = above.get((start, column))
+            if box is None:
+                box = [row, start, 0, column - start]
+                boxes.append(box)
+            box[2] += 1
+            runs[(start, column)] = box
+        above = runs
+    return [
+        region_from_fractions((column / columns, row / rows, span_columns / columns, span_rows / rows), width, height)
+        for row, column, span_rows, span_columns in boxes
+    ]
+
+
+def find_ignored(pair_groups, width, height):
+    """
+    Pixel boxes of a `width` x `height` frame to leave out of the
+    comparison, from groups of grayscale frame pairs (at any resolution
+    with the same aspect ratio). A cell left out is one that keeps changing
+    within any of the groups. None means the whole frame is compared:
+    nothing keeps changing, or too little would be left.
+    """
+    groups = [pairs for pairs in pair_groups if pairs]
+    if not groups:
+        return None
+    dynamic = np.logical_or.reduce([dynamic_cells(pairs) for pairs in groups])
+    if not dynamic.any() or dynamic.mean() > 1 - MIN_STATIC_AREA:
+        return None
+    return cell_boxes(dynamic, width, height)
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class QueueFull(Exception):
+    """
+    Raised when a job is submitted while the queue is at capacity.
+    """
+
+
+class Job:
+    """
+    A unit of work tracked by the scheduler, along with its state and timings.
+    """
+
+    def __init__(self, job_id, fn, args, kwargs, priority=0):
+        self.id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.state = 'queued'
+        self.progress = 0.0
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def set_progress(self, fraction):
+        self.progress = max(0.0, min(1.0, float(fraction)))
+
+    def timings(self):
+        now = time.time()
+        started = self.started_at or now
+        return {
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'wait_seconds': round(started - self.submitted_at, 3),
+            'run_seconds': round((self.finished_at or now) - self.started_at, 3) if self.started_at else None
+        }
+
+
+class JobScheduler:
+    """
+    Fixed-size worker pool fed by a bounded priority queue.
+
+    Jobs with a higher `priority` run first, FIFO within a priority. Once
+    `max_queue` jobs are waiting, `submit` raises QueueFull so callers can
+    push back instead of piling more work onto a busy box. `spawn` starts a
+    worker loop; pass `socketio.start_background_task` so workers match the
+    Socket.IO async mode.
+    """
+
+    def __init__(self, workers=2, max_queue=16, spawn=None, history=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.history = history
+        self._spawn = spawn or self._spawn_thread
+        self._heap = []
+        self._counter = itertools.count()
+        self._jobs = OrderedDict()
+        self._active = 0
+        self._lock = threading.Condition()
+        self._started = False
+
+    @staticmethod
+    def _spawn_thread(target):
+        thread = threading.Thread(target=target, daemon=True)
+        thread.start()
+        return thread
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        for _ in range(self.workers):
+            self._spawn(self._worker)
+
+    def submit(self, job_id, fn, /, *args, priority=0, progress_kwarg=None, ignore_limit=False, **kwargs):
+        """
+        Queue `fn(*args, **kwargs)` under `job_id` and return the Job.
+
+        If `progress_kwarg` is given, fn also receives the job's progress
+        setter under that keyword. `ignore_limit` queues the job even when
+        the queue is full, for work that was accepted earlier.
+        """
+        self.start()
+        with self._lock:
+            existing = self._jobs.get(job_id)
+            if existing is not None and existing.state in ('queued', 'running'):
+                raise ValueError(f"Job {job_id} is already {existing.state}")
+            if len(self._heap) >= self.max_queue and not ignore_limit:
+                raise QueueFull(f"{len(self._heap)} jobs already queued")
+
+            job = Job(job_id, fn, args, kwargs, priority)
+            if progress_kwarg:
+                kwargs[progress_kwarg] = job.set_progress
+            self._jobs.pop(job_id, None)
+            self._jobs[job_id] = job
+            heapq.heappush(self._heap, (-priority, next(self._counter), job))
+            self._trim_history()
+            self._lock.notify()
+            return job
+
+    def _trim_history(self):
+        while len(self._jobs) > self.history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest.state in ('queued', 'running'):
+                break
+            del self._jobs[oldest_id]
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                while not self._heap:
+                    self._lock.wait()
+                _, _, job = heapq.heappop(self._heap)
+                job.state = 'running'
+                job.started_at = time.time()
+                self._active += 1
+
+            try:
+                job.fn(*job.args, **job.kwargs)
+                job.state = 'completed'
+                job.progress = 1.0
+            except Exception as e:
+                print(f"Job {job.id} failed: {e}")
+                job.state = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                with self._lock:
+                    self._active -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queue_position(self, job_id):
+        """
+        1-based position of a queued job in run order, or None if not queued.
+        """
+        with self._lock:
+            order = sorted(self._heap)
+            for position, (_, _, job) in enumerate(order, 1):
+                if job.id == job_id:
+                    return position
+        return None
+
+    def status(self, job_id):
+        job = self.get(job_id)
+        if job is None:
+            return None
+        return {
+            'job_id': job.id,
+            'state': job.state,
+            'priority': job.priority,
+            'queue_position': self.queue_position(job_id) if job.state == 'queued' else None,
+            'progress': round(job.progress, 4),
+            'error': job.error,
+            'timings': job.timings()
+        }
+
+    def queue_depth(self):
+        with self._lock:
+            return len(self._heap)
+
+    def active_workers(self):
+        with self._lock:
+            return self._active
@@ -0,0 +1,247 @@
+import cv2
+import numpy as np
+
+# the same constants skimage's structural_similarity uses for uint8 images
+# with its default arguments
+WIN_SIZE = 7
+DATA_RANGE = 255
+C1 = (0.01 * DATA_RANGE) ** 2
+C2 = (0.03 * DATA_RANGE) ** 2
+COV_NORM = WIN_SIZE ** 2 / (WIN_SIZE ** 2 - 1)
+PAD = (WIN_SIZE - 1) // 2
+
+# largest difference from skimage seen on real and synthetic frames is
+# around 1e-13; anything under this is the same score
+SKIMAGE_TOLERANCE = 1e-9
+
+# side of the square blocks ssim_lower_bound works on, in SSIM map pixels
+BOUND_BLOCK = 16
+# ssim_lower_bound filters in float32; its rounding error is well under this
+BOUND_SLACK = 1e-6
+_BLOCK_WINDOWS = np.ones((BOUND_BLOCK + 2 * PAD, BOUND_BLOCK + 2 * PAD), np.uint8)
+
+
+def _box(image):
+    """
+    Local mean over a WIN_SIZE square, like scipy's uniform_filter. Borders
+    differ but are cropped off before averaging.
+    """
+    return cv2.boxFilter(image, cv2.CV_64F, (WIN_SIZE, WIN_SIZE), borderType=cv2.BORDER_REFLECT)
+
+
+def _block_sums(image):
+    """
+    Sums of a float32 image over each BOUND_BLOCK square; the last row and
+    column of blocks are zero-padded to size.
+    """
+    height, width = image.shape
+    padded = cv2.copyMakeBorder(image, 0, -height % BOUND_BLOCK, 0, -width % BOUND_BLOCK, cv2.BORDER_CONSTANT, value=0)
+    means = cv2.resize(padded, (padded.shape[1] // BOUND_BLOCK, padded.shape[0] // BOUND_BLOCK),
+                       interpolation=cv2.INTER_AREA)
+    return means.astype(np.float64) * BOUND_BLOCK ** 2
+
+
+class Mask:
+    """
+    The part of a frame that is compared, for frames of one size. `keep` is
+    a boolean image, True for pixels to compare.
+
+    Scores only average the SSIM windows that lie entirely inside it
+    (`windows`, over the cropped SSIM map). The rest of each frame is
+    painted white, so it can't make frames differ, and window minima only
+    see compared pixels.
+    """
+
+    def __init__(self, keep):
+        self.keep = keep.astype(np.uint8) * 255
+        self.windows = cv2.erode(self.keep, np.ones((WIN_SIZE, WIN_SIZE), np.uint8))[PAD:-PAD, PAD:-PAD] > 0
+        self.block_counts = np.rint(_block_sums(self.windows.astype(np.float32)))
+
+    def apply(self, gray):
+        return cv2.max(gray, cv2.bitwise_not(self.keep))
+
+
+class FrameStats:
+    """
+    A frame's grayscale image and the local statistics SSIM needs from it,
+    computed once and reused for every pair the frame is part of.
+
+    Statistics are kept per downscale factor, so the slide index's
+    thumbnails share the grayscale conversion. With a `mask`, only that
+    part of the frame is scored (at full resolution).
+    """
+
+    def __init__(self, frame, mask=None):
+        self.gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        self.mask = mask
+        if mask is not None:
+            self.gray = mask.apply(self.gray)
+        self._levels = {}
+        self._window_minima = None
+        self._window_ranges = None
+
+    def level(self, scale=1):
+        """
+        (gray, local mean, local mean squared, local variance) at 1/`scale`
+        resolution.
+        """
+        stats = self._levels.get(scale)
+        if stats is None:
+            gray = self.gray
+            if scale > 1:
+                height, width = gray.shape
+                gray = cv2.resize(gray, (width // scale, height // scale), interpolation=cv2.INTER_AREA)
+            mean = _box(gray)
+            mean_sq = mean * mean
+            variance = COV_NORM * (_box(np.multiply(gray, gray, dtype=np.float64)) - mean_sq)
+            stats = self._levels[scale] = (gray, mean, mean_sq, variance)
+        return stats
+
+    def window_minima(self):
+        """
+        The darkest pixel any SSIM window of each BOUND_BLOCK square of the
+        cropped SSIM map covers.
+        """
+        if self._window_minima is None:
+            height, width = self.gray.shape
+            # each window reaches PAD pixels past its centre, and the cropped
+            # map starts PAD pixels in, so block rows [r, r + BOUND_BLOCK) of
+            # the map cover image rows [r, r + BOUND_BLOCK + 2 * PAD)
+            darkest = cv2.erode(self.gray, _BLOCK_WINDOWS, anchor=(0, 0))
+            self._window_minima = darkest[:height - 2 * PAD:BOUND_BLOCK, :width - 2 * PAD:BOUND_BLOCK].astype(np.float64)
+        return self._window_minima
+
+    def window_ranges(self):
+        """
+        (brightest pixel squared, squared range between brightest and
+        darkest pixel) of every SSIM window, over the cropped SSIM map.
+        """
+        if self._window_ranges is None:
+            window = np.ones((WIN_SIZE, WIN_SIZE), np.uint8)
+            darkest = cv2.erode(self.gray, window)[PAD:-PAD, PAD:-PAD].astype(np.float32)
+            brightest = cv2.dilate(self.gray, window)[PAD:-PAD, PAD:-PAD].astype(np.float32)
+            self._window_ranges = (brightest * brightest, (brightest - darkest) ** 2)
+        return self._window_ranges
+
+
+def _ssim_map(ux, uy, ux_sq, uy_sq, vx, vy, uxy):
+    vxy = COV_NORM * (uxy - ux * uy)
+    return ((2 * ux * uy + C1) * (2 * vxy + C2)) / ((ux_sq + uy_sq + C1) * (vx + vy + C2))
+
+
+def ssim(a, b, scale=1):
+    """
+    Mean SSIM of two FrameStats, matching
+    `skimage.metrics.structural_similarity` on their grayscale images to
+    within SKIMAGE_TOLERANCE. Only the cross term is filtered here; the rest
+    comes from each frame's cached statistics. With a mask, the mean is
+    over the windows inside it.
+    """
+    x, ux, ux_sq, vx = a.level(scale)
+    y, uy, uy_sq, vy = b.level(scale)
+    uxy = _box(np.multiply(x, y, dtype=np.float64))
+    s = _ssim_map(ux, uy, ux_sq, uy_sq, vx, vy, uxy)[PAD:-PAD, PAD:-PAD]
+    if a.mask is not None and scale == 1:
+        s = s[a.mask.windows]
+    return float(s.mean(dtype=np.float64))
+
+
+def ssim_lower_bound(a, b):
+    """
+    A lower bound on `ssim(a, b)` that costs a fraction of it: only the
+    frames' difference is filtered, and neither frame needs its local
+    statistics.
+
+    With d = x - y, each SSIM map value is exactly (1 - p)(1 - q), where
+    p = box(d)^2 / (ux^2 + uy^2 + C1) and q = var(d) / (vx + vy + C2) both
+    lie in [0, 2]. So it is at least max(-1, 1 - p - q), and p + q is at
+    most box(d^2) * max(1 / (ux^2 + uy^2 + C1), COV_NORM / C2). Within each
+    block, ux and uy are replaced by the darkest pixel their windows cover,
+    and since max(-1, 1 - e) is convex the block's mean is at least its
+    value at the block's mean e. The result is never above the true score
+    by more than BOUND_SLACK of rounding.
+    """
+    diff = cv2.absdiff(a.gray, b.gray)
+    diff_sq = cv2.sqrBoxFilter(diff, cv2.CV_32F, (WIN_SIZE, WIN_SIZE), borderType=cv2.BORDER_REFLECT)[PAD:-PAD, PAD:-PAD]
+    if a.mask is not None:
+        diff_sq = diff_sq * a.mask.windows
+        counts = a.mask.block_counts
+    else:
+        height, width = diff_sq.shape
+        counts = np.outer(np.diff(np.arange(0, height, BOUND_BLOCK), append=height),
+                          np.diff(np.arange(0, width, BOUND_BLOCK), append=width))
+    sums = _block_sums(diff_sq)
+
+    darkest_x, darkest_y = a.window_minima(), b.window_minima()
+    weight = np.maximum(1 / (darkest_x * darkest_x + darkest_y * darkest_y + C1), COV_NORM / C2)
+    error = weight * sums / np.maximum(counts, 1)
+    return float((np.maximum(-1, 1 - error) * counts).sum() / counts.sum())
+
+
+
+def ssim_batch(pairs, scale=1):
+    """
+    `ssim` of many (FrameStats, FrameStats) pairs of the same size in one
+    vectorized pass. Returns a numpy array of mean SSIM values, one per pair,
+    each within SKIMAGE_TOLERANCE of what `ssim` gives for the pair.
+
+    The cross terms are filtered as one tall image with the frames stacked
+    on top of each other. Windows only straddle two frames within PAD rows
+    of a frame edge, which is cropped anyway. Memory grows with the batch,
+    around ten float64 planes per pair, so keep batches of large frames
+    small.
+    """
+    if not pairs:
+        return np.empty(0)
+    levels = [(a.level(scale), b.level(scale)) for a, b in pairs]
+    x = np.stack([la[0] for la, _ in levels])
+    y = np.stack([lb[0] for _, lb in levels])
+    count, height, width = x.shape
+    uxy = _box(np.multiply(x, y, dtype=np.float64).reshape(count * height, width)).reshape(count, height, width)
+
+    def stack(i, side):
+        return np.stack([pair[side][i] for pair in levels])
+
+    s = _ssim_map(stack(1, 0), stack(1, 1), stack(2, 0), stack(2, 1), stack(3, 0), stack(3, 1), uxy)[:, PAD:-PAD, PAD:-PAD]
+    scores = s.mean(axis=(1, 2), dtype=np.float64)
+    if scale == 1:
+        for i, (a, _) in enumerate(pairs):
+            if a.mask is not None:
+                scores[i] = s[i][a.mask.windows].mean(dtype=np.float64)
+    return scores
+
+
+def ssim_upper_bound(a, b):
+    """
+    An upper bound on `ssim(a, b)` that costs less than half of it: only
+    the frames' difference is filtered, and each frame just needs the
+    brightest and darkest pixel of every window.
+
+    With p and q as in `ssim_lower_bound`, p is at most 1 and q at least 0,
+    so each SSIM map value (1 - p)(1 - q) is at most 1 - p and at most
+    max(0, 1 - q). Both bounds only grow as p and q shrink, so ux^2 + uy^2
+    can be replaced by the squares of the windows' brightest pixels, and
+    vx + vy by COV_NORM / 4 times their squared ranges (values within a
+    range can't vary more than that). Window sums of d and d^2 are whole
+    numbers and computed exactly, so the result is never below the true
+    score by more than BOUND_SLACK of rounding.
+    """
+    diff = cv2.subtract(a.gray, b.gray, dtype=cv2.CV_16S)
+    # at most WIN_SIZE^2 * 255^2, well inside float32's exact integers
+    sums = cv2.boxFilter(diff, cv2.CV_32F, (WIN_SIZE, WIN_SIZE), normalize=False,
+                         borderType=cv2.BORDER_REFLECT)[PAD:-PAD, PAD:-PAD].astype(np.int32)
+    sums_sq = cv2.sqrBoxFilter(diff, cv2.CV_32F, (WIN_SIZE, WIN_SIZE), normalize=False,
+                               borderType=cv2.BORDER_REFLECT)[PAD:-PAD, PAD:-PAD].astype(np.int32)
+    count = WIN_SIZE ** 2
+    squared_sums = sums * sums
+    mean_sq = squared_sums.astype(np.float32) / count ** 2
+    variance = (count * sums_sq - squared_sums).astype(np.float32) * np.float32(COV_NORM / count ** 2)
+
+    brightest_x, range_x = a.window_ranges()
+    brightest_y, range_y = b.window_ranges()
+    p = mean_sq / (brightest_x + brightest_y + C1)
+    q = variance / (np.float32(COV_NORM / 4) * (range_x + range_y) + C2)
+    s = np.minimum(1 - p, np.maximum(0, 1 - q))
+    if a.mask is not None:
+        s = s[a.mask.windows]
+    return float(s.mean(dtype=np.float64))
@@ -0,0 +1,139 @@
+import base64
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from similarity import FrameStats, ssim
+
+# a 64-bit DCT hash: the signs of the lowest 8x8 frequencies of a 32x32
+# thumbnail, relative to their median
+HASH_SIZE = 8
+DCT_SIZE = 32
+# the hash is split into BANDS bytes, each indexed on its own. Of two hashes
+# up to 2 * BANDS - 1 bits apart, at least one byte differs in at most one
+# bit, so probing every byte and its one-bit neighbours finds all of them
+# without a scan
+BANDS = 8
+# compression noise and a moving cursor flip up to about 10 bits on the same
+# slide; the SSIM check sorts out the other candidates
+MAX_DISTANCE = 12
+# candidates are checked with SSIM on the frames shrunk this many times
+THUMBNAIL_SCALE = 4
+
+
+def perceptual_hash(gray):
+    """
+    64-bit perceptual hash of a grayscale image, as an int. Small changes
+    (compression noise, a cursor) flip few bits; a different slide flips
+    many.
+    """
+    small = cv2.resize(gray, (DCT_SIZE, DCT_SIZE), interpolation=cv2.INTER_AREA).astype(np.float32)
+    coefficients = cv2.dct(small)[:HASH_SIZE, :HASH_SIZE].flatten()
+    # the DC term only tracks overall brightness
+    bits = coefficients > np.median(coefficients[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class SlideIndex:
+    """
+    Every slide a job has kept so far, searchable by perceptual hash, so a
+    slide that comes back later (the lecturer flipping back, or toggling
+    between two slides) is recognised instead of being kept again.
+
+    Candidates are the slides whose hash is within `max_distance` bits,
+    found by probing the band tables rather than comparing against every
+    slide. A candidate only counts as the same slide if the SSIM of the
+    two thumbnails (the frames downscaled by THUMBNAIL_SCALE) reaches
+    `threshold`, so slides that merely share a layout stay apart.
+    """
+
+    def __init__(self, threshold, max_distance=MAX_DISTANCE):
+        self.threshold = threshold
+        self.max_distance = max_distance
+        self.hashes = []
+        self.thumbnails = []
+        self.stats = {'lookups': 0, 'candidates': 0, 'matches': 0}
+        self._bands = [defaultdict(list) for _ in range(BANDS)]
+
+    def __len__(self):
+        return len(self.hashes)
+
+    @staticmethod
+    def _band_keys(value):
+        return [(value >> (8 * band)) & 0xFF for band in range(BANDS)]
+
+    @staticmethod
+    def thumbnail(stats):
+        height, width = stats.gray.shape
+        scale = THUMBNAIL_SCALE if min(width, height) // THUMBNAIL_SCALE >= 7 else 1
+        return stats.level(scale)[0]
+
+    def lookup(self, stats):
+        """
+        Find the kept slide a frame (given as FrameStats) shows again.
+
+        Returns (slide, entry): the 0-based position of the matching slide,
+        or None, and the frame's hash and thumbnail to pass to `add` if it
+        is kept as a new slide.
+        """
+        self.stats['lookups'] += 1
+        value = perceptual_hash(stats.gray)
+        thumbnail = self.thumbnail(stats)
+        entry = (value, thumbnail)
+
+        candidates = set()
+        for band, key in enumerate(self._band_keys(value)):
+            table = self._bands[band]
+            for probe in [key] + [key ^ (1 << bit) for bit in range(8)]:
+                candidates.update(table.get(probe, ()))
+
+        best, best_score = None, self.threshold
+        for slide in sorted(candidates):
+            if hamming_distance(value, self.hashes[slide]) > self.max_distance:
+                continue
+            if self.thumbnails[slide].shape != thumbnail.shape:
+                continue
+            self.stats['candidates'] += 1
+            score = ssim(FrameStats(thumbnail), FrameStats(self.thumbnails[slide]))
+            if score >= best_score:
+                best, best_score = slide, score
+
+        if best is not None:
+            self.stats['matches'] += 1
+        return best, entry
+
+    def add(self, entry):
+        """
+        Keep a new slide from the entry `lookup` returned. Returns its
+        0-based position.
+        """
+        value, thumbnail = entry
+        slide = len(self.hashes)
+        self.hashes.append(value)
+        self.thumbnails.append(thumbnail)
+        for band, key in enumerate(self._band_keys(value)):
+            self._bands[band][key].append(slide)
+        return slide
+
+    def to_state(self):
+        """
+        JSON-serialisable form for checkpoints: hashes in hex and
+        thumbnails as base64 PNG.
+        """
+        return [
+            [f'{value:016x}', base64.b64encode(cv2.imencode('.png', thumbnail)[1].tobytes()).decode('ascii')]
+            for value, thumbnail in zip(self.hashes, self.thumbnails)
+        ]
+
+    @classmethod
+    def from_state(cls, state, threshold, max_distance=MAX_DISTANCE):
+        index = cls(threshold, max_distance)
+        for value, thumbnail in state:
+            image = cv2.imdecode(np.frombuffer(base64.b64decode(thumbnail), dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            index.add((int(value, 16), image))
+        return index
@@ -0,0 +1,124 @@
+"""
+The /jobs/<job_id>/manifest and /jobs/<job_id>/files/<name> routes, over a
+job folder written by hand.
+"""
+import itertools
+import os
+
+import numpy as np
+import pytest
+
+from artifacts import encode_thumbnail, thumbnail_name, write_manifest
+
+PDF_BYTES = b'%PDF-1.4\n' + bytes(range(256)) * 4
+job_ids = itertools.count()
+
+
+@pytest.fixture
+def job(server):
+    """
+    (test client, job id, manifest) of a finished two-slide job in the
+    app's static folder. Only the first slide has a thumbnail.
+    """
+    job_id = f'artifacts{next(job_ids)}'
+    output_dir = os.path.join(server.app.static_folder, job_id)
+    os.makedirs(output_dir)
+    for index in (1, 2):
+        with open(os.path.join(output_dir, f'frame_{index}.jpg'), 'wb') as f:
+            f.write(b'slide %d' % index)
+    with open(os.path.join(output_dir, thumbnail_name(1)), 'wb') as f:
+        f.write(encode_thumbnail(np.full((90, 160, 3), 200, np.uint8)))
+    with open(os.path.join(output_dir, 'output.pdf'), 'wb') as f:
+        f.write(PDF_BYTES)
+    # in the folder, but not one of the job's outputs
+    with open(os.path.join(output_dir, 'trace.json'), 'w', encoding='utf-8') as f:
+        f.write('{}')
+    manifest = write_manifest(output_dir, ['frame_1.jpg', 'frame_2.jpg'], [[[0, 5]], [[5, 9]]])
+    return server.app.test_client(), job_id, manifest
+
+
+def test_manifest_lists_versioned_urls_and_revalidates(job):
+    client, job_id, manifest = job
+    response = client.get(f'/jobs/{job_id}/manifest')
+    assert response.status_code == 200
+    assert response.cache_control.no_cache
+    body = response.get_json()
+    assert [slide['file'] for slide in body['slides']] == ['frame_1.jpg', 'frame_2.jpg']
+    assert body['slides'][0]['url'] == f"/jobs/{job_id}/files/frame_1.jpg?v={manifest['slides'][0]['sha256'][:16]}"
+    assert body['slides'][0]['thumbnail']['file'] == thumbnail_name(1)
+    assert body['slides'][1]['thumbnail'] is None
+    assert body['pdf']['bytes'] == len(PDF_BYTES)
+    assert body['subtitles'] is None
+
+    etag = response.headers['ETag']
+    unchanged = client.get(f'/jobs/{job_id}/manifest', headers={'If-None-Match': etag})
+    assert unchanged.status_code == 304
+    assert unchanged.get_data() == b''
+    assert client.get(f'/jobs/{job_id}/manifest', headers={'If-None-Match': '"stale"'}).status_code == 200
+
+
+def test_files_have_their_hash_as_etag(job):
+    client, job_id, manifest = job
+    response = client.get(f'/jobs/{job_id}/files/output.pdf')
+    assert response.status_code == 200
+    assert response.get_data() == PDF_BYTES
+    assert response.headers['ETag'] == f'"{manifest["pdf"]["sha256"]}"'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    # without the version in the URL, clients check back every time
+    assert response.cache_control.no_cache
+
+    unchanged = client.get(f'/jobs/{job_id}/files/output.pdf', headers={'If-None-Match': response.headers['ETag']})
+    assert unchanged.status_code == 304
+
+    versioned = client.get(f"/jobs/{job_id}/files/output.pdf?v={manifest['pdf']['sha256'][:16]}")
+    assert versioned.cache_control.immutable
+    assert versioned.cache_control.max_age == 365 * 24 * 3600
+    # a version that doesn't match is served, but not as immutable
+    assert not client.get(f'/jobs/{job_id}/files/output.pdf?v=0000').cache_control.immutable
+
+
+def test_range_requests(job):
+    client, job_id, manifest = job
+    url = f'/jobs/{job_id}/files/output.pdf'
+
+    partial = client.get(url, headers={'Range': 'bytes=0-9'})
+    assert partial.status_code == 206
+    assert partial.get_data() == PDF_BYTES[:10]
+    assert partial.headers['Content-Range'] == f'bytes 0-9/{len(PDF_BYTES)}'
+
+    tail = client.get(url, headers={'Range': 'bytes=-24'})
+    assert tail.status_code == 206
+    assert tail.get_data() == PDF_BYTES[-24:]
+
+    etag = f'"{manifest["pdf"]["sha256"]}"'
+    assert client.get(url, headers={'Range': 'bytes=10-19', 'If-Range': etag}).get_data() == PDF_BYTES[10:20]
+    # the file changed since the client's copy: it gets all of it
+    changed = client.get(url, headers={'Range': 'bytes=10-19', 'If-Range': '"old"'})
+    assert changed.status_code == 200
+    assert changed.get_data() == PDF_BYTES
+
+    beyond = client.get(url, headers={'Range': f'bytes={len(PDF_BYTES) + 10}-'})
+    assert beyond.status_code == 416
+
+
+@pytest.mark.parametrize('path', [
+    # in the job folder but not in its manifest
+    '/jobs/{job_id}/files/trace.json',
+    '/jobs/{job_id}/files/manifest.json',
+    '/jobs/{job_id}/files/..%2Fjobs.sqlite3',
+    '/jobs/{job_id}/files/%2E%2E',
+    # outside the static folder
+    '/jobs/../files/app.py',
+    '/jobs/..%2F..%2Fetc/files/passwd',
+    '/jobs/%2E%2E/files/jobs.sqlite3',
+    '/jobs/missing/files/output.pdf',
+])
+def test_only_manifest_files_are_served(job, path):
+    client, job_id, _ = job
+    assert client.get(path.format(job_id=job_id)).status_code == 404
+
+
+def test_manifest_of_unknown_or_escaping_job(job):
+    client, _, _ = job
+    assert client.get('/jobs/missing/manifest').status_code == 404
+    assert client.get('/jobs/%2E%2E/manifest').status_code == 404
@@ -0,0 +1,118 @@
+"""
+batch.py: collecting sources, naming their folders, skipping finished ones
+and carrying on past a video that fails.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+
+import batch
+
+OPTIONS = {'interval_seconds': 5, 'similarity_threshold': 0.95, 'sampling': 'fps'}
+
+
+def test_sources_from_directories_and_a_list_file(tmp_path):
+    for name in ('b/two.mp4', 'a/one.MKV', 'a/notes.txt', 'a/deeper/three.webm'):
+        path = tmp_path / 'videos' / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+    videos = str(tmp_path / 'videos')
+    list_file = tmp_path / 'list.txt'
+    list_file.write_text(f'# lectures\nhttps://youtu.be/abcdefghijk\n\n  {videos}/b/two.mp4  \n', encoding='utf-8')
+
+    sources = batch.collect_sources([videos], str(list_file))
+    # directories are walked in order, and a video listed twice is kept once
+    assert sources == [
+        f'{videos}/a/one.MKV',
+        f'{videos}/a/deeper/three.webm',
+        f'{videos}/b/two.mp4',
+        'https://youtu.be/abcdefghijk'
+    ]
+
+
+def test_clashing_names_get_their_own_folders(tmp_path):
+    for name in ('a/talk.mp4', 'b/talk.mp4', 'c/talk.mkv', 'd/my talk!.mp4'):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+    sources = [str(tmp_path / name) for name in ('a/talk.mp4', 'b/talk.mp4', 'c/talk.mkv', 'd/my talk!.mp4')]
+    sources.append('https://www.youtube.com/watch?v=abcdefghijk')
+
+    plan = batch.plan_outputs(sources, 'out')
+    assert [os.path.basename(output_dir) for _, output_dir in plan] == \
+        ['talk', 'talk-2', 'talk-3', 'my_talk', 'abcdefghijk']
+    assert [source for source, _ in plan] == sources
+
+
+def test_finished_item_is_complete_for_the_same_options_only(slide_video, make_engine, tmp_path, monkeypatch):
+    video, _ = slide_video
+    monkeypatch.setattr(batch, '_engine', make_engine(video, allow_local_files=True))
+    output_dir = str(tmp_path / 'out' / 'clean')
+    assert not batch.is_complete(output_dir, video, OPTIONS)
+
+    summary = batch.run_item(video, output_dir, OPTIONS)
+    assert summary['status'] == 'completed'
+    assert summary['slides'] > 1
+    assert os.path.exists(os.path.join(output_dir, 'trace.json'))
+    assert batch.is_complete(output_dir, video, OPTIONS)
+    assert not batch.is_complete(output_dir, video, {**OPTIONS, 'interval_seconds': 2})
+    assert not batch.is_complete(output_dir, video + '.other', OPTIONS)
+
+    monkeypatch.setattr(batch, 'ALGORITHM_VERSION', batch.ALGORITHM_VERSION + 1)
+    assert not batch.is_complete(output_dir, video, OPTIONS)
+
+
+def test_failed_item_leaves_no_marker(tmp_path, make_engine, monkeypatch):
+    broken = tmp_path / 'broken.mp4'
+    broken.write_bytes(b'not a video')
+    monkeypatch.setattr(batch, '_engine', make_engine(str(broken), allow_local_files=True))
+    output_dir = str(tmp_path / 'out' / 'broken')
+
+    summary = batch.run_item(str(broken), output_dir, OPTIONS)
+    assert summary['status'] == 'failed'
+    assert summary['error']
+    assert not batch.is_complete(output_dir, str(broken), OPTIONS)
+
+
+def run_batch(*args):
+    return subprocess.run([sys.executable, 'batch.py', *args], cwd=os.path.dirname(os.path.abspath(__file__)),
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def test_rerun_skips_finished_videos_and_a_failure_stops_nothing(slide_video, tmp_path):
+    video, _ = slide_video
+    for folder in ('a', 'b'):
+        (tmp_path / folder).mkdir()
+        shutil.copyfile(video, tmp_path / folder / 'lecture.mp4')
+    (tmp_path / 'broken.mp4').write_bytes(b'not a video')
+    list_file = tmp_path / 'list.txt'
+    list_file.write_text(f"{tmp_path / 'broken.mp4'}\n", encoding='utf-8')
+    out = str(tmp_path / 'out')
+    args = [str(tmp_path / 'a'), str(tmp_path / 'b'), '--list', str(list_file), '--out', out, '--interval', '5']
+
+    first = run_batch(*args)
+    # a failed video fails the run, after the others are done
+    assert first.returncode == 1, first.stdout
+    with open(os.path.join(out, 'report.json'), encoding='utf-8') as f:
+        report = json.load(f)
+    assert report['counts'] == {'completed': 2, 'skipped': 0, 'failed': 1}
+    statuses = {os.path.basename(item['output_dir']): item['status'] for item in report['items']}
+    assert statuses == {'lecture': 'completed', 'lecture-2': 'completed', 'broken': 'failed'}
+    with open(os.path.join(out, 'lecture', 'batch.json'), encoding='utf-8') as f:
+        slides = json.load(f)['slides']
+    assert sorted(name for name in os.listdir(os.path.join(out, 'lecture-2')) if name.startswith('frame_')) == \
+        [f'frame_{i}.png' for i in range(1, slides + 1)]
+
+    second = run_batch(*args)
+    assert second.returncode == 1, second.stdout
+    with open(os.path.join(out, 'report.json'), encoding='utf-8') as f:
+        report = json.load(f)
+    # only the failed video is tried again
+    assert report['counts'] == {'completed': 0, 'skipped': 2, 'failed': 1}
+
+    forced = run_batch(*args, '--force')
+    with open(os.path.join(out, 'report.json'), encoding='utf-8') as f:
+        assert json.load(f)['counts'] == {'completed': 2, 'skipped': 0, 'failed': 1}
+    assert forced.returncode == 1
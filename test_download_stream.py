@@ -0,0 +1,105 @@
+import os
+
+import pytest
+
+import engine
+from benchmark import HEIGHT, WIDTH
+from dev_download import ThrottledDownload
+from download_stream import HEADER_LIMIT, mp4_header_end
+from metrics import JobTrace
+
+VIDEO_URL = 'https://youtu.be/streamtest1'
+
+
+def run(make_engine, video, name, tmp_path, **kwargs):
+    """
+    (result, slide file contents, trace) of one job, or the
+    ProcessingError it raised.
+    """
+    output_dir = str(tmp_path / name / 'job')
+    trace = JobTrace(name)
+    try:
+        result = make_engine(video, name, **kwargs).process(VIDEO_URL, output_dir, interval_seconds=2, trace=trace)
+    except engine.ProcessingError as e:
+        return e
+    slides = []
+    for i in range(1, result['frames_count'] + 1):
+        with open(os.path.join(output_dir, f"frame_{i}{result['frame_ext']}"), 'rb') as f:
+            slides.append(f.read())
+    return result, slides, trace.to_dict()
+
+
+def throttled(video, seconds, **kwargs):
+    return ThrottledDownload(video, os.path.getsize(video) / seconds, **kwargs)
+
+
+def test_fixture_videos_can_be_streamed(webcam_video):
+    with open(webcam_video[0], 'rb') as f:
+        assert mp4_header_end(f.read(HEADER_LIMIT))
+
+
+def test_streamed_roi_auto_matches_a_finished_download(late_webcam_video, make_engine, tmp_path):
+    video = late_webcam_video
+    waited, waited_slides, _ = run(make_engine, video, 'waited', tmp_path)
+    # the webcam is missing from the first seconds, but is left out all the same
+    assert waited['ignored']
+    assert all(x >= WIDTH / 2 and y >= HEIGHT / 3 for x, y, _, _ in waited['ignored'])
+
+    # slower than decoding, and faster than the first frames come out
+    for name, downloader in (('slow', throttled(video, 4)), ('fast', None)):
+        kwargs = {'stream_downloads': True}
+        if downloader is not None:
+            kwargs['downloader'] = downloader
+        result, slides, trace = run(make_engine, video, name, tmp_path, **kwargs)
+        assert (result['region'], result['ignored']) == (waited['region'], waited['ignored']), name
+        assert result['timestamps'] == waited['timestamps'], name
+        assert slides == waited_slides, name
+        if name == 'slow':
+            assert 'download_wait' in trace['stages']
+            # the start of the video alone didn't show the webcam
+            assert trace['counters']['region_restarts'] == 1
+
+
+def test_streamed_job_keeps_a_region_the_whole_video_agrees_with(webcam_video, make_engine, tmp_path):
+    video, _ = webcam_video
+    waited, waited_slides, _ = run(make_engine, video, 'waited', tmp_path)
+    result, slides, trace = run(make_engine, video, 'streamed', tmp_path, stream_downloads=True,
+                                downloader=throttled(video, 4))
+    assert result['ignored'] == waited['ignored']
+    assert slides == waited_slides
+    assert 'region_restarts' not in trace['counters']
+
+
+def test_truncated_download_fails_the_job(webcam_video, make_engine, tmp_path):
+    video, _ = webcam_video
+    error = run(make_engine, video, 'truncated', tmp_path, stream_downloads=True,
+                downloader=throttled(video, 2, fail_at=0.5))
+    assert isinstance(error, engine.ProcessingError)
+    assert not os.path.exists(tmp_path / 'truncated' / 'videos' / 'streamtest1.mp4')
+
+
+def test_stalled_download_fails_only_past_the_stall_limit(webcam_video, make_engine, tmp_path):
+    video, _ = webcam_video
+    error = run(make_engine, video, 'stalled', tmp_path, stream_downloads=True, stall_seconds=1,
+                downloader=throttled(video, 2, stall_at=0.5, stall_seconds=3))
+    assert isinstance(error, engine.ProcessingError)
+
+    waited, waited_slides, _ = run(make_engine, video, 'waited', tmp_path)
+    result, slides, trace = run(make_engine, video, 'paused', tmp_path, stream_downloads=True, stall_seconds=5,
+                                downloader=throttled(video, 2, stall_at=0.5, stall_seconds=1))
+    assert result['timestamps'] == waited['timestamps']
+    assert slides == waited_slides
+    assert trace['stages']['download_wait'] >= 1
+
+
+@pytest.mark.parametrize('sampling', ['fps', 'keyframes'])
+def test_region_is_the_same_for_serial_and_sharded_jobs(late_webcam_video, make_engine, tmp_path, sampling,
+                                                                 monkeypatch):
+    monkeypatch.setattr(engine, 'MAX_SHARDS', 2)
+    video = late_webcam_video
+    serial = make_engine(video, 'serial').process(VIDEO_URL, str(tmp_path / 'serial' / 'job'), interval_seconds=2,
+                                                 sampling=sampling)
+    sharded = make_engine(video, 'sharded').process(VIDEO_URL, str(tmp_path / 'sharded' / 'job'), interval_seconds=2,
+                                                   sampling=sampling, shards=2)
+    assert (sharded['region'], sharded['ignored']) == (serial['region'], serial['ignored'])
+    assert sharded['timestamps'] == serial['timestamps']
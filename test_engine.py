@@ -0,0 +1,78 @@
+import os
+
+import cv2
+
+import engine
+from artifacts import load_manifest
+from benchmark import FPS, HEIGHT, WIDTH
+
+VIDEO_URL = 'https://youtu.be/testvideo01'
+
+
+def slide_files(output_dir, result):
+    return [os.path.join(output_dir, f"frame_{i}{result['frame_ext']}") for i in range(1, result['frames_count'] + 1)]
+
+
+def test_sharded_keyframes_capture_the_same_slides_as_serial(slide_video, make_engine, monkeypatch, tmp_path):
+    video, _ = slide_video
+    # sharding is capped at the machine's cores
+    monkeypatch.setattr(engine, 'MAX_SHARDS', 3)
+
+    runs = {}
+    for shards in (1, 3):
+        output_dir = str(tmp_path / f'job{shards}')
+        result = make_engine(video, f'static{shards}').process(
+            VIDEO_URL, output_dir, interval_seconds=2, sampling='keyframes', shards=shards, analysis_width=320
+        )
+        runs[shards] = (result, output_dir)
+
+    (serial, serial_dir), (sharded, sharded_dir) = runs[1], runs[3]
+    assert serial['frames_count'] > 2
+    assert sharded['timestamps'] == serial['timestamps']
+    for serial_file, sharded_file in zip(slide_files(serial_dir, serial), slide_files(sharded_dir, sharded)):
+        with open(serial_file, 'rb') as a, open(sharded_file, 'rb') as b:
+            assert a.read() == b.read(), sharded_file
+        # captured at full size, not at the analysis width
+        assert cv2.imread(sharded_file).shape == (HEIGHT, WIDTH, 3)
+
+
+
+def test_sharded_jobs_report_progress(slide_video, make_engine, monkeypatch, tmp_path):
+    video, _ = slide_video
+    monkeypatch.setattr(engine, 'MAX_SHARDS', 2)
+    monkeypatch.setattr(engine, 'SHARD_PROGRESS_SECONDS', 0.05)
+
+    progress = []
+    make_engine(video).process(VIDEO_URL, str(tmp_path / 'job'), interval_seconds=1, shards=2,
+                               progress_callback=progress.append)
+    assert len(progress) > 2
+    assert progress == sorted(progress)
+    # both shards count: the first alone only covers half the video
+    assert progress[-1] > 0.95
+
+
+def test_refine_pins_changes_down_to_its_precision(slide_video, make_engine, tmp_path):
+    video, changes = slide_video
+    result = make_engine(video).process(VIDEO_URL, str(tmp_path / 'job'), interval_seconds=5, sampling='refine')
+    # each slide but the last ends on its last frame before the change
+    ends = result['timestamps'][:-1]
+    assert len(ends) == len(changes)
+    for end, change in zip(ends, changes):
+        assert 0 < change - end <= 0.25 + 1 / FPS, (end, change)
+
+
+def test_job_without_slides_completes_without_a_pdf(slide_video, make_engine, monkeypatch, tmp_path):
+    video, _ = slide_video
+    def no_frames(*args, **kwargs):
+        # what ffmpeg failing to decode the video stream looks like
+        yield from ()
+
+    monkeypatch.setattr(engine, 'iter_video_frames', no_frames)
+
+    output_dir = str(tmp_path / 'job')
+    result = make_engine(video).process(VIDEO_URL, output_dir, interval_seconds=5)
+    assert result['frames_count'] == 0
+    assert not os.path.exists(os.path.join(output_dir, 'output.pdf'))
+    manifest = load_manifest(output_dir)
+    assert manifest['slides'] == []
+    assert manifest['pdf'] is None
@@ -0,0 +1,82 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+from job_store import JobStore, new_owner
+
+VIDEO_URL = 'https://youtu.be/resumetest1'
+
+# a worker that runs one checkpointed job slowly enough to be killed part-way
+WORKER = '''
+import shutil, sys, time
+from engine import Engine
+from job_store import JobStore, new_owner
+from transcripts import TranscriptStore
+
+video, static_folder, store_path, output_dir = sys.argv[1:]
+store = JobStore(store_path)
+store.add('job', {'video_path': %r}, owner=new_owner())
+store.set_state('job', 'running')
+engine = Engine(static_folder, downloader=lambda url, path: shutil.copyfile(video, path), checkpoint_seconds=0,
+                transcripts=TranscriptStore(static_folder + '/transcripts', fetcher=lambda video_id, language: []))
+engine.process(%r, output_dir, interval_seconds=1, progress_callback=lambda fraction: time.sleep(0.1),
+               checkpoint=store.checkpoint('job'))
+''' % (VIDEO_URL, VIDEO_URL)
+
+
+def test_killed_job_resumes_from_its_checkpoint(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    store_path = str(tmp_path / 'jobs.sqlite3')
+    output_dir = str(tmp_path / 'static' / 'job')
+    worker = subprocess.Popen([sys.executable, '-c', WORKER, video, str(tmp_path / 'static'), store_path, output_dir],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            assert worker.poll() is None, 'worker finished before it could be killed'
+            assert time.monotonic() < deadline
+            saved = os.path.exists(store_path) and JobStore(store_path).load_checkpoint('job')
+            if saved and saved[0]['timestamp'] >= 20:
+                break
+            time.sleep(0.1)
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+
+    store = JobStore(store_path)
+    claimed = store.claim_orphans(new_owner(), stale_after=3600)
+    assert [(job_id, attempts) for job_id, _, _, attempts in claimed] == [('job', 1)]
+    checkpoint = store.checkpoint('job')
+    killed_at = checkpoint.load()['timestamp']
+
+    progress = []
+    resumed = make_engine(video).process(VIDEO_URL, output_dir, interval_seconds=1,
+                                         progress_callback=progress.append, checkpoint=checkpoint)
+    # only the rest of the video was decoded again
+    assert min(progress) > killed_at / 60
+    uninterrupted = make_engine(video, 'uninterrupted').process(VIDEO_URL, str(tmp_path / 'uninterrupted' / 'job'),
+                                                                interval_seconds=1)
+    assert resumed['timestamps'] == uninterrupted['timestamps']
+    assert resumed['sampling']['frames'] == uninterrupted['sampling']['frames']
+    for i in range(1, uninterrupted['frames_count'] + 1):
+        with open(os.path.join(output_dir, f'frame_{i}.png'), 'rb') as a, \
+                open(tmp_path / 'uninterrupted' / 'job' / f'frame_{i}.png', 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_finished_jobs_drop_their_checkpoint_and_cannot_be_added_twice(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    store.add('job', {'video_path': VIDEO_URL}, owner=new_owner())
+    with pytest.raises(ValueError):
+        store.add('job', {'video_path': VIDEO_URL})
+    store.checkpoint('job').save({'timestamp': 5, 'frame': b'png'})
+    assert store.checkpoint('job').load() == {'timestamp': 5, 'frame': b'png'}
+
+    store.set_state('job', 'completed')
+    assert store.checkpoint('job').load() is None
+    assert store.get('job')['progress'] == 1
+    store.add('job', {'video_path': VIDEO_URL})
@@ -0,0 +1,118 @@
+import json
+
+import pytest
+
+from job_store import JobStore, new_owner
+from metrics import JobTrace, MetricsRegistry
+
+
+def finished_job(registry, seconds, slides):
+    trace = JobTrace('job')
+    trace.add('decode', seconds)
+    trace.count('slides_found', slides)
+    registry.record_job(trace, 'completed')
+
+
+def test_render_adds_up_other_processes(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    owners = [new_owner() for _ in range(3)]
+    registries = [MetricsRegistry() for _ in owners]
+    for i, (owner, registry) in enumerate(zip(owners, registries)):
+        finished_job(registry, 0.2 * (i + 1), slides=i + 1)
+        store.save_stats(owner, {'metrics': registry.to_state(), 'cache': {'hits': i}})
+
+    # what the first process renders once it has the others' saved totals
+    text = registries[0].render(store.other_stats(owners[0], 'metrics'))
+    assert 'video2slides_jobs_total{status="completed"} 3' in text
+    assert 'video2slides_slides_found_total 6' in text
+    assert 'video2slides_stage_seconds_count{stage="decode"} 3' in text
+    assert 'video2slides_stage_seconds_bucket{stage="decode",le="0.5"} 2' in text
+    assert sorted(stats['hits'] for stats in store.other_stats(owners[0], 'cache')) == [1, 2]
+
+
+def test_state_round_trips_through_json():
+    registry = MetricsRegistry()
+    finished_job(registry, 1.5, slides=4)
+    empty = MetricsRegistry()
+    assert empty.render([json.loads(json.dumps(registry.to_state()))]) == registry.render()
+
+
+def test_saved_stats_are_replaced_not_added(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'))
+    owner = new_owner()
+    store.save_stats(owner, {'cache': {'hits': 1}})
+    store.save_stats(owner, {'cache': {'hits': 5}})
+    assert store.other_stats(new_owner(), 'cache') == [{'hits': 5}]
+    assert store.other_stats(owner, 'cache') == []
+
+
+def samples(text):
+    """
+    {'name{labels}': value} of every sample in an exposition.
+    """
+    values = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+def test_process_records_every_stage(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    trace = JobTrace('job')
+    result = make_engine(video).process('https://youtu.be/tracetest01', str(tmp_path / 'job'), interval_seconds=5,
+                                        trace=trace, analysis_width=320)
+
+    data = trace.to_dict()
+    for stage in ('download', 'ffprobe', 'roi_detect', 'decode', 'compare', 'capture', 'image_write', 'pdf_build',
+                  'manifest', 'revisit_lookup', 'transcript_fetch', 'transcript_wait'):
+        assert stage in data['stages'], stage
+    assert data['stages']['decode'] > 0
+    assert data['counters']['frames_sampled'] == result['sampling']['frames']
+    assert data['counters']['slides_found'] == result['frames_count']
+    assert data['counters']['slides_revisited'] == result['revisits']
+
+    registry = MetricsRegistry()
+    registry.record_job(trace, 'completed')
+    text = registry.render()
+    assert f"video2slides_slides_found_total {result['frames_count']}" in text
+    assert 'video2slides_stage_seconds_count{stage="pdf_build"} 1' in text
+
+
+def test_metrics_endpoint_adds_up_every_process(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(server, 'job_store', JobStore(str(tmp_path / 'jobs.sqlite3')))
+    local = samples(server.metrics.render())
+
+    for i in range(2):
+        other = MetricsRegistry()
+        finished_job(other, 3.0, slides=5)
+        server.job_store.save_stats(new_owner(), {'metrics': other.to_state(), 'cache': {'hits': 2, 'misses': 1}})
+    # saved under this process's own owner, so not counted twice
+    trace = JobTrace('job')
+    trace.add('decode', 0.3)
+    trace.count('slides_found', 1)
+    server.record_job(trace, 'completed')
+
+    response = server.app.test_client().get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    combined = samples(response.get_data(as_text=True))
+
+    def added(name):
+        return combined[name] - local.get(name, 0)
+
+    assert added('video2slides_jobs_total{status="completed"}') == 3
+    assert added('video2slides_slides_found_total') == 11
+    assert added('video2slides_stage_seconds_count{stage="decode"}') == 3
+    assert added('video2slides_stage_seconds_sum{stage="decode"}') == pytest.approx(6.3)
+    assert added('video2slides_stage_seconds_bucket{stage="decode",le="0.5"}') == 1
+    assert added('video2slides_stage_seconds_bucket{stage="decode",le="5"}') == 3
+    assert added('video2slides_cache_hits_total') == 4
+    assert added('video2slides_cache_misses_total') == 2
+
+    # buckets are cumulative and the last one holds every observation
+    buckets = [value for name, value in combined.items()
+               if name.startswith('video2slides_stage_seconds_bucket{stage="decode",')]
+    assert buckets == sorted(buckets)
+    assert buckets[-1] == combined['video2slides_stage_seconds_count{stage="decode"}']
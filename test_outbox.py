@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from outbox import Outbox
+
+
+class StubEndpoint:
+    """
+    Local stand-in for the completion API. Answers each request with the
+    next of `statuses` (200 once they run out) after `delay` seconds, and
+    records the bodies it got and the client port each came from.
+    """
+
+    def __init__(self, statuses=(), delay=0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                time.sleep(stub.delay)
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                stub.requests.append((json.loads(body), self.client_address[1], status))
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'ok')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/confirm'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def delivered(self):
+        return [item for body, _, status in self.requests if status == 200 for item in body]
+
+
+@pytest.fixture
+def endpoint():
+    stubs = []
+
+    def make(*args, **kwargs):
+        stubs.append(StubEndpoint(*args, **kwargs))
+        return stubs[-1]
+
+    yield make
+    for stub in stubs:
+        stub.server.shutdown()
+        stub.server.server_close()
+
+
+def manual_outbox(tmp_path, url, **kwargs):
+    """
+    An outbox whose sender never starts, so the test sends with send_due().
+    """
+    return Outbox(str(tmp_path / 'outbox.sqlite3'), url, spawn=lambda target: None, base_delay=0.01, **kwargs)
+
+
+def send_until_idle(outbox, seconds=5):
+    deadline = time.monotonic() + seconds
+    while outbox.counts()['pending'] and time.monotonic() < deadline:
+        if not outbox.send_due():
+            time.sleep(0.02)
+
+
+def test_enqueue_does_not_wait_for_the_endpoint(tmp_path, endpoint):
+    stub = endpoint(delay=1)
+    outbox = Outbox(str(tmp_path / 'outbox.sqlite3'), stub.url)
+    started = time.monotonic()
+    outbox.enqueue([{'job': 1}])
+    assert time.monotonic() - started < 0.5
+
+    deadline = time.monotonic() + 10
+    while outbox.counts()['pending'] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stub.delivered() == [{'job': 1}]
+    assert outbox.stats['sent'] == 1
+
+
+def test_failures_are_retried_over_one_connection(tmp_path, endpoint):
+    stub = endpoint([503, 502])
+    outbox = manual_outbox(tmp_path, stub.url)
+    outbox.enqueue([{'job': 1}])
+    send_until_idle(outbox)
+
+    assert [status for _, _, status in stub.requests] == [503, 502, 200]
+    assert stub.delivered() == [{'job': 1}]
+    assert len({port for _, port, _ in stub.requests}) == 1
+    assert outbox.stats == {'sent': 1, 'requests': 3, 'failures': 2, 'dead': 0}
+
+
+def test_undeliverable_payloads_become_dead_letters(tmp_path, endpoint):
+    stub = endpoint([400, 500, 500])
+    outbox = manual_outbox(tmp_path, stub.url, max_attempts=2)
+    outbox.enqueue([{'job': 'rejected'}])
+    send_until_idle(outbox)
+    outbox.enqueue([{'job': 'flaky'}])
+    send_until_idle(outbox)
+
+    assert outbox.counts() == {'pending': 0, 'dead': 2}
+    letters = {letter['payload'][0]['job']: letter for letter in outbox.dead_letters()}
+    # a 400 won't change on retry, a 500 might
+    assert letters['rejected']['attempts'] == 1
+    assert letters['flaky']['attempts'] == 2
+    assert letters['flaky']['last_error'].startswith('500')
+    assert stub.delivered() == []
+
+
+def test_payloads_due_together_are_batched(tmp_path, endpoint):
+    stub = endpoint()
+    outbox = manual_outbox(tmp_path, stub.url, batch_size=10)
+    for job in range(3):
+        outbox.enqueue([{'job': job}])
+    assert outbox.send_due() == 3
+    assert len(stub.requests) == 1
+    assert stub.delivered() == [{'job': 0}, {'job': 1}, {'job': 2}]
+
+
+def test_pending_payloads_survive_a_restart(tmp_path, endpoint):
+    stub = endpoint()
+    manual_outbox(tmp_path, stub.url).enqueue([{'job': 1}])
+    assert stub.requests == []
+
+    restarted = manual_outbox(tmp_path, stub.url)
+    send_until_idle(restarted)
+    assert stub.delivered() == [{'job': 1}]
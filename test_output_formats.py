@@ -0,0 +1,114 @@
+"""
+Slide encodings: file types, max_dimension and quality, and the PDF built
+from them, in the engine and through /compile.
+"""
+import io
+import os
+import time
+
+import cv2
+import numpy as np
+import pikepdf
+import pytest
+
+from engine import OUTPUT_FORMATS, encode_slide
+
+VIDEO_URL = 'https://youtu.be/formattest1'
+
+# the PDF embeds JPEG pages for WebP slides, which img2pdf can't embed
+PDF_FILTERS = {'png': '/FlateDecode', 'jpeg': '/DCTDecode', 'webp': '/DCTDecode'}
+
+
+def file_type(data):
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def image_size(data):
+    height, width = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED).shape[:2]
+    return width, height
+
+
+def pdf_pages(data):
+    """
+    (width, height, filter) of the image on each page of a PDF.
+    """
+    pages = []
+    with pikepdf.Pdf.open(io.BytesIO(data)) as pdf:
+        for page in pdf.pages:
+            (image,) = page.images.values()
+            pages.append((int(image.Width), int(image.Height), str(image.Filter)))
+    return pages
+
+
+@pytest.mark.parametrize('output_format', list(OUTPUT_FORMATS))
+def test_slides_and_pdf_in_each_format(slide_video, make_engine, tmp_path, output_format):
+    video, changes = slide_video
+    output_dir = tmp_path / 'job'
+    result = make_engine(video).process(VIDEO_URL, str(output_dir), interval_seconds=2, output_format=output_format,
+                                        quality=60, max_dimension=320)
+    assert result['frames_count'] == len(changes) + 1
+
+    for i in range(1, result['frames_count'] + 1):
+        data = (output_dir / f'frame_{i}{OUTPUT_FORMATS[output_format]}').read_bytes()
+        assert file_type(data) == output_format
+        # 640x360 scaled to fit 320
+        assert image_size(data) == (320, 180)
+
+    assert pdf_pages((output_dir / 'output.pdf').read_bytes()) == \
+        [(320, 180, PDF_FILTERS[output_format])] * result['frames_count']
+
+
+@pytest.mark.parametrize('output_format', ['jpeg', 'webp'])
+def test_quality_sets_the_size(slide_video, output_format):
+    video, _ = slide_video
+    capture = cv2.VideoCapture(video)
+    ok, frame = capture.read()
+    capture.release()
+    assert ok
+
+    low, low_pdf = encode_slide(frame, output_format, quality=20)
+    high, high_pdf = encode_slide(frame, output_format, quality=95)
+    assert file_type(low) == file_type(high) == output_format
+    assert len(low) < len(high)
+    # the PDF's page follows the same quality
+    assert file_type(low_pdf) == 'jpeg'
+    assert len(low_pdf) < len(high_pdf)
+    # no scaling unless asked
+    assert image_size(high) == (frame.shape[1], frame.shape[0])
+
+
+def test_encoding_options_through_compile(server, slide_video, make_engine, monkeypatch):
+    video, changes = slide_video
+    monkeypatch.setattr(server, 'engine', make_engine(video))
+    client = server.app.test_client()
+    headers = {'X-Compile-Request-Header': server.X_COMPILE_REQUEST_HEADER}
+
+    for bad in ({'output_format': 'gif'}, {'quality': 0}, {'quality': 101}, {'max_dimension': -5}):
+        response = client.post('/compile', json={'video_path': VIDEO_URL, **bad}, headers=headers)
+        assert response.status_code == 400, bad
+
+    response = client.post('/compile', json={'video_path': VIDEO_URL, 'interval': 2, 'output_format': 'webp',
+                                             'quality': 40, 'max_dimension': 256}, headers=headers)
+    assert response.status_code == 200
+    job_id = response.get_json()['job_id']
+    deadline = time.monotonic() + 120
+    while (state := client.get(f'/jobs/{job_id}').get_json()['state']) in ('queued', 'running'):
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+    assert state == 'completed'
+
+    manifest = client.get(f'/jobs/{job_id}/manifest').get_json()
+    assert len(manifest['slides']) == len(changes) + 1
+    for slide in manifest['slides']:
+        data = client.get(slide['url']).get_data()
+        assert os.path.splitext(slide['file'])[1] == '.webp'
+        assert file_type(data) == 'webp'
+        assert image_size(data) == (256, 144)
+    assert pdf_pages(client.get(manifest['pdf']['url']).get_data()) == \
+        [(256, 144, '/DCTDecode')] * len(manifest['slides'])
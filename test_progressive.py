@@ -0,0 +1,67 @@
+"""
+Progressive jobs: slide_detected events over Socket.IO while the video is
+still being processed.
+"""
+import threading
+import time
+
+VIDEO_URL = 'https://youtu.be/progressive'
+
+
+def test_slides_stream_out_in_order_before_the_job_completes(server, slide_video, make_engine, monkeypatch):
+    video, changes = slide_video
+    monkeypatch.setattr(server, 'engine', make_engine(video))
+
+    # hold the job near the end of the video until the test has seen its first slides
+    release = threading.Event()
+    extract_frames_task = server.extract_frames_task
+
+    def held(*args, progress_callback=None, **kwargs):
+        def progress(fraction):
+            progress_callback(fraction)
+            if fraction > 0.9:
+                assert release.wait(60)
+        return extract_frames_task(*args, progress_callback=progress, **kwargs)
+
+    monkeypatch.setattr(server, 'extract_frames_task', held)
+    client = server.socketio.test_client(server.app)
+    try:
+        client.emit('compute_task', {'video_path': VIDEO_URL, 'interval': 1, 'progressive': True})
+        events = []
+
+        def received(name):
+            events.extend((event['name'], event['args'][0]) for event in client.get_received())
+            return [args for event, args in events if event == name]
+
+        deadline = time.monotonic() + 60
+        while len(received('slide_detected')) < 2:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert not received('processing_complete')
+        release.set()
+
+        while not received('processing_complete'):
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    finally:
+        release.set()
+        client.disconnect()
+
+    names = [name for name, _ in events]
+    assert names[0] == 'status'
+    assert names[-1] == 'processing_complete'
+    (complete,) = [args for name, args in events if name == 'processing_complete']
+    slides = [args for name, args in events if name == 'slide_detected']
+    assert complete['frames_count'] == len(changes) + 1
+    assert [slide['frame_index'] for slide in slides] == list(range(1, len(changes) + 2))
+    assert all(slide['video_id'] == complete['video_id'] for slide in slides)
+
+    timestamps = [slide['timestamp'] for slide in slides]
+    progress = [slide['progress'] for slide in slides]
+    assert timestamps == sorted(timestamps) and len(set(timestamps)) == len(timestamps)
+    assert progress == sorted(progress)
+    # the slides seen while the job was held went out before it got there
+    assert 0 < progress[0] < progress[1] <= 90
+    # each slide ends on the last frame sampled before a change
+    for timestamp, change in zip(timestamps, changes):
+        assert change - 1 <= timestamp < change
@@ -0,0 +1,43 @@
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from benchmark import HEIGHT, WIDTH
+from engine import ChangeDetector, detect_region, iter_video_frames
+from roi import cell_boxes
+
+
+def test_cell_boxes_cover_exactly_the_cells():
+    cells = np.zeros((4, 8), dtype=bool)
+    cells[1:3, 5:8] = True
+    cells[3, 5:7] = True
+    cells[0, 0] = True
+    boxes = cell_boxes(cells, 80, 40)
+    assert sorted(boxes) == [(0, 0, 10, 10), (50, 10, 30, 20), (50, 30, 20, 10)]
+
+    covered = np.zeros((40, 80), dtype=bool)
+    for x, y, width, height in boxes:
+        covered[y:y + height, x:x + width] = True
+    assert (covered == cv2.resize(cells.astype(np.uint8), (80, 40), interpolation=cv2.INTER_NEAREST).astype(bool)).all()
+
+
+def test_webcam_is_left_out_but_the_slide_beside_it_is_compared(webcam_video):
+    video, _ = webcam_video
+    region, ignored = detect_region(video, WIDTH, HEIGHT, 'auto')
+    assert region is None
+    # the webcam sits in the bottom right corner, under the slide's right side
+    assert all(x >= WIDTH / 2 and y >= HEIGHT / 3 for x, y, _, _ in ignored)
+
+    first, second = (frame for _, frame in islice(iter_video_frames(video, 1, WIDTH, HEIGHT), 2))
+    detector = ChangeDetector(0.95, ignored=ignored)
+    # only the webcam moved
+    assert not detector.is_boundary(first, second)
+
+    # new lines of text above the webcam, right of where a single static
+    # rectangle would end
+    changed = second.copy()
+    for line in range(4):
+        cv2.putText(changed, 'new point here', (390, 40 + 24 * line), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (20, 20, 20), 2)
+    assert detector.is_boundary(second, changed)
+    assert not ChangeDetector(0.95, region=(0, 0, 360, 360)).is_boundary(second, changed)
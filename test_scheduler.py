@@ -0,0 +1,146 @@
+"""
+The bounded job queue behind /compile and compute_task, with a stub task
+in place of the pipeline.
+"""
+import threading
+import time
+
+import pytest
+
+from scheduler import JobScheduler, QueueFull
+
+VIDEO_URL = 'https://youtu.be/queuetest01'
+
+
+class BlockingTask:
+    """
+    Stand-in task that records which jobs ran, in order, and holds each
+    one until `release` is set.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+        self.running = threading.Semaphore(0)
+
+    def __call__(self, job_id, progress=None, fail=False):
+        self.started.append(job_id)
+        self.running.release()
+        if progress:
+            progress(0.5)
+        assert self.release.wait(10)
+        if fail:
+            raise RuntimeError('stub failure')
+
+    def wait_started(self, count=1):
+        for _ in range(count):
+            assert self.running.acquire(timeout=10)
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def task():
+    task = BlockingTask()
+    yield task
+    task.release.set()
+
+
+def test_full_queue_rejects_jobs(task):
+    scheduler = JobScheduler(workers=1, max_queue=2)
+    scheduler.submit('running', task, 'running')
+    task.wait_started()
+    scheduler.submit('a', task, 'a')
+    scheduler.submit('b', task, 'b')
+    assert scheduler.queue_depth() == 2
+    assert scheduler.active_workers() == 1
+
+    with pytest.raises(QueueFull):
+        scheduler.submit('c', task, 'c')
+    assert scheduler.get('c') is None
+    # jobs accepted earlier (resumed ones) still go in
+    scheduler.submit('resumed', task, 'resumed', ignore_limit=True)
+    assert scheduler.queue_depth() == 3
+
+
+def test_higher_priority_runs_first_and_fifo_within_a_priority(task):
+    scheduler = JobScheduler(workers=1, max_queue=10)
+    scheduler.submit('running', task, 'running')
+    task.wait_started()
+    for job_id, priority in (('low', 0), ('high', 5), ('low2', 0), ('high2', 5)):
+        scheduler.submit(job_id, task, job_id, priority=priority)
+
+    assert [scheduler.queue_position(job_id) for job_id in ('high', 'high2', 'low', 'low2')] == [1, 2, 3, 4]
+    assert scheduler.queue_position('running') is None
+    assert scheduler.status('low')['queue_position'] == 3
+    assert scheduler.status('running')['queue_position'] is None
+
+    task.release.set()
+    wait_until(lambda: len(task.started) == 5 and scheduler.active_workers() == 0)
+    assert task.started == ['running', 'high', 'high2', 'low', 'low2']
+
+
+def test_status_tracks_progress_and_failures(task):
+    scheduler = JobScheduler(workers=1, max_queue=2)
+    scheduler.submit('job', task, 'job', progress_kwarg='progress', fail=True)
+    task.wait_started()
+    assert scheduler.status('job')['state'] == 'running'
+    assert scheduler.status('job')['progress'] == 0.5
+    with pytest.raises(ValueError):
+        scheduler.submit('job', task, 'job')
+
+    task.release.set()
+    wait_until(lambda: scheduler.status('job')['state'] != 'running')
+    status = scheduler.status('job')
+    assert status['state'] == 'failed'
+    assert status['error'] == 'stub failure'
+    assert status['timings']['run_seconds'] is not None
+    assert scheduler.status('unknown') is None
+
+
+@pytest.fixture
+def small_queue(server, task, monkeypatch):
+    """
+    The app with one worker and room for one queued job, running `task`
+    instead of the pipeline.
+    """
+    monkeypatch.setattr(server, 'scheduler', JobScheduler(workers=1, max_queue=1))
+    monkeypatch.setattr(server, 'extract_frames_task', lambda video_path, job_id=None, **kwargs: task(job_id))
+    return server
+
+
+def test_compile_answers_429_when_the_queue_is_full(small_queue, task):
+    client = small_queue.app.test_client()
+    headers = {'X-Compile-Request-Header': small_queue.X_COMPILE_REQUEST_HEADER}
+
+    running = client.post('/compile', json={'video_path': VIDEO_URL}, headers=headers)
+    assert running.status_code == 200
+    task.wait_started()
+    queued = client.post('/compile', json={'video_path': VIDEO_URL}, headers=headers)
+    assert queued.status_code == 200
+    assert queued.get_json()['queue_position'] == 1
+
+    rejected = client.post('/compile', json={'video_path': VIDEO_URL}, headers=headers)
+    assert rejected.status_code == 429
+    assert 'error' in rejected.get_json()
+
+    assert client.get(f"/jobs/{queued.get_json()['job_id']}").get_json()['state'] == 'queued'
+
+
+def test_compute_task_reports_a_full_queue(small_queue, task):
+    client = small_queue.socketio.test_client(small_queue.app)
+    client.emit('compute_task', {'video_path': VIDEO_URL})
+    task.wait_started()
+    client.emit('compute_task', {'video_path': VIDEO_URL})
+    client.emit('compute_task', {'video_path': VIDEO_URL})
+
+    events = [(event['name'], event['args'][0]) for event in client.get_received()]
+    assert [name for name, _ in events] == ['status', 'status', 'processing_error']
+    assert events[1][1]['queue_position'] == 1
+    assert events[2][1]['message'] == 'Too many jobs queued, try again later'
+    client.disconnect()
@@ -0,0 +1,80 @@
+"""
+Several server processes sharing one static folder, as in the gunicorn
+serving mode: pins taken by one keep another's eviction away from a path,
+and a result one process computed is a cache hit for the others.
+"""
+import multiprocessing
+import os
+import shutil
+
+from result_cache import ResultCache
+
+VIDEO_URL = 'https://youtu.be/sharedtest1'
+
+
+def hold_pin(static_folder, path, pinned, release):
+    with ResultCache(static_folder).pin(path):
+        pinned.set()
+        release.wait(30)
+
+
+def process_once(video, static_folder, output_dir):
+    from engine import Engine
+    from transcripts import TranscriptStore
+
+    engine = Engine(static_folder, downloader=lambda url, path: shutil.copyfile(video, path),
+                    transcripts=TranscriptStore(os.path.join(static_folder, 'transcripts'),
+                                                fetcher=lambda video_id, language: []))
+    engine.process(VIDEO_URL, output_dir, interval_seconds=5)
+
+
+def write_file(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+
+
+def test_pins_hold_across_processes(tmp_path):
+    static = str(tmp_path / 'static')
+    pinned_video = os.path.join(static, 'videos', 'pinned.mp4')
+    other_video = os.path.join(static, 'videos', 'other.mp4')
+    write_file(pinned_video, 1000)
+    write_file(other_video, 1000)
+    # the pinned video is the least recently used
+    os.utime(pinned_video, (1, 1))
+
+    spawn = multiprocessing.get_context('spawn')
+    pinned, release = spawn.Event(), spawn.Event()
+    holder = spawn.Process(target=hold_pin, args=(static, pinned_video, pinned, release))
+    holder.start()
+    try:
+        assert pinned.wait(30)
+        cache = ResultCache(static, budget_bytes=500)
+        cache.enforce_budget()
+        assert os.path.exists(pinned_video)
+        assert not os.path.exists(other_video)
+    finally:
+        release.set()
+        holder.join(30)
+
+    cache.enforce_budget()
+    assert not os.path.exists(pinned_video)
+    assert os.listdir(os.path.join(static, '.pins')) == []
+
+
+def test_result_from_another_process_is_a_cache_hit(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    spawn = multiprocessing.get_context('spawn')
+    worker = spawn.Process(target=process_once, args=(video, str(tmp_path / 'static'), str(tmp_path / 'static' / 'a')))
+    worker.start()
+    worker.join(120)
+    assert worker.exitcode == 0
+
+    def no_download(url, path):
+        raise AssertionError('the video should not be needed again')
+
+    engine = make_engine(video, downloader=no_download)
+    result = engine.process(VIDEO_URL, str(tmp_path / 'static' / 'b'), interval_seconds=5)
+    assert engine.result_cache.stats['hits'] == 1
+    assert sorted(os.listdir(tmp_path / 'static' / 'b')) == sorted(os.listdir(tmp_path / 'static' / 'a'))
+    assert result['frames_count'] > 0
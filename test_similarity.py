@@ -0,0 +1,101 @@
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity
+
+from benchmark import HEIGHT, WIDTH
+from engine import ChangeDetector, iter_video_frames
+from similarity import (BOUND_SLACK, SKIMAGE_TOLERANCE, FrameStats, Mask, ssim, ssim_batch, ssim_lower_bound,
+                        ssim_upper_bound)
+
+
+def decoded_frames(video, interval=1, width=WIDTH, height=HEIGHT):
+    return [frame for _, frame in iter_video_frames(video, interval, width, height)]
+
+
+def test_ssim_matches_skimage(lecture_video):
+    frames = decoded_frames(lecture_video, interval=5)
+    for a, b in zip(frames, frames[1:]):
+        gray_a, gray_b = (cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) for frame in (a, b))
+        assert abs(ssim(FrameStats(a), FrameStats(b)) - structural_similarity(gray_a, gray_b)) < 1e-9
+
+
+def test_lower_bound_never_exceeds_ssim(lecture_video, slide_video):
+    rng = np.random.default_rng(0)
+    frames = decoded_frames(lecture_video) + decoded_frames(slide_video[0], interval=5)
+    # pairs across slides, and a dark, noisy one
+    pairs = list(zip(frames, frames[1:])) + [(frames[0], frames[-1])]
+    dark = rng.integers(0, 40, (HEIGHT, WIDTH), dtype=np.uint8)
+    pairs.append((dark, cv2.add(dark, rng.integers(0, 8, (HEIGHT, WIDTH), dtype=np.uint8))))
+
+    gaps = []
+    for a, b in pairs:
+        stats_a, stats_b = FrameStats(a), FrameStats(b)
+        gaps.append(ssim(stats_a, stats_b) - ssim_lower_bound(stats_a, stats_b))
+    assert min(gaps) >= -BOUND_SLACK
+    # loose enough to matter only on real differences
+    assert np.median(gaps) < 0.05
+
+
+def test_upper_bound_never_below_ssim(lecture_video, slide_video):
+    rng = np.random.default_rng(0)
+    frames = decoded_frames(lecture_video) + decoded_frames(slide_video[0], interval=5)
+    pairs = list(zip(frames, frames[1:])) + [(frames[0], frames[-1])]
+    dark = rng.integers(0, 40, (HEIGHT, WIDTH), dtype=np.uint8)
+    pairs.append((dark, cv2.add(dark, rng.integers(0, 8, (HEIGHT, WIDTH), dtype=np.uint8))))
+    pairs.append((np.zeros((HEIGHT, WIDTH), np.uint8), np.full((HEIGHT, WIDTH), 255, np.uint8)))
+
+    keep = np.ones((HEIGHT, WIDTH), dtype=bool)
+    keep[HEIGHT // 2:, :WIDTH // 3] = False
+    for mask in (None, Mask(keep)):
+        for a, b in pairs:
+            stats_a, stats_b = FrameStats(a, mask), FrameStats(b, mask)
+            assert ssim_upper_bound(stats_a, stats_b) >= ssim(stats_a, stats_b) - BOUND_SLACK
+
+
+def test_different_slides_never_reach_full_ssim(slide_video):
+    video, changes = slide_video
+    frames = dict(iter_video_frames(video, 1, WIDTH, HEIGHT))
+    # the last frame of each slide against the first of the next
+    pairs = []
+    for change in changes:
+        before = max(t for t in frames if t < change)
+        after = min(t for t in frames if t > change)
+        pairs.append((frames[after], frames[before]))
+
+    detector = ChangeDetector(0.95)
+    assert all(detector.is_boundary(a, b) for a, b in pairs)
+    assert detector.stats['upper_bound'] == len(pairs)
+    assert detector.stats['ssim'] == 0
+
+
+def test_cascade_decides_like_ssim_alone(lecture_video, slide_video):
+    frames = decoded_frames(lecture_video) + decoded_frames(slide_video[0])
+    for threshold in (0.5, 0.75, 0.9, 0.95, 0.99):
+        cascade = ChangeDetector(threshold)
+        plain = ChangeDetector(threshold, stages=[])
+        for a, b in zip(frames, frames[1:]):
+            assert cascade.is_boundary(a, b) == plain.is_boundary(a, b)
+        # the cheap stages took most of the work
+        assert cascade.stats['ssim'] < plain.stats['ssim'] / 2, threshold
+
+
+def test_batch_matches_ssim_per_pair(lecture_video, slide_video):
+    frames = decoded_frames(lecture_video, interval=5) + decoded_frames(slide_video[0], interval=5)
+    keep = np.ones((HEIGHT, WIDTH), dtype=bool)
+    keep[:HEIGHT // 3, WIDTH // 2:] = False
+    for mask in (None, Mask(keep)):
+        pairs = [(FrameStats(a, mask), FrameStats(b, mask)) for a, b in zip(frames, frames[1:])]
+        batched = ssim_batch(pairs)
+        assert len(batched) == len(pairs)
+        for (a, b), score in zip(pairs, batched):
+            assert abs(score - ssim(a, b)) < SKIMAGE_TOLERANCE
+    assert len(ssim_batch([])) == 0
+
+
+def test_detector_decides_pairs_together_like_one_by_one(lecture_video, slide_video):
+    frames = decoded_frames(lecture_video) + decoded_frames(slide_video[0])
+    pairs = list(zip(frames, frames[1:]))
+    together = ChangeDetector(0.95, ignored=[(0, 0, WIDTH // 4, HEIGHT // 4)])
+    one_by_one = ChangeDetector(0.95, ignored=[(0, 0, WIDTH // 4, HEIGHT // 4)])
+    assert together.boundaries(pairs) == [one_by_one.is_boundary(a, b) for a, b in pairs]
+    assert together.stats == one_by_one.stats
@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import SingleFlight
+
+VIDEO_URL = 'https://youtu.be/flighttest1'
+
+
+class CountingDownload:
+    """
+    Stand-in downloader that copies `source` slowly enough for other jobs
+    to arrive while it runs, counting how often it was called. With
+    `fail`, it writes half the file and raises instead.
+    """
+
+    def __init__(self, source, seconds=1, fail=False):
+        self.source = source
+        self.seconds = seconds
+        self.fail = fail
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, video_path, output_path):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.seconds)
+        if self.fail:
+            with open(self.source, 'rb') as src, open(output_path, 'wb') as dst:
+                dst.write(src.read()[:os.path.getsize(self.source) // 2])
+            raise RuntimeError('connection reset')
+        shutil.copyfile(self.source, output_path)
+
+
+def test_concurrent_calls_share_one_run():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def work():
+        calls.append(1)
+        release.wait()
+        return 'slides'
+
+    with ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(flight.do, 'key', work) for _ in range(4)]
+        while not flight.in_flight('key'):
+            time.sleep(0.01)
+        time.sleep(0.2)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {result for result, _ in results} == {'slides'}
+    assert not flight.in_flight('key')
+
+
+def test_waiting_callers_get_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+
+    def work():
+        release.wait()
+        raise ValueError('bad video')
+
+    with ThreadPoolExecutor(2) as pool:
+        futures = [pool.submit(flight.do, 'key', work) for _ in range(2)]
+        time.sleep(0.2)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    # the next call runs again
+    assert flight.do('key', lambda: 'retried') == ('retried', False)
+
+
+def test_concurrent_jobs_download_a_video_once(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    downloader = CountingDownload(video)
+    engine = make_engine(video, downloader=downloader)
+
+    def job(name, interval):
+        return engine.process(VIDEO_URL, str(tmp_path / name), interval_seconds=interval)
+
+    # different intervals, so each job runs its own analysis of the same video
+    with ThreadPoolExecutor(3) as pool:
+        results = list(pool.map(job, ['first', 'second', 'third'], [5, 4, 2]))
+
+    assert downloader.calls == 1
+    assert all(result['frames_count'] for result in results)
+    for name in ('first', 'second', 'third'):
+        assert os.path.exists(tmp_path / name / 'output.pdf')
+    # only the finished video is left in the videos dir
+    assert os.listdir(tmp_path / 'static' / 'videos') == ['flighttest1.mp4']
+
+
+def test_failed_download_is_not_cached(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    engine = make_engine(video, downloader=CountingDownload(video, seconds=0, fail=True))
+    video_full_path = str(tmp_path / 'static' / 'videos' / 'flighttest1.mp4')
+
+    with pytest.raises(RuntimeError):
+        engine.download(VIDEO_URL, video_full_path)
+    assert os.listdir(tmp_path / 'static' / 'videos') == []
+
+    engine.downloader = CountingDownload(video, seconds=0)
+    assert engine.download(VIDEO_URL, video_full_path)
+    assert engine.downloader.calls == 1
+    assert os.path.getsize(video_full_path) == os.path.getsize(video)
+
+
+def test_concurrent_jobs_with_the_same_settings_share_one_analysis(slide_video, make_engine, tmp_path):
+    video, _ = slide_video
+    engine = make_engine(video, downloader=CountingDownload(video))
+    compute = engine.compute
+    computed = []
+    engine.compute = lambda *args, **kwargs: computed.append(1) or compute(*args, **kwargs)
+
+    with ThreadPoolExecutor(2) as pool:
+        results = list(pool.map(lambda name: engine.process(VIDEO_URL, str(tmp_path / name), interval_seconds=5),
+                                ['first', 'second']))
+
+    assert len(computed) == 1
+    assert results[0]['timestamps'] == results[1]['timestamps']
+    assert sorted(os.listdir(tmp_path / 'first')) == sorted(os.listdir(tmp_path / 'second'))
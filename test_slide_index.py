@@ -0,0 +1,152 @@
+"""
+Slides shown again later: index lookups, collapsing them in a job, and
+resuming a job killed after a revisit.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+import pikepdf
+
+from job_store import JobStore, new_owner
+from similarity import FrameStats
+from slide_index import MAX_DISTANCE, SlideIndex, hamming_distance, perceptual_hash
+
+VIDEO_URL = 'https://youtu.be/revisittest'
+
+# like test_job_store's worker, for the revisit video
+WORKER = '''
+import shutil, sys, time
+from engine import Engine
+from job_store import JobStore, new_owner
+from transcripts import TranscriptStore
+
+video, static_folder, store_path, output_dir = sys.argv[1:]
+store = JobStore(store_path)
+store.add('job', {'video_path': %r}, owner=new_owner())
+store.set_state('job', 'running')
+engine = Engine(static_folder, downloader=lambda url, path: shutil.copyfile(video, path), checkpoint_seconds=0,
+                transcripts=TranscriptStore(static_folder + '/transcripts', fetcher=lambda video_id, language: []))
+engine.process(%r, output_dir, interval_seconds=1, progress_callback=lambda fraction: time.sleep(0.1),
+               checkpoint=store.checkpoint('job'))
+''' % (VIDEO_URL, VIDEO_URL)
+
+
+def stats(image):
+    return FrameStats(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+
+
+def noisy(image, seed):
+    rng = np.random.default_rng(seed)
+    return np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+
+
+def test_near_duplicate_beyond_max_distance_is_a_new_slide(revisit_slides):
+    a, _, c = revisit_slides
+    distance = hamming_distance(perceptual_hash(stats(a).gray), perceptual_hash(stats(c).gray))
+    assert distance > MAX_DISTANCE
+
+    # a threshold any layout-sharing slide passes, so only the hash keeps them apart
+    index = SlideIndex(0.5)
+    index.add(index.lookup(stats(a))[1])
+    assert index.lookup(stats(c))[0] is None
+    assert index.stats['candidates'] == 0
+    assert index.lookup(stats(noisy(a, 1)))[0] == 0
+
+    wider = SlideIndex(0.5, max_distance=distance)
+    wider.add(wider.lookup(stats(a))[1])
+    assert wider.lookup(stats(c))[0] == 0
+
+
+def test_index_survives_a_checkpoint_round_trip(revisit_slides):
+    a, b, c = revisit_slides
+    index = SlideIndex(0.95)
+    for slide in (a, b):
+        index.add(index.lookup(stats(slide))[1])
+
+    # checkpoints are stored as JSON
+    restored = SlideIndex.from_state(json.loads(json.dumps(index.to_state())), 0.95)
+    assert len(restored) == 2
+    assert restored.hashes == index.hashes
+    for kept, thumbnail in zip(index.thumbnails, restored.thumbnails):
+        assert np.array_equal(kept, thumbnail)
+    assert [restored.lookup(stats(noisy(slide, 2)))[0] for slide in (a, b, c)] == [0, 1, None]
+
+
+def test_revisited_slides_are_kept_once(revisit_video, make_engine, tmp_path):
+    video, changes = revisit_video
+    output_dir = str(tmp_path / 'static' / 'job')
+    revisits = []
+    result = make_engine(video).process(VIDEO_URL, output_dir, interval_seconds=1,
+                                        on_revisit=lambda *args: revisits.append(args))
+
+    # a, b, a, c, a
+    assert result['run_slides'] == [1, 2, 1, 3, 1]
+    assert result['frames_count'] == 3
+    assert result['revisits'] == 2
+    assert [end + 1 for end in result['timestamps'][:-1]] == changes
+    assert result['appearances'][0] == [[0, 11.0], [23.0, 35.0], [47.0, 59.0]]
+    assert [(slide, timestamp) for slide, timestamp, _ in revisits] == [(1, 35.0), (1, 59.0)]
+    assert result['index_stats']['lookups'] == 5
+    assert result['index_stats']['matches'] == 2
+
+    assert sorted(name for name in os.listdir(output_dir) if name.startswith('frame_')) == \
+        ['frame_1.png', 'frame_2.png', 'frame_3.png']
+    with pikepdf.Pdf.open(os.path.join(output_dir, 'output.pdf')) as pdf:
+        assert len(pdf.pages) == 3
+    with open(os.path.join(output_dir, 'manifest.json'), encoding='utf-8') as f:
+        assert json.load(f)['slides'][0]['appearances'] == result['appearances'][0]
+
+    every_run = make_engine(video, 'every_run').process(VIDEO_URL, str(tmp_path / 'every_run' / 'job'),
+                                                        interval_seconds=1, collapse_revisits=False)
+    assert every_run['run_slides'] == [1, 2, 3, 4, 5]
+
+
+def test_job_killed_after_a_revisit_resumes_with_its_index(revisit_video, make_engine, tmp_path):
+    video, _ = revisit_video
+    store_path = str(tmp_path / 'jobs.sqlite3')
+    output_dir = str(tmp_path / 'static' / 'job')
+    worker = subprocess.Popen([sys.executable, '-c', WORKER, video, str(tmp_path / 'static'), store_path, output_dir],
+                              cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            assert worker.poll() is None, 'worker finished before it could be killed'
+            assert time.monotonic() < deadline
+            saved = os.path.exists(store_path) and JobStore(store_path).load_checkpoint('job')
+            if saved and [slide for _, slide in saved[0]['runs']] == [1, 2, 1]:
+                break
+            time.sleep(0.05)
+    finally:
+        worker.send_signal(signal.SIGKILL)
+        worker.wait()
+
+    store = JobStore(store_path)
+    store.claim_orphans(new_owner(), stale_after=3600)
+    checkpoint = store.checkpoint('job')
+    saved = checkpoint.load()
+    assert len(saved['index']) == 2
+    assert saved['index_stats']['matches'] == 1
+
+    progress = []
+    resumed = make_engine(video).process(VIDEO_URL, output_dir, interval_seconds=1,
+                                         progress_callback=progress.append, checkpoint=checkpoint)
+    assert min(progress) > saved['timestamp'] / 60
+    # c is still a new slide and the last run still goes back to a
+    assert resumed['run_slides'] == [1, 2, 1, 3, 1]
+    assert resumed['index_stats']['lookups'] == 5
+    assert resumed['index_stats']['matches'] == 2
+    assert sorted(name for name in os.listdir(output_dir) if name.startswith('frame_')) == \
+        ['frame_1.png', 'frame_2.png', 'frame_3.png']
+    with pikepdf.Pdf.open(os.path.join(output_dir, 'output.pdf')) as pdf:
+        assert len(pdf.pages) == 3
+
+    uninterrupted = make_engine(video, 'uninterrupted').process(VIDEO_URL, str(tmp_path / 'uninterrupted' / 'job'),
+                                                                interval_seconds=1)
+    assert resumed['timestamps'] == uninterrupted['timestamps']
+    assert resumed['appearances'] == uninterrupted['appearances']
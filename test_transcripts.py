@@ -0,0 +1,40 @@
+from transcripts import group_subtitles, slide_appearances
+
+
+def cue(start, text):
+    return {'start': start, 'duration': 2.0, 'text': text}
+
+
+def subtitles(groups):
+    return [group['subtitles'] for group in groups]
+
+
+def test_cue_on_a_boundary_goes_to_the_run_it_starts():
+    # runs [0, 10), [10, 20), [20, 30)
+    groups = group_subtitles([10, 20, 30], [cue(10, 'second'), cue(9.99, 'first'), cue(20, 'third')])
+    assert subtitles(groups) == [['first'], ['second'], ['third']]
+
+
+def test_cue_before_the_first_timestamp_goes_to_the_first_slide():
+    groups = group_subtitles([10, 20], [cue(0, 'start'), cue(-1, 'lead-in'), cue(5, 'middle')])
+    assert subtitles(groups) == [['lead-in', 'start', 'middle'], []]
+
+
+def test_cue_after_the_last_slide_goes_to_the_last_run():
+    # the last run shows slide 1 again, which collects the trailing cues too
+    groups = group_subtitles([10, 20, 30], [cue(30, 'at the end'), cue(95, 'outro'), cue(15, 'two')],
+                             run_slides=[1, 2, 1])
+    assert subtitles(groups) == [['at the end', 'outro'], ['two']]
+    assert groups[0]['appearances'] == [[0, 10], [20, 30]]
+
+
+def test_no_timestamps_means_no_groups():
+    assert group_subtitles([], [cue(1, 'orphan')]) == []
+    assert slide_appearances([]) == []
+
+
+def test_revisited_slide_gets_the_cues_of_all_its_runs_in_order():
+    groups = group_subtitles([10, 20, 30, 40], [cue(35, 'd'), cue(5, 'a'), cue(25, 'c'), cue(15, 'b')],
+                             run_slides=[1, 2, 1, 3])
+    assert subtitles(groups) == [['a', 'c'], ['b'], ['d']]
+    assert [group['timestamp'] for group in groups] == [0, 10, 30]
@@ -0,0 +1,111 @@
+import json
+import os
+import uuid
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from youtube_transcript_api import NoTranscriptFound, TranscriptsDisabled, YouTubeTranscriptApi
+
+
+def fetch_youtube_transcript(video_id, language):
+    """
+    Fetch a transcript from YouTube as a list of {start, duration, text} cues.
+
+    A video with captions turned off, or none in `language`, has an empty
+    transcript rather than a failed one, so it gets cached like any other.
+    Other errors (network, YouTube failing) are raised.
+    """
+    ytt_api = YouTubeTranscriptApi()
+    try:
+        fetched_transcript = ytt_api.fetch(video_id, languages=[language])
+    except (TranscriptsDisabled, NoTranscriptFound) as e:
+        print(f"No {language} transcript for {video_id}: {type(e).__name__}")
+        return []
+    return [
+        {'start': snippet.start, 'duration': snippet.duration, 'text': snippet.text}
+        for snippet in fetched_transcript
+    ]
+
+
+class TranscriptStore:
+    """
+    Fetches transcripts in the background and keeps them on disk per video
+    id and language.
+
+    `fetcher(video_id, language)` returns a list of cue dicts; swap it for a
+    local stand-in to run without YouTube. Failed fetches are not cached, so
+    a transient error doesn't stick.
+    """
+
+    def __init__(self, cache_dir, fetcher=None, workers=4):
+        self.cache_dir = cache_dir
+        self.fetcher = fetcher or fetch_youtube_transcript
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='transcripts')
+
+    def _path(self, video_id, language):
+        return os.path.join(self.cache_dir, f'{video_id}.{language}.json')
+
+    def get(self, video_id, language='en'):
+        path = self._path(video_id, language)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+
+        cues = self.fetcher(video_id, language)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(cues, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return cues
+
+    def prefetch(self, video_id, language='en'):
+        """
+        Start fetching in the background; call `.result()` on the returned
+        future when the cues are needed.
+        """
+        return self._pool.submit(self.get, video_id, language)
+
+
+def slide_appearances(slide_timestamps, run_slides=None):
+    """
+    The [start, end] ranges each slide was on screen, one list per slide.
+
+    Run `i` covers [slide_timestamps[i - 1], slide_timestamps[i]) with the
+    first run starting at 0, and shows the 1-based slide `run_slides[i]`
+    (by default every run is a new slide). Slides are numbered in order of
+    first appearance.
+    """
+    if run_slides is None:
+        run_slides = range(1, len(slide_timestamps) + 1)
+    starts = [0] + list(slide_timestamps[:-1])
+    appearances = []
+    for start, end, slide in zip(starts, slide_timestamps, run_slides):
+        if slide > len(appearances):
+            appearances.append([])
+        appearances[slide - 1].append([start, end])
+    return appearances
+
+
+def group_subtitles(slide_timestamps, cues, run_slides=None):
+    """
+    Assign each cue to the slide that was on screen when it started.
+
+    Runs and slides are as in `slide_appearances`; cues starting after the
+    last timestamp belong to the last run. A slide shown more than once
+    gets the cues of all its runs, in order, and lists its `appearances`.
+    One bisect per cue, so O(cues * log runs).
+    """
+    if run_slides is None:
+        run_slides = list(range(1, len(slide_timestamps) + 1))
+    groups = [
+        {"frame_index": idx + 1, "timestamp": ranges[0][0], "appearances": ranges, "subtitles": []}
+        for idx, ranges in enumerate(slide_appearances(slide_timestamps, run_slides))
+    ]
+    if not groups:
+        return groups
+
+    for cue in sorted(cues, key=lambda c: c['start']):
+        run = min(bisect_right(slide_timestamps, cue['start']), len(run_slides) - 1)
+        groups[run_slides[run] - 1]['subtitles'].append(cue['text'])
+    return groups